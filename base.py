@@ -22,13 +22,17 @@ from itertools import chain
 from pathlib import Path
 from threading import Thread
 import netaddr
+import subprocess
 import sys
 import time
-import datetime
+from channel import CommandChannel, CommandStats, command_name, timed
+from contention import CLOCK_TICKS
+from observer import accounted_argv, can_nsenter, nsenter_argv, split_accounted
+from phases import tracer
 from jinja2 import Environment, FileSystemLoader, PackageLoader, StrictUndefined, make_logging_undefined
 
 
-# Resource files (filters/, nos_templates/, bird.tfsm) live next to the source,
+# Resource files (filters/, nos_templates/) live next to the source,
 # so anchor them to the source directory rather than the working directory.
 # Without this, bgperf2 can only be run from the repo root.
 REPO_ROOT = Path(__file__).resolve().parent
@@ -325,6 +329,8 @@ class Container(object):
         self.conf = conf
         self.config_name = None
         self.stop_monitoring = False
+        # latency of every local() command, by program and by exec or channel
+        self.command_stats = CommandStats()
         # Interface carrying this container's benchmark addresses; filled in by
         # run() once Docker has attached the networks.
         self.dev = 'eth0'
@@ -434,9 +440,10 @@ class Container(object):
 
         host_config = self.get_host_config()
 
-        ctn = dckr.create_container(image=self.image, command=self.command, environment=self.environment,
-                                    detach=True, name=self.name,
-                                    stdin_open=True, volumes=self.volumes, host_config=host_config)
+        with tracer.span('create', cat='container', container=self.name):
+            ctn = dckr.create_container(image=self.image, command=self.command, environment=self.environment,
+                                        detach=True, name=self.name,
+                                        stdin_open=True, volumes=self.volumes, host_config=host_config)
         self.ctn_id = ctn['Id']
 
         ipv4_addresses = self.get_ipv4_addresses()
@@ -479,8 +486,9 @@ class Container(object):
             print('Docker network "{}" not found!'.format(dckr_net_name))
             return
 
-        dckr.connect_container_to_network(self.ctn_id, net_id, ipv4_address=ipv4_addresses[0])
-        dckr.start(container=self.name)
+        with tracer.span('start', cat='container', container=self.name):
+            dckr.connect_container_to_network(self.ctn_id, net_id, ipv4_address=ipv4_addresses[0])
+            dckr.start(container=self.name)
 
         # Containers end up on two networks: the default bridge that Docker
         # attaches at creation, plus the benchmark network connected above.
@@ -530,29 +538,113 @@ class Container(object):
                 if system_delta > 0.0 and cpu_delta > 0.0:
                     cpu_percentage = (cpu_delta / system_delta) * float(cpu_num) * 100.0
                 mem_usage = stat['memory_stats'].get('usage', 0)
-                queue.put({'who': self.name, 'cpu': cpu_percentage, 'mem': mem_usage, 'time': datetime.datetime.now()})
+                queue.put({'who': self.name, 'cpu': cpu_percentage, 'mem': mem_usage, 'time': time.monotonic_ns()})
 
-        t = Thread(target=stats)
+        t = Thread(target=stats, name='target-stats')
         t.daemon = True
         t.start()
 
-    def neighbor_stats(self, queue):
+    # Sum of the testers' accepted counts at the last neighbor poll; None for
+    # a target that does not report counts.
+    accepted_total = None
+
+    def put_neighbor_state(self, queue):
+        '''Read the neighbors' state once and put it on the queue, stamped.'''
+        neighbors_received_full, neighbors_checked = self.get_neighbor_received_routes()
+        now = time.monotonic_ns()
+        queue.put({'who': self.name, 'neighbors_checked': neighbors_checked,
+                   'accepted': self.accepted_total, 'time': now})
+        queue.put({'who': self.name, 'neighbors_received_full': neighbors_received_full, 'time': now})
+
+    def neighbor_stats(self, queue, interval=1):
         def stats():
             while True:
                 if self.stop_monitoring:
                     return
-                neighbors_received_full, neighbors_checked = self.get_neighbor_received_routes()
-                queue.put({'who': self.name, 'neighbors_checked': neighbors_checked})
-                queue.put({'who': self.name, 'neighbors_received_full': neighbors_received_full})
-                time.sleep(1)
+                self.put_neighbor_state(queue)
+                time.sleep(interval)
 
-        t = Thread(target=stats)
+        t = Thread(target=stats, name='neighbor-stats')
         t.daemon = True
         t.start()
 
+    # Set by enable_command_channel(); see channel.py.
+    command_channel = None
+
+    def enable_command_channel(self):
+        '''Send local()'s one-shot commands down one long-lived shell.'''
+        self.command_channel = CommandChannel(dckr, self.name)
+
+    def close_command_channel(self):
+        if self.command_channel is not None:
+            self.command_channel.close()
+            self.command_channel = None
+
     def local(self, cmd, stream=False, detach=False, stderr=False):
-        i = dckr.exec_create(container=self.name, cmd=cmd, stderr=stderr)
-        return dckr.exec_start(i['Id'], stream=stream, detach=detach)
+        if self.command_channel is not None and not stream and not detach:
+            try:
+                with tracer.span(command_name(cmd), cat='exec', container=self.name, via='channel'):
+                    return timed(self.command_stats, cmd, 'channel',
+                                 lambda: self.command_channel.run(cmd, stderr=stderr))
+            except Exception as e:
+                # a hung or broken channel costs one command, not the run
+                print('command channel to {0} failed ({1}); back to exec'.format(self.name, e))
+                self.close_command_channel()
+
+        def run():
+            i = dckr.exec_create(container=self.name, cmd=cmd, stderr=stderr)
+            return dckr.exec_start(i['Id'], stream=stream, detach=detach)
+        with tracer.span(command_name(cmd), cat='exec', container=self.name, via='exec'):
+            if stream or detach:
+                return run()
+            return timed(self.command_stats, cmd, 'exec', run)
+
+    # How observe() runs status commands, 'nsenter' or 'exec'; decided on the
+    # first call. See observer.py.
+    observer = None
+    # Where the neighbor state came from when it was not this container's CLI:
+    # 'bmp' or 'grpc'. Only a record for .versions.json; observe() goes on
+    # using its own method for whatever is still polled.
+    neighbor_source = None
+    # CPU the 'exec' observer's commands used inside this container's cgroup,
+    # for controller_cgroup_stats() to take back off.
+    observer_cpu_usec = 0
+
+    def observe(self, cmd):
+        '''Run a status command for the samplers, outside the target's accounting.
+
+        Same output as local(cmd). The neighbor pollers call this every sample,
+        so what it costs must not show up as the daemon's CPU and memory.
+        '''
+        if self.observer is None:
+            self.observer = 'nsenter' if self._nsenter_works() else 'exec'
+        if self.observer == 'nsenter':
+            with tracer.span(command_name(cmd), cat='exec', container=self.name, via='nsenter'):
+                return subprocess.run(nsenter_argv(self._observer_pid, cmd), env=self._observer_env,
+                                      stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+        output, ticks = split_accounted(self.local(accounted_argv(cmd)))
+        if ticks:
+            self.observer_cpu_usec += ticks * 1_000_000 // CLOCK_TICKS
+        return output
+
+    def _nsenter_works(self):
+        '''Whether nsenter can reach this container from here.
+
+        Tried once with `true`: bgperf2 itself running in a container, or
+        without root, sees no usable PID and falls back to exec.
+        '''
+        if not can_nsenter():
+            return False
+        try:
+            info = dckr.inspect_container(self.name)
+            self._observer_pid = info['State']['Pid']
+            # the container's PATH, so commands resolve as they do under exec
+            self._observer_env = dict(e.split('=', 1) for e in info['Config'].get('Env') or []
+                                      if '=' in e)
+            return subprocess.run(nsenter_argv(self._observer_pid, 'true'),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+        except Exception:
+            return False
 
     def get_startup_cmd(self):
         raise NotImplementedError()
@@ -623,6 +715,9 @@ class Container(object):
         tester_count = {}
         neighbors_checked = {}
         for tester in self.scenario_global_conf['testers']:
+            if tester.get('type') == 'canary':
+                # bench --canary's session sends markers, not a table to wait for
+                continue
             for n in tester['neighbors'].keys():
                 tester_count[n] = tester['neighbors'][n]['check-points']
                 neighbors_checked[n] = False
@@ -633,7 +728,18 @@ class Container(object):
         
         tester_count, neighbors_checked = self.get_test_counts()
         neighbors_received_full = neighbors_checked.copy()
-        neighbors_received, neighbors_accepted = self.get_neighbors_state()
+        bmp = getattr(self, 'bmp', None)
+        if bmp is not None and bmp.connected.is_set():
+            # the target is reporting over BMP (see bmp.py); End-of-RIB counts
+            # as having received everything, as FRR's log did
+            self.neighbor_source = 'bmp'
+            neighbors_received, neighbors_accepted = bmp.neighbor_counts()
+            neighbors_received.update(bmp.end_of_rib())
+        else:
+            neighbors_received, neighbors_accepted = self.get_neighbors_state()
+        # prefixes the target has accepted from the testers, for its ingest rate
+        self.accepted_total = sum(v for n, v in neighbors_accepted.items()
+                                  if n in tester_count and not isinstance(v, bool))
         for n in neighbors_accepted.keys():
 
             #this will include the monitor, we don't want to check that
@@ -652,10 +758,24 @@ class Container(object):
 class Target(Container):
 
     CONFIG_FILE_NAME = None
+    # Command names (/proc/<pid>/comm) of the BGP daemon itself, as opposed to
+    # the shell, the log tailer and the helpers around it. The per-thread CPU
+    # sampler only looks at these.
+    DAEMON_PROCESSES = ()
+    # Whether write_config() can point the daemon at a BMP station, and the
+    # BMPCollector bench() set up for it (--neighbor-source bmp). Until the
+    # daemon connects, and for daemons that cannot, the neighbor state is
+    # polled as usual.
+    BMP_SUPPORTED = False
+    bmp = None
 
     def write_config(self):
         raise NotImplementedError()
 
+    def bmp_supported(self):
+        '''Whether the build in this container can export BMP, asked once it is created.'''
+        return self.BMP_SUPPORTED
+
     def use_existing_config(self):
         if 'config_path' in self.conf:
             with open('{0}/{1}'.format(self.host_dir, self.CONFIG_FILE_NAME), 'w') as f:
@@ -672,6 +792,15 @@ class Target(Container):
 
         ctn = super(Target, self).run(dckr_net_name)
 
+        if self.bmp is not None and not self.bmp_supported():
+            # the daemon is not running yet, so the config can still lose it
+            print('{0} ({1}) cannot export BMP; polling it instead'.format(
+                self.name, self.version_string()))
+            self.bmp.close()
+            self.bmp = None
+            if not self.use_existing_config():
+                self.write_config()
+
 
         self.exec_startup_cmd(detach=True)
 
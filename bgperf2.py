@@ -16,6 +16,7 @@
 # limitations under the License.
 
 import argparse
+import errno
 import json
 import os
 import sys
@@ -30,12 +31,10 @@ from pathlib import Path
 from argparse import ArgumentParser, REMAINDER
 from itertools import chain, islice
 from requests.exceptions import ConnectionError
-from pyroute2 import IPRoute
+from pyroute2 import IPRoute, NetlinkError
 from socket import AF_INET
 from nsenter import Namespace
 from psutil import virtual_memory
-from subprocess import check_output
-import matplotlib.pyplot as plt
 import numpy as np
 from base import *
 from exabgp import ExaBGP, ExaBGP_MRTParse
@@ -52,8 +51,24 @@ from eos import Eos, EosTarget
 from tester import ExaBGPTester, BIRDTester
 from mrt_tester import GoBGPMRTTester, ExaBGPMrtTester
 from bgpdump2 import Bgpdump2, Bgpdump2Tester
-from monitor import Monitor
-from convergence import ConvergenceTracker
+from monitor import Monitor, NativeMonitor
+from netstats import can_use_ss, read_network, read_sessions
+from bmp import BMP_PORT, BMPCollector
+from canary import DEFAULT_RATE as CANARY_RATE, CanarySpeaker
+from render import GraphWorker, render_jobs
+from metrics import LiveMetrics, MetricsServer
+from phases import tracer
+from profiling import (Profiler, ProfilerError, diff_table, read_folded, write_flamegraph,
+                       write_folded)
+from selfstats import HarnessSampler, queue_source
+from swcounters import COUNTERS, SoftwareCounters
+from convergence import DEFAULT_CONFIDENCE, POLICIES, ConvergenceTracker, ingest_rates, make_trackers
+from samples import (MIN_SAMPLE_INTERVAL, PASSTHROUGH, SAMPLE_INTERVALS, RunSamples,
+                     parse_sample_intervals, summarize)
+from threadstats import daemon_pids, sample_threads, thread_percents
+from hoststats import sample_host, summarize as summarize_host
+from cgroups import (container_cgroup, discount_cpu, read_cgroup, read_smaps_rollup,
+                     summarize as summarize_cgroup)
 from contention import (describe_contention, foreign_cpu_percent,
                         is_memory_backed, own_process_tree, sample_processes)
 from settings import dckr
@@ -160,6 +175,18 @@ def gc_thresh3():
         return int(f.read().strip())
 
 
+def bridge_gateway(dckr_net_name, local_prefix):
+    '''The host's own address on the bench network.
+
+    Docker hands the bridge the first address of the subnet unless told
+    otherwise, so that is the fallback when the network reports no gateway.
+    '''
+    for config in (dckr.inspect_network(dckr_net_name).get('IPAM') or {}).get('Config') or []:
+        if config.get('Gateway'):
+            return config['Gateway'].split('/')[0]
+    return str(netaddr.IPNetwork(local_prefix).network + 1)
+
+
 def doctor(args):
     ver = dckr.version()['Version']
     if ver.endswith('-ce'):
@@ -639,23 +666,32 @@ def remove_old_containers():
             dckr.remove_container(ctn_name, force=True)
 
 
-def controller_idle_percent(queue):
-    '''collect stats on the whole machine that is running the tests'''
-    def stats():
-        output = {}
-        output['who'] = 'controller'
+def controller_host_stats(queue, interval=1):
+    '''Idle CPU, available memory and pressure stall for the whole machine.
 
+    Replaces an `mpstat 1 1` loop and a `free -m` loop: two forks a second on
+    the box being measured, to read files this can read itself. See
+    hoststats.py for what each number means.
+    '''
+    def stats():
+        previous = sample_host()
+        previous_at = time.monotonic_ns()
         while True:
-            if controller_stop.is_set():
+            if controller_stop.wait(interval):
                 return
-            utilization = check_output(['mpstat', '1' ,'1']).decode('utf-8').split('\n')[3]
-            g = re.match(r'.*all\s+.*\d+\s+(\d+\.\d+)', utilization).groups()
-            output['idle'] = float(g[0])
-            output['time'] = datetime.datetime.now()
+            try:
+                current = sample_host()
+            except Exception:
+                # never let a sampling hiccup take down a running benchmark
+                continue
+            now = time.monotonic_ns()
+            output = summarize_host(previous, current, (now - previous_at) / 1e9)
+            output['who'] = 'controller'
+            output['time'] = now
             queue.put(output)
-            # dont' sleep because mpstat is already taking 1 second to run
+            previous, previous_at = current, now
 
-    t = Thread(target=stats)
+    t = Thread(target=stats, name='host-stats')
     t.daemon = True
     t.start()
 
@@ -720,7 +756,7 @@ def controller_foreign_cpu(queue, interval=5):
     def stats():
         output = {'who': 'controller'}
         previous = sample_processes()
-        previous_at = time.time()
+        previous_at = time.monotonic_ns()
         while True:
             # wait() rather than sleep() so the thread stops the moment the run
             # ends instead of lingering for the rest of its poll interval
@@ -731,49 +767,488 @@ def controller_foreign_cpu(queue, interval=5):
             except Exception:
                 # never let a sampling hiccup take down a running benchmark
                 continue
-            now = time.time()
+            now = time.monotonic_ns()
             output['foreign_cpu'] = foreign_cpu_percent(
-                previous, current, now - previous_at,
+                previous, current, (now - previous_at) / 1e9,
                 own_pids=own_process_tree(current))
-            output['time'] = datetime.datetime.now()
+            output['time'] = now
             queue.put(dict(output))
             previous, previous_at = current, now
 
-    t = Thread(target=stats)
+    t = Thread(target=stats, name='foreign-cpu')
     t.daemon = True
     t.start()
 
 
-def controller_memory_free(queue):
-    '''collect stats on the whole machine that is running the tests'''
+def cgroup_of(container):
+    '''The cgroup v2 directory of a running container, or None.'''
+    try:
+        pid = dckr.inspect_container(container.name)['State']['Pid']
+    except Exception:
+        return None
+    return container_cgroup(pid, getattr(container, 'ctn_id', ''))
+
+
+def container_pids(container):
+    '''Host PIDs of every process in a container.
+
+    cgroup.procs when there is a cgroup v2 to read, since that is a file read;
+    `docker top` otherwise.
+    '''
+    path = cgroup_of(container)
+    if path:
+        try:
+            with open(os.path.join(path, 'cgroup.procs')) as f:
+                return f.read().split()
+        except OSError:
+            pass
+    try:
+        top = dckr.top(container.name)
+        column = top['Titles'].index('PID')
+        return [row[column] for row in top['Processes']]
+    except Exception:
+        return []
+
+
+def controller_thread_stats(queue, target, interval=1.0):
+    '''Sample CPU per thread of the target daemon's own processes.
+
+    The PIDs are looked up again whenever none are found, which covers a
+    daemon still starting when the run begins and one that restarts mid-run.
+    '''
+    names = getattr(target, 'DAEMON_PROCESSES', ())
+    if not names:
+        return
+
     def stats():
-        output = {}
-        output['who'] = 'controller'
+        pids = daemon_pids(container_pids(target), names)
+        previous = sample_threads(pids)
+        previous_at = time.monotonic_ns()
+        while True:
+            if controller_stop.wait(interval):
+                return
+            if not pids or not previous:
+                pids = daemon_pids(container_pids(target), names)
+            try:
+                current = sample_threads(pids)
+            except Exception:
+                continue
+            now = time.monotonic_ns()
+            # an empty previous is a baseline being taken; see thread_percents()
+            if previous:
+                queue.put({'who': 'threads',
+                           'threads': thread_percents(previous, current, (now - previous_at) / 1e9),
+                           'time': now})
+            previous, previous_at = current, now
 
+    t = Thread(target=stats, name='thread-stats')
+    t.daemon = True
+    t.start()
+
+
+def controller_cgroup_stats(queue, containers, interval=1.0):
+    '''Sample CPU, memory and I/O of every bench container from its cgroup.
+
+    One thread for all of them, so measuring fifty testers costs fifty small
+    file reads a tick rather than fifty `docker stats` streams. Each tick is
+    one queue message holding every container's numbers, keyed by name.
+
+    Returns the names it is sampling. A container whose cgroup cannot be found
+    -- a cgroup v1 host, or one already gone -- is left out, and the caller
+    decides what to fall back to.
+    '''
+    paths = {}
+    owners = {}
+    for c in containers:
+        path = cgroup_of(c)
+        if path:
+            paths[c.name] = path
+            owners[c.name] = c
+    if not paths:
+        return set()
+
+    def read():
+        # less whatever the container's exec'd status commands used in there
+        return {name: discount_cpu(read_cgroup(path), getattr(owners[name], 'observer_cpu_usec', 0))
+                for name, path in paths.items()}
+
+    def stats():
+        previous = read()
+        previous_at = time.monotonic_ns()
         while True:
-            if controller_stop.is_set():
+            if controller_stop.wait(interval):
                 return
-            free = check_output(['free', '-m']).decode('utf-8').split('\n')[1]
-            g = re.match(r'.*\d+\s+(\d+)', free).groups()
-            output['free'] = float(g[0]) * 1024 * 1024
-            output['time'] = datetime.datetime.now()
+            current = read()
+            now = time.monotonic_ns()
+            queue.put({'who': 'cgroups',
+                       'containers': {name: summarize_cgroup(previous[name], current[name],
+                                                             (now - previous_at) / 1e9)
+                                      for name in current},
+                       'time': now})
+            previous, previous_at = current, now
+
+    t = Thread(target=stats, name='cgroup-stats')
+    t.daemon = True
+    t.start()
+    return set(paths)
+
+
+def controller_harness_stats(queue, interval=1.0):
+    '''Sample bgperf2's own CPU, memory and per-thread CPU; see selfstats.py.
+
+    It measures itself too: its own thread shows up as 'harness-stats'.
+    '''
+    def stats():
+        try:
+            sampler = HarnessSampler()
+        except Exception:
+            return
+        while True:
+            if controller_stop.wait(interval):
+                return
+            try:
+                output = sampler.sample()
+            except Exception:
+                continue
+            output['who'] = 'harness'
             queue.put(output)
-            controller_stop.wait(1)
 
-    t = Thread(target=stats)
+    t = Thread(target=stats, name='harness-stats')
     t.daemon = True
     t.start()
 
+
+def controller_net_stats(queue, target, bridge, interval=1.0):
+    '''Sample the target's BGP sessions and the bench bridge; see netstats.py.
+
+    ss runs in the target's network namespace only, with the host's own ss,
+    so nothing is exec'd into the container being measured.
+    '''
+    try:
+        pid = dckr.inspect_container(target.name)['State']['Pid'] if target is not None else None
+    except Exception:
+        pid = None
+    use_ss = can_use_ss()
+
+    def stats():
+        while True:
+            if controller_stop.wait(interval):
+                return
+            try:
+                sessions = read_sessions(pid, use_ss) if pid else {}
+                devices, softnet = read_network(bridge)
+            except Exception:
+                continue
+            queue.put({'who': 'net', 'sessions': sessions, 'devices': devices,
+                       'softnet': softnet, 'time': time.monotonic_ns()})
+
+    t = Thread(target=stats, name='net-stats')
+    t.daemon = True
+    t.start()
+
+
+def write_thread_series(args, samples, prefix):
+    '''Every target thread's samples, one row each.'''
+    threads = samples['threads'].until(None)
+    path = results_path(args.results_dir, prefix + '.threads.csv')
+    with open(path, 'w') as f:
+        f.write('tid, thread, elapsed (s), cpu %\n')
+        for i in np.lexsort((threads['t'], threads['tid'])):
+            f.write('{0},{1},{2:.3f},{3:.2f}\n'.format(
+                threads['tid'][i], samples.thread_names[threads['name'][i]],
+                threads['t'][i], threads['cpu'][i]))
+    return path
+
+
+def write_harness_series(args, samples, prefix):
+    '''bgperf2's own samples, one reading per row: its process tree's CPU and
+    RSS, each of its threads' CPU, and each sample's wait on the queue.'''
+    path = results_path(args.results_dir, prefix + '.harness.csv')
+    names = samples.sampler_names
+    rows = []
+    h = samples['harness'].until(None)
+    for i in range(len(h['t'])):
+        rows.append((h['t'][i], 'cpu %', 'bgperf2', '{0:.2f}'.format(h['cpu'][i])))
+        rows.append((h['t'][i], 'rss (bytes)', 'bgperf2', str(h['rss'][i])))
+    threads = samples['harness_threads'].until(None)
+    for i in range(len(threads['t'])):
+        rows.append((threads['t'][i], 'cpu %', names[threads['thread'][i]],
+                     '{0:.2f}'.format(threads['cpu'][i])))
+    latency = samples['latency'].until(None)
+    for i in range(len(latency['t'])):
+        rows.append((latency['t'][i], 'queue latency (ms)', names[latency['source'][i]],
+                     '{0:.3f}'.format(latency['seconds'][i] * 1e3)))
+    with open(path, 'w') as f:
+        f.write('elapsed (s), measure, source, value\n')
+        for t, measure, source, value in sorted(rows, key=lambda r: (r[1], r[2], r[0])):
+            f.write('{0:.3f},{1},{2},{3}\n'.format(t, measure, source, value))
+    return path
+
+
+def write_canary_series(args, samples, prefix):
+    '''Every marker bench --canary sent, and how long it took to reach the monitor.'''
+    c = samples['canary'].until(None)
+    path = results_path(args.results_dir, prefix + '.canary.csv')
+    with open(path, 'w') as f:
+        f.write('sent (s), latency (ms)\n')
+        for t, latency in zip(c['t'], c['latency']):
+            f.write('{0:.3f},{1}\n'.format(t, '' if np.isnan(latency) else '{0:.3f}'.format(latency * 1e3)))
+    return path
+
+
+def write_network_series(args, samples, prefix):
+    '''The target's sessions and the bridge's counters, one sample per row.'''
+    paths = []
+    s = samples['sessions'].until(None)
+    if len(s['t']):
+        path = results_path(args.results_dir, prefix + '.sessions.csv')
+        peers = np.array(samples.session_names, dtype=str)[s['peer']]
+        with open(path, 'w') as f:
+            f.write('peer, elapsed (s), recv-q (bytes), send-q (bytes), rtt (ms), retransmits, '
+                    'rwnd (bytes)\n')
+            for i in np.lexsort((s['t'], peers)):
+                f.write('{0},{1:.3f},{2},{3},{4},{5},{6}\n'.format(
+                    peers[i], s['t'][i], s['recv_q'][i], s['send_q'][i],
+                    '' if np.isnan(s['rtt'][i]) else '{0:.3f}'.format(s['rtt'][i] * 1e3),
+                    '' if np.isnan(s['retrans'][i]) else int(s['retrans'][i]),
+                    '' if np.isnan(s['rwnd'][i]) else int(s['rwnd'][i])))
+        paths.append(path)
+    d = samples['netdev'].until(None)
+    if len(d['t']):
+        path = results_path(args.results_dir, prefix + '.netdev.csv')
+        devices = np.array(samples.device_names, dtype=str)[d['device']]
+        with open(path, 'w') as f:
+            f.write('device, elapsed (s), rx bytes, rx packets, rx drop, tx bytes, tx packets, '
+                    'tx drop\n')
+            for i in np.lexsort((d['t'], devices)):
+                f.write('{0},{1:.3f},{2},{3},{4},{5},{6},{7}\n'.format(
+                    devices[i], d['t'][i], d['rx_bytes'][i], d['rx_packets'][i], d['rx_drop'][i],
+                    d['tx_bytes'][i], d['tx_packets'][i], d['tx_drop'][i]))
+        paths.append(path)
+    return paths
+
+
+def write_container_series(args, samples, prefix):
+    '''Every container's samples, one row each, beside the run's other output.'''
+    c = samples['containers'].until(None)
+    path = results_path(args.results_dir, prefix + '.containers.csv')
+    with open(path, 'w') as f:
+        f.write('container, elapsed (s), cpu %, mem (bytes), io read (bytes), io write (bytes)\n')
+        names = np.array(samples.container_names, dtype=str)[c['container']]
+        for i in np.lexsort((c['t'], names)):
+            f.write('{0},{1:.3f},{2:.2f},{3},{4},{5}\n'.format(
+                names[i], c['t'][i], c['cpu'][i], c['mem'][i], c['io_read'][i], c['io_write'][i]))
+    return path
+
 # Stops the controller sampling threads at the end of a run. This used to be a
 # plain module-level bool that finish_bench() assigned without `global`, so the
 # assignment created a local and the threads never stopped -- and batch() calls
 # bench() in-process once per cell, so a 40-run batch finished with 40 mpstat
-# loops, 40 `free` loops and 40 `ps` loops still polling. bgperf was
+# loops, 40 `free` loops and 40 `ps` loops still polling (the first two have
+# since become controller_host_stats(), which reads /proc). bgperf was
 # manufacturing the very contention it now reports, growing run over run.
 # Runs are strictly sequential, so one module-level Event is enough.
 controller_stop = threading.Event()
 
 
+# The time-series graphs are redrawn this often during a long run, so there is
+# something to look at before it finishes -- by bench_graphs, in a process of
+# its own, so the loop draining the sample queue never waits on matplotlib.
+BENCH_GRAPH_INTERVAL = 120
+bench_graphs = GraphWorker()
+
+
+# What --metrics-port and --metrics-textfile publish; see metrics.py. batch()
+# runs every cell in this process, so one server serves them all in turn.
+live_metrics = LiveMetrics()
+metrics_server = None
+
+
+def start_metrics(args):
+    '''Serve the live metrics on --metrics-port, once per process.'''
+    global metrics_server
+    port = getattr(args, 'metrics_port', None)
+    if port is not None and metrics_server is None:
+        metrics_server = MetricsServer(live_metrics, port)
+        print('serving metrics on http://localhost:{0}/metrics'.format(metrics_server.port))
+
+
+def publish_metrics(args, **values):
+    '''Update the live metrics, and their textfile if there is one.
+
+    Called from bench()'s loop, so a file that cannot be written is reported
+    and otherwise ignored -- the run is what matters.
+    '''
+    live_metrics.update(**values)
+    path = getattr(args, 'metrics_textfile', None)
+    if path:
+        try:
+            live_metrics.write_textfile(path)
+        except OSError as e:
+            print('cannot write {0}: {1}'.format(path, e))
+
+
+def use_command_channel(args, container):
+    '''Switch a started container's local() to a long-lived shell if asked.'''
+    if getattr(args, 'command_channel', None) and isinstance(container, Container):
+        container.enable_command_channel()
+
+
+def write_command_series(args, containers, prefix):
+    '''How long every command bench() ran in each container took, and how.'''
+    path = results_path(args.results_dir, prefix + '.commands.csv')
+    with open(path, 'w') as f:
+        f.write('container, command, via, count, mean (ms), max (ms)\n')
+        for c in containers:
+            for name, via, count, mean, worst in c.command_stats.rows():
+                f.write('{0},{1},{2},{3},{4:.3f},{5:.3f}\n'.format(c.name, name, via, count,
+                                                                   mean, worst))
+    return path
+
+
+def write_bmp_series(args, collector, prefix):
+    '''Each peer's ingest curve, and its session and End-of-RIB events, from BMP.'''
+    path = results_path(args.results_dir, prefix + '.bmp.csv')
+    with open(path, 'w') as f:
+        f.write('time (s), peer, event, received, accepted\n')
+        for at, peer, event, received, accepted in collector.state.events:
+            f.write('{0:.3f},{1},{2},{3},{4}\n'.format((at - collector.origin) / 1e9, peer, event,
+                                                       received, accepted))
+    return path
+
+
+def start_counters(args, target):
+    '''Count the target daemon's context switches, faults, migrations and
+    syscalls over the convergence window; see swcounters.py.'''
+    pids = daemon_pids(container_pids(target), getattr(target, 'DAEMON_PROCESSES', ()))
+    if not pids:
+        return
+    bench_prefix = f"{run_name(args).replace(' ', '_')}_{args.tester_type}_{args.prefix_num}_{args.neighbor_num}"
+    target.counters = SoftwareCounters(pids, results_path(args.results_dir, bench_prefix + '.perf-stat'))
+    target.counters.start()
+
+
+def canary_address(bridge, address, prefixlen, add=True):
+    '''Add the canary's address to the bench bridge, or remove it; False if
+    that could not be done.'''
+    ip = IPRoute()
+    try:
+        index = ip.link_lookup(ifname=bridge)
+        if not index:
+            return False
+        ip.addr('add' if add else 'del', index=index[0], address=address, mask=prefixlen)
+    except NetlinkError as e:
+        # left behind by a run that never got to remove it
+        return add and e.code == errno.EEXIST
+    finally:
+        ip.close()
+    return True
+
+
+def expected_prefixes(conf):
+    '''Every prefix the testers are configured to send, before gen_conf()
+    scales the check-point down; None for MRT, whose table size is unknown.'''
+    total = 0
+    for tester in conf['testers']:
+        if tester.get('type') == 'mrt':
+            return None
+        if tester.get('type') != 'canary':
+            total += sum(n.get('count', 0) for n in tester['neighbors'].values())
+    return total or None
+
+
+def prepare_canary(args, conf, bridge):
+    '''Give the canary an address of its own on the bench bridge and add it to
+    the scenario as one more peer of the target; see canary.py.
+
+    None, and a run without a canary, when the address cannot be added.
+    '''
+    if not conf.get('local_prefix'):
+        print('--canary: not measuring: the scenario has no local_prefix to take an address from')
+        return None
+    network = netaddr.IPNetwork(conf['local_prefix'])
+    # the target's default address is the one above it
+    address = str(network.broadcast - 2)
+    if not canary_address(bridge, address, network.prefixlen):
+        print(f"--canary: not measuring: cannot add {address} to {bridge} (needs root)")
+        return None
+    # a batch file can say `canary: true` for the default rate
+    rate = CANARY_RATE if args.canary is True else float(args.canary)
+    canary = CanarySpeaker(conf['target']['local-address'], address, rate=rate)
+    canary.bridge = bridge
+    canary.prefixlen = network.prefixlen
+    conf['testers'].append({'name': 'canary', 'type': 'canary',
+                            'neighbors': {address: canary.neighbor()}})
+    return canary
+
+
+def stop_canary(args, canary, samples):
+    '''Stop announcing, record every marker's trip, and give back the address.'''
+    canary.close()
+    for t, latency in canary.ledger.rows(canary.origin):
+        samples.record_canary(t, latency)
+    canary_address(canary.bridge, canary.local_address, canary.prefixlen, add=False)
+
+
+def start_profile(args, target, is_remote):
+    '''Attach perf to the target daemon for the convergence window; see profiling.py.
+
+    A run that cannot be profiled still runs, and says why not.
+    '''
+    if is_remote:
+        print('--profile: a remote target cannot be profiled from here')
+        return
+    pids = daemon_pids(container_pids(target), getattr(target, 'DAEMON_PROCESSES', ()))
+    bench_prefix = f"{run_name(args).replace(' ', '_')}_{args.tester_type}_{args.prefix_num}_{args.neighbor_num}"
+    profiler = Profiler(pids, results_path(args.results_dir, bench_prefix + '.perf.data'))
+    try:
+        profiler.start()
+    except (ProfilerError, OSError) as e:
+        print(f"--profile: not profiling: {e}")
+        return
+    target.profiler = profiler
+
+
+def write_profile(args, target_version, folded, prefix):
+    '''The folded stacks and their flamegraph, beside the run's other output.'''
+    folded_path = write_folded(folded, results_path(args.results_dir, prefix + '.folded'))
+    write_flamegraph(folded, results_path(args.results_dir, prefix + '.flame.svg'),
+                     '{0} {1}: {2} peers x {3} prefixes'.format(
+                         args.target, target_version, args.neighbor_num, args.prefix_num))
+    return folded_path
+
+
+def profile_diff(args):
+    '''Compare two runs' folded stacks: a table, and B's flamegraph against A.'''
+    before, after = read_folded(args.before), read_folded(args.after)
+    print('{0:>9} {1:>9} {2:>9}  function'.format('before %', 'after %', 'change'))
+    for name, a, b in diff_table(before, after, limit=args.limit):
+        print('{0:9.2f} {1:9.2f} {2:+9.2f}  {3}'.format(a, b, b - a, name))
+    if args.output:
+        write_flamegraph(after, args.output, '{0} against {1}'.format(
+            os.path.basename(args.after), os.path.basename(args.before)), baseline=before)
+        print(f"differential flamegraph: {args.output}")
+
+
+def sample_interval_arg(value):
+    '''argparse type for --sample-interval; see parse_sample_intervals().'''
+    try:
+        return parse_sample_intervals(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def confidence_arg(value):
+    '''argparse type for --confidence: a probability, short of certainty.'''
+    try:
+        confidence = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('{0!r} is not a number'.format(value))
+    if not 0 < confidence < 1:
+        raise argparse.ArgumentTypeError('confidence must be between 0 and 1, not {0}'.format(value))
+    return confidence
+
+
 def bench(args):
     output_stats = {}
     config_dir = '{0}/{1}'.format(args.dir, args.bench_name)
@@ -786,10 +1261,16 @@ def bench(args):
     #
     # Only a -f scenario can declare the target remote, and a remote target has
     # no local image to resolve, so that case waits until the scenario is parsed.
+    if getattr(args, 'canary', None) and (getattr(args, 'monitor', None) or 'gobgp') != 'native':
+        sys.exit('--canary needs --monitor native: only it sees each UPDATE as it arrives')
+
     target_image_name = None
     if not args.file:
         target_image_name = target_image(args.target, getattr(args, 'version', None), args.image)
 
+    # Every phase below is a span in <run>.trace.json; see phases.py.
+    tracer.reset()
+    tracer.begin('cleanup')
     remove_target_containers()
 
     if not args.repeat:
@@ -797,6 +1278,7 @@ def bench(args):
 
         if os.path.exists(config_dir):
             shutil.rmtree(config_dir, ignore_errors=True)
+    tracer.end('cleanup')
 
     # Only once the previous run's containers are gone. batch() reuses this
     # process for every cell, so checking earlier would see the last cell's own
@@ -805,6 +1287,7 @@ def bench(args):
     warn_if_log_dir_is_in_ram(config_dir)
 
     bench_start = time.time()
+    tracer.begin('config')
     if args.file:
         with open(args.file) as f:
             conf = yaml.safe_load(Template(f.read()).render())
@@ -823,6 +1306,9 @@ def bench(args):
     if target_image_name is None and not is_remote:
         target_image_name = target_image(args.target, getattr(args, 'version', None), args.image)
 
+    tracer.end('config')
+
+    tracer.begin('network')
     bridge_found = False
     for network in dckr.networks(names=[dckr_net_name]):
         if network['Name'] == dckr_net_name:
@@ -834,6 +1320,7 @@ def bench(args):
         print('creating Docker network "{}" with subnet {}'.format(dckr_net_name, subnet))
         ipam = IPAMConfig(pool_configs=[IPAMPool(subnet=subnet)])
         network = dckr.create_network(dckr_net_name, driver='bridge', ipam=ipam)
+    tracer.end('network')
 
     num_tester = sum(len(t.get('neighbors', [])) for t in conf.get('testers', []))
     if num_tester > gc_thresh3():
@@ -842,9 +1329,22 @@ def bench(args):
         print('$ echo 16384 | sudo tee /proc/sys/net/ipv4/neigh/default/gc_thresh3')
 
     print('run monitor')
-    m = Monitor(config_dir+'/monitor', conf['monitor'])
+    tracer.begin('monitor start')
+    if (getattr(args, 'monitor', None) or 'gobgp') == 'native':
+        # The native monitor speaks from the host, whose address on the bench
+        # network is the bridge gateway. Every target config is written from
+        # conf['monitor'] further down, so pointing it there is enough for
+        # them to peer with it.
+        gateway = bridge_gateway(dckr_net_name, conf['local_prefix'])
+        conf['monitor']['local-address'] = gateway
+        conf['monitor']['router-id'] = gateway
+        m = NativeMonitor(config_dir+'/monitor', conf['monitor'])
+    else:
+        m = Monitor(config_dir+'/monitor', conf['monitor'])
     m.monitor_for = args.target
     m.run(conf, dckr_net_name)
+    use_command_channel(args, m)
+    tracer.end('monitor start')
 
 
     ## I'd prefer to start up the testers and then start up the target  
@@ -852,6 +1352,7 @@ def bench(args):
     # this is the order
     testers = []
     mrt_injector = None
+    tracer.begin('testers start')
     if not args.repeat:
         valid_indexes = None
         asns = None
@@ -896,6 +1397,7 @@ def bench(args):
             if idx > 0:
                 rm_line()
             t.run(conf['target'], dckr_net_name)
+            use_command_channel(args, t)
             testers.append(t)
 
 
@@ -918,6 +1420,12 @@ def bench(args):
                 with open('{0}/scenario.yaml'.format(config_dir), 'w') as f:
                     f.write(str_conf)
 
+    tracer.end('testers start', testers=len(testers))
+
+    if getattr(args, 'canary', None):
+        m.canary = prepare_canary(args, conf, args.bridge_name or 'br-{}'.format(network['Id'][0:12]))
+
+    tracer.begin('target start')
     if is_remote:
         print('target is remote ({})'.format(conf['target']['local-address']))
 
@@ -1014,12 +1522,26 @@ def bench(args):
         print('run', run_name(args))
         target = target_class('{0}/{1}'.format(config_dir, args.target), conf['target'],
                               image=target_image_name)
+        if getattr(args, 'frr_eor', None) and hasattr(target, 'EOR_METHODS'):
+            target.eor_method = args.frr_eor
+        if (getattr(args, 'neighbor_source', None) or 'poll') == 'bmp':
+            if target.BMP_SUPPORTED:
+                target.bmp = BMPCollector(bridge_gateway(dckr_net_name, conf['local_prefix']),
+                                          BMP_PORT)
+                target.bmp.start()
+            else:
+                print('{0} cannot be configured to export BMP; polling it instead'.format(args.target))
 
         target.run(conf, dckr_net_name)
+        use_command_channel(args, target)
+    if getattr(m, 'canary', None) is not None:
+        m.canary.run()
+    tracer.end('target start')
 
     time.sleep(1)
 
-    output_stats['monitor_wait_time'] = m.wait_established(conf['target']['local-address'])
+    with tracer.span('wait established'):
+        output_stats['monitor_wait_time'] = m.wait_established(conf['target']['local-address'])
     output_stats['cores'], output_stats['memory'] = get_hardware_info()
     # target_class is only bound in the local branch above; a remote run used to
     # die here with NameError. Pre-existing, but the remote path is now something
@@ -1027,8 +1549,25 @@ def bench(args):
     if not is_remote and target_class == EosTarget:
         print("Waiting extra 10 seconds for EOS ")
         time.sleep(10)
-
-    start = datetime.datetime.now()
+    if not is_remote and hasattr(target, 'choose_eor_method'):
+        # once, before any tester can send an End-of-RIB (see frr.py)
+        target.choose_eor_method(conf['monitor']['local-address'])
+
+    with tracer.span('graph worker'):
+        # its start-up is a full import of this module; see render.py
+        bench_graphs.start()
+
+    # Every producer stamps its messages with time.monotonic_ns() as it takes
+    # the reading, so `at` below is when a sample was taken, not when bench()
+    # got round to it, and no wall-clock step can move a run's timings.
+    start = time.monotonic_ns()
+    intervals = parse_sample_intervals(getattr(args, 'sample_interval', None))
+    if getattr(m, 'canary', None) is not None:
+        m.canary.origin = start
+    # target, like target_class, is only bound for a local target
+    if not is_remote and target.bmp is not None:
+        target.bmp.origin = start
+        target.bmp.interval = intervals['neighbors']
 
     q = Queue()
 
@@ -1037,36 +1576,50 @@ def bench(args):
     # would exit immediately on a flag the last run left set.
     controller_stop.clear()
 
-    m.stats(q)
-    controller_idle_percent(q)
-    controller_memory_free(q)
-    controller_foreign_cpu(q)
+    m.stats(q, interval=intervals['monitor'])
+    controller_host_stats(q, interval=intervals['host'])
+    controller_foreign_cpu(q, interval=intervals['foreign'])
+    # the native monitor is this process, which has no cgroup of its own
+    sampled = controller_cgroup_stats(
+        q, ([] if is_remote else [target]) + testers + ([m] if isinstance(m, Monitor) else []),
+        interval=intervals['cgroups'])
     if not is_remote:
-        target.stats(q)
-        target.neighbor_stats(q)
-
+        if target.name not in sampled:
+            # no cgroup v2 to read, so back to what dockerd reports, at
+            # dockerd's own once-a-second pace
+            target.stats(q)
+        target.neighbor_stats(q, interval=intervals['neighbors'])
+        controller_thread_stats(q, target, interval=intervals['threads'])
+    controller_harness_stats(q, interval=intervals['harness'])
+    controller_net_stats(q, None if is_remote else target,
+                         args.bridge_name or 'br-{}'.format(network['Id'][0:12]),
+                         interval=intervals['net'])
+    if not is_remote:
+        start_counters(args, target)
+    if getattr(args, 'profile', False):
+        # target is only bound for a local target
+        start_profile(args, None if is_remote else target, is_remote)
 
     # want to launch all the neighbors at the same(ish) time
     # launch them after the test starts because as soon as they start they can send info at least for mrt
     #  does it need to be in a different place for mrt than exabgp?
+    tracer.begin('testers launch')
     for i in range(len(testers)):
-        testers[i].launch()
+        with tracer.span('launch', cat='launch', container=testers[i].name):
+            testers[i].launch()
         if i > 0:
             rm_line()
         print(f"launched {i+1} testers")
         # if args.prefix_num >= 100_000:
         #     time.sleep(1)
+    tracer.end('testers launch')
+    tracer.begin('convergence')
 
     f = open(args.output, 'w') if args.output else None
-    cpu = 0
+    # None until the target's first sample: an unread CPU is not an idle one
+    cpu = None
     mem = 0
 
-    output_stats['max_cpu'] = 0
-    output_stats['max_mem'] = 0
-    output_stats['first_received_time'] = start - start
-    output_stats['min_idle'] = 100
-    output_stats['min_free'] = 1_000_000_000_000_000
-    output_stats['max_foreign_cpu'] = 0
     # finish_bench() fills these in once the clock has stopped; a run with no
     # testers (a remote target) never gets there, and they are printed and
     # written into the row unconditionally.
@@ -1074,95 +1627,184 @@ def bench(args):
     output_stats['tester_timeouts'] = 0
 
     output_stats['required'] = conf['monitor']['check-points'][0]
-    bench_stats = []
+    output_stats['expected'] = expected_prefixes(conf)
+    # Every reading from every sampler goes in here, and the row's max and min
+    # columns are derived from it at the end -- see samples.py.
+    samples = RunSamples()
+    roles = {t.name: 'tester' for t in testers}
+    roles[m.name] = 'monitor'
+    if not is_remote:
+        roles[target.name] = 'target'
     neighbors_checked = 0
     neighbors_received_full = 0
     percent_idle = 0
     mem_free = 0
 
     recved = 0
-    tracker = ConvergenceTracker()
+    foreign = None
+    harness = {}
+    # what else is still working, for telling a stall from a pause; None
+    # until measured
+    queued = None
+    busiest_tester = None
+    start_metrics(args)
+    live_metrics.start_cell(run=run_name(args), target=args.target)
+    # Every policy sees every sample, so a run says when each would have
+    # called it; only the chosen one ends the run. See convergence.py.
+    policy = getattr(args, 'convergence', None) or 'tracker'
+    trackers = make_trackers(intervals['monitor'],
+                             getattr(args, 'confidence', None) or DEFAULT_CONFIDENCE)
+    tracker = trackers[policy]
+    output_stats['convergence'] = policy
+    output_stats['decided'] = decided = {}
+    next_graphs = BENCH_GRAPH_INTERVAL
     while True:
         info = q.get()
+        at = (info['time'] - start) / 1e9 if 'time' in info else None
+        if at is not None:
+            # how long the sample sat in the queue before this loop got to it
+            samples.record_latency(at, queue_source(info, roles),
+                                   (time.monotonic_ns() - info['time']) / 1e9)
 
         if not is_remote and info['who'] == target.name:
             if 'neighbors_checked' in info:
+                if info.get('accepted') is not None:
+                    samples.record_target_accepted(at, info['accepted'])
                 if len(info['neighbors_checked']) > 0 and all(value == True for value in info['neighbors_checked'].values()):
                     neighbors_checked = sum(1 if value == True else 0 for value in info['neighbors_checked'].values())
-                    tracker.note_neighbors_checkpoint()
+                    for each in trackers.values():
+                        each.note_neighbors_checkpoint()
                 else:
                     neighbors_checked = sum(1 if value == True else 0 for value in info['neighbors_checked'].values())
             elif 'neighbors_received_full' in info:
 
                 if len(info['neighbors_received_full']) >= 1 and all(value == True for value in info['neighbors_received_full'].values()):
                     neighbors_received_full = sum(1 if value == True else 0 for value in info['neighbors_received_full'].values())
-                    tracker.note_neighbors_checkpoint()
+                    for each in trackers.values():
+                        each.note_neighbors_checkpoint()
                 else:
                     neighbors_received_full = sum(1 if value == True else 0 for value in info['neighbors_received_full'].values())
             else:
                 cpu = info['cpu']
                 mem = info['mem']
-                output_stats['max_cpu'] = cpu if cpu > output_stats['max_cpu'] else output_stats['max_cpu']
-                output_stats['max_mem'] = mem if mem > output_stats['max_mem'] else output_stats['max_mem']
+                samples.record_target(at, cpu, mem)
+
+        if info['who'] == 'cgroups':
+            containers = info['containers']
+            samples.record_containers(at, containers, roles)
+            busiest_tester = max((c['cpu'] for name, c in containers.items()
+                                  if roles.get(name) == 'tester'), default=None)
+            if not is_remote and target.name in containers:
+                cpu = containers[target.name]['cpu']
+                mem = containers[target.name]['mem']
+                samples.record_target(at, cpu, mem)
+                c = containers[target.name]
+                samples.record_target_memory(at, c['mem_anon'], c['mem_file'], c['mem_kernel'],
+                                             c['mem_sock'], c['mem_peak'])
+                if c.get('cpu_user') is not None:
+                    samples.record_target_cpu(at, c['cpu_user'], c['cpu_system'])
+
+        if info['who'] == 'threads':
+            samples.record_threads(at, info['threads'])
+
+        if info['who'] == 'net':
+            samples.record_network(at, info['sessions'], info['devices'], info['softnet'])
+            # no sessions read is no reading, not the last one still holding
+            queued = sum(s['recv_q'] + s['send_q'] for s in info['sessions'].values()) \
+                if info['sessions'] else None
+
+        if info['who'] == 'harness':
+            harness = info
+            samples.record_harness(at, info['cpu'], info['rss'], info['peak'], info['threads'])
 
         if info['who'] == 'controller':
-            if 'free' in info:
-                mem_free = info['free']
-                output_stats['min_free'] = mem_free if mem_free < output_stats['min_free'] else output_stats['min_free']
-            elif 'idle' in info:
-                percent_idle = info['idle']
-                output_stats['min_idle'] = percent_idle if percent_idle < output_stats['min_idle'] else output_stats['min_idle']
-            elif 'foreign_cpu' in info:
+            # independent checks, not an elif chain: the host sampler reports
+            # idle, free and pressure in the same message
+            if 'idle' in info or 'free' in info:
+                if info.get('free') is not None:
+                    mem_free = info['free']
+                if info.get('idle') is not None:
+                    percent_idle = info['idle']
+                samples.record_host(at, info.get('idle'), info.get('free'), info.get('psi_cpu'),
+                                    info.get('psi_memory'), info.get('psi_io'))
+            if 'foreign_cpu' in info:
                 foreign = info['foreign_cpu']
-                if foreign > output_stats['max_foreign_cpu']:
-                    output_stats['max_foreign_cpu'] = foreign
+                samples.record_foreign(at, foreign)
         if info['who'] == m.name:
 
-            elapsed = info['time'] - start
+            elapsed = at
             output_stats['elapsed'] = elapsed
-            recved = info['afi_safis'][0]['state']['accepted'] if 'accepted' in info['afi_safis'][0]['state'] else 0
+            recved = info['accepted']
+            if info.get('updates') is not None:
+                output_stats['updates'] = info['updates']
             
-            status = tracker.update(elapsed.seconds, recved, neighbors_checked,
-                                    neighbors_received_full, info['checked'])
-
-            if elapsed.seconds > 0:
+            for name, each in trackers.items():
+                if name not in decided and each.update(elapsed, recved, neighbors_checked,
+                                                    neighbors_received_full, info['checked'],
+                                                    target_cpu=cpu if not is_remote else None,
+                                                    queued_bytes=queued,
+                                                    tester_cpu=busiest_tester) \
+                        == ConvergenceTracker.CONVERGED:
+                    decided[name] = elapsed
+            status = ConvergenceTracker.CONVERGED if policy in decided else \
+                ConvergenceTracker.FAILED if tracker.fail_msg else ConvergenceTracker.CONTINUE
+
+            if len(samples['ticks']) > 0:
                 rm_line()
 
-            print('elapsed: {0}sec, cpu: {1:>4.2f}%, mem: {2}, mon recved: {3}, neighbors_received: {4}, neighbors_accepted: {5}, %idle {6}, free mem {7}'.format(elapsed.seconds, 
-                    cpu, mem_human(mem), recved, neighbors_received_full, neighbors_checked, percent_idle, mem_human(mem_free)))
-            bench_stats.append([elapsed.seconds, float(f"{cpu:>4.2f}"), mem, recved, neighbors_checked, percent_idle, mem_free])
-            f.write('{0}, {1}, {2}, {3}\n'.format(elapsed.seconds, cpu, mem, recved)) if f else None
+            # shown, and recorded, as before: 0 until there is a reading
+            shown_cpu = cpu if cpu is not None else 0
+
+            print('elapsed: {0:.1f}sec, cpu: {1:>4.2f}%, mem: {2}, mon recved: {3}, neighbors_received: {4}, neighbors_accepted: {5}, %idle {6}, free mem {7}'.format(elapsed, 
+                    shown_cpu, mem_human(mem), recved, neighbors_received_full, neighbors_checked, percent_idle, mem_human(mem_free)))
+            samples.record_tick(at, float(f"{shown_cpu:>4.2f}"), mem, recved, neighbors_checked, percent_idle, mem_free)
+            f.write('{0:.3f}, {1}, {2}, {3}\n'.format(elapsed, shown_cpu, mem, recved)) if f else None
+            publish_metrics(args, elapsed_seconds=elapsed, target_cpu_percent=shown_cpu, target_memory_bytes=mem,
+                            monitor_received_prefixes=recved, neighbors_received=neighbors_received_full,
+                            neighbors_accepted=neighbors_checked, host_idle_percent=percent_idle,
+                            foreign_cpu_percent=foreign, harness_cpu_percent=harness.get('cpu'),
+                            harness_rss_bytes=harness.get('rss'))
             f.flush() if f else None
 
-            if recved > 0 and output_stats['first_received_time'] == start - start:
-                output_stats['first_received_time'] = elapsed
+            if recved > 0 and 'first_received_time' not in output_stats:
+                # the native monitor knows when the first UPDATE came in, not
+                # just which sample first saw it
+                first_update = info.get('first_update')
+                output_stats['first_received_time'] = (first_update - start) / 1e9 if first_update else elapsed
 
             if status == ConvergenceTracker.FAILED:
                 output_stats['recved'] = recved
                 output_stats['fail_msg'] = tracker.fail_msg
                 f.close() if f else None
                 print("FAILED")
-                return finish_bench(args, output_stats, bench_stats, bench_start, target, m, testers, fail=True)
+                return finish_bench(args, output_stats, samples, bench_start, target, m, testers, fail=True)
 
             if status == ConvergenceTracker.CONVERGED:
-                assurance = tracker.assurance_samples
+                assurance = tracker.quiet_samples
                 output_stats['recved'] = recved
 
                 f.close() if f else None
 
                 # Drop the trailing assurance samples: the run was already done
                 # by then, we were only confirming the count had stopped moving.
-                # TODO: recalculate all min/max stats after removing these
-                #  should move to always calculating based on bench_stats
+                # summarize() leaves out everything sampled after this point.
                 print(f"last recevied: {tracker.last_recved_count}")
-                output_stats['elapsed'] = datetime.timedelta(
-                    seconds=int(output_stats['elapsed'].seconds) - assurance + 1)
-                bench_stats = bench_stats[0:len(bench_stats)-assurance]
-                return finish_bench(args, output_stats, bench_stats, bench_start, target, m, testers)
-
-            if elapsed.seconds % 120 == 0 and elapsed.seconds > 1:
+                if info.get('last_change'):
+                    # the native monitor saw the table stop changing itself
+                    output_stats['elapsed'] = (info['last_change'] - start) / 1e9
+                else:
+                    output_stats['elapsed'] = elapsed - (assurance - 1) * intervals['monitor']
+                profiler = getattr(target, 'profiler', None) if not is_remote else None
+                if profiler is not None:
+                    # the assurance samples are not the daemon converging
+                    profiler.until = start + int(output_stats['elapsed'] * 1e9)
+                return finish_bench(args, output_stats, samples, bench_start, target, m, testers)
+
+            if elapsed >= next_graphs:
+                next_graphs += BENCH_GRAPH_INTERVAL
                 bench_prefix = f"{args.target}_{args.tester_type}_{args.prefix_num}_{args.neighbor_num}"
-                create_bench_graphs(bench_stats, prefix=bench_prefix, results_dir=args.results_dir)
+                bench_graphs.submit(bench_graph_jobs(samples.tick_rows(), prefix=bench_prefix,
+                                                     results_dir=args.results_dir))
 
 
 def collect_provenance(args, target, monitor, testers):
@@ -1174,14 +1816,22 @@ def collect_provenance(args, target, monitor, testers):
     is only possible while the containers are still up.
     '''
     def describe(daemon, container):
+        # the native monitor runs in this process and has no image
         return {'daemon': daemon,
-                'image': normalize_image_name(container.image),
+                'image': normalize_image_name(container.image) if container.image else '',
                 'version': container.version_string()}
 
     provenance = {
         'target': describe(args.target, target),
-        'monitor': describe('gobgp', monitor),
+        'monitor': describe(getattr(args, 'monitor', None) or 'gobgp', monitor),
         'testers': [],
+        # how the target's status was polled, which decides whether its CPU
+        # and memory columns include that polling (see observer.py)
+        'observer': getattr(target, 'observer', None),
+        # where the target's neighbor state came from instead, if not its CLI
+        'neighbor_source': getattr(target, 'neighbor_source', None),
+        # how FRR's End-of-RIB was found; 'log' means bgpd ran at debug level
+        'eor': getattr(target, 'eor_method', None),
     }
     # A run can be a hundred tester containers off one image. Ask one per
     # distinct image and record how many ran, rather than exec'ing into each.
@@ -1217,13 +1867,35 @@ def write_provenance(args, provenance, prefix):
     return path
 
 
-def finish_bench(args, output_stats, bench_stats, bench_start, target, m, testers=(), fail=False):
+def finish_bench(args, output_stats, samples, bench_start, target, m, testers=(), fail=False):
 
     bench_stop = time.time()
     output_stats['total_time'] = bench_stop - bench_start
+    tracer.end('convergence', failed=fail)
     m.stop_monitoring = True
     target.stop_monitoring = True
     controller_stop.set()
+    canary = getattr(m, 'canary', None)
+    if canary is not None:
+        stop_canary(args, canary, samples)
+        m.canary = None
+    counters = getattr(target, 'counters', None)
+    counter_source = None
+    if counters is not None:
+        output_stats['counters'], counter_source = counters.stop()
+        target.counters = None
+    # the daemon's own RSS and PSS, while it still holds the converged table
+    if isinstance(target, Container):
+        names = getattr(target, 'DAEMON_PROCESSES', ())
+        rollup = read_smaps_rollup(daemon_pids(container_pids(target), names)) if names else None
+        if rollup:
+            output_stats['daemon_rss'], output_stats['daemon_pss'] = rollup['rss'], rollup['pss']
+    profiler = getattr(target, 'profiler', None)
+    folded = None
+    if profiler is not None:
+        with tracer.span('profile'):
+            folded = profiler.stop()
+        target.profiler = None
 
     # Scan the tester logs only after the clock has stopped. These used to run
     # in bench() before bench_stop, so walking every tester log line by line --
@@ -1232,16 +1904,33 @@ def finish_bench(args, output_stats, bench_stats, bench_start, target, m, tester
     tester_dirs = [t.host_dir for t in testers]
     tester_class = type(testers[0]) if testers else None
     if tester_class is not None:
-        output_stats['tester_errors'] = tester_class.find_errors(tester_dirs)
-        output_stats['tester_timeouts'] = tester_class.find_timeouts(tester_dirs)
+        with tracer.span('log scan'):
+            output_stats['tester_errors'] = tester_class.find_errors(tester_dirs)
+            output_stats['tester_timeouts'] = tester_class.find_timeouts(tester_dirs)
 
     # Read every version before the containers go away -- this is the last
     # moment any of them can be asked.
-    provenance = collect_provenance(args, target, m, testers)
+    with tracer.span('provenance'):
+        provenance = collect_provenance(args, target, m, testers)
+    if counter_source is not None:
+        provenance['counters'] = dict(output_stats['counters'], source=counter_source)
+    containers = [c for c in [target, m] + list(testers) if isinstance(c, Container)]
+    for c in containers:
+        c.close_command_channel()
+    bmp = getattr(target, 'bmp', None)
+    if bmp is not None:
+        bmp.close()
+    if hasattr(target, 'close_api'):
+        target.close_api()
     del m
 
     target_version = provenance['target']['version']
 
+    # From here on the row is whatever the samples say, so a rerun of
+    # `recompute` on the saved archive produces this same row.
+    samples.meta.update(run_meta(args, output_stats, target_version, provenance, fail))
+    output_stats = summarize(samples)
+
     print_final_stats(args, target_version, output_stats)
     o_s = create_output_stats(args, target_version, output_stats, fail, provenance)
     print(stats_header())
@@ -1252,21 +1941,85 @@ def finish_bench(args, output_stats, bench_stats, bench_start, target, m, tester
     # remove_target_containers()
     pre = run_name(args).replace(' ', '_')
     bench_prefix = f"{pre}_{args.tester_type}_{args.prefix_num}_{args.neighbor_num}"
-    create_bench_graphs(bench_stats, prefix=bench_prefix, results_dir=args.results_dir)
+    tracer.begin('graphs')
+    # the last in-run redraw must not land on top of the final graphs
+    bench_graphs.close()
+    graphs = bench_graph_jobs(samples.tick_rows(), prefix=bench_prefix, results_dir=args.results_dir)
+    if len(samples['threads']):
+        graphs.append(thread_graph_job(samples, prefix=bench_prefix, results_dir=args.results_dir))
+    graphs.append(ingest_graph_job(samples, prefix=bench_prefix, results_dir=args.results_dir))
+    if len(samples['canary']):
+        graphs.append(canary_graph_job(samples, prefix=bench_prefix, results_dir=args.results_dir))
+    render_jobs(graphs)
+    tracer.end('graphs')
+    tracer.begin('outputs')
     write_provenance(args, provenance, bench_prefix)
+    if any(c.command_stats.rows() for c in containers):
+        write_command_series(args, containers, bench_prefix)
+    if bmp is not None and bmp.state.events:
+        write_bmp_series(args, bmp, bench_prefix)
+    if folded:
+        write_profile(args, target_version, folded, bench_prefix)
+    samples.save(results_path(args.results_dir, bench_prefix + '.samples.npz'))
+    if len(samples['containers']):
+        write_container_series(args, samples, bench_prefix)
+    if len(samples['threads']):
+        write_thread_series(args, samples, bench_prefix)
+    if len(samples['harness']) or len(samples['latency']):
+        write_harness_series(args, samples, bench_prefix)
+    write_network_series(args, samples, bench_prefix)
+    if len(samples['canary']):
+        write_canary_series(args, samples, bench_prefix)
+    tracer.end('outputs')
+    tracer.write(results_path(args.results_dir, bench_prefix + '.trace.json'))
     return o_s
 
 
+# The bench arguments create_output_stats() reads, saved with the samples so
+# `recompute` can rebuild the row without the original command line.
+RUN_ARGS = ('target', 'label', 'version', 'neighbor_num', 'prefix_num', 'single_table',
+            'filter_test', 'tester_type')
+
+
+def run_meta(args, output_stats, target_version, provenance, fail):
+    '''The facts about a run that are not samples, for RunSamples.meta.'''
+    meta = {k: output_stats[k] for k in PASSTHROUGH if k in output_stats}
+    meta['elapsed'] = output_stats.get('elapsed')
+    if 'first_received_time' in output_stats:
+        meta['first_received'] = output_stats['first_received_time']
+    meta['date'] = datetime.date.today().strftime('%Y-%m-%d')
+    meta['fail'] = bool(fail)
+    meta['target_version'] = target_version
+    meta['provenance'] = provenance
+    meta['args'] = {k: getattr(args, k, None) for k in RUN_ARGS}
+    return meta
+
+
+def recompute(args):
+    '''Rebuild stats rows from saved .samples.npz archives, without re-running.'''
+    rows = []
+    for path in args.archives:
+        samples = RunSamples.load(path)
+        meta = samples.meta
+        rows.append(create_output_stats(argparse.Namespace(**meta['args']), meta['target_version'],
+                                        summarize(samples), meta['fail'], meta['provenance']))
+    if args.output:
+        write_batch_csv(args.output, rows)
+    else:
+        print(stats_header())
+        for row in rows:
+            print(','.join(map(str, row)))
+
 
 def print_final_stats(args, target_version, stats):
     
     print(f"{args.target}: {target_version}")
     print(f"Max cpu: {stats['max_cpu']:4.2f}, max mem: {mem_human(stats['max_mem'])}")
     print(f"Min %idle {stats['min_idle']}, Min mem free {mem_human(stats['min_free'])}")
-    print(f"Time since first received prefix: {stats['elapsed'].seconds - stats['first_received_time'].seconds}")
+    print(f"Time since first received prefix: {stats['elapsed'] - stats['first_received_time']:.3f}")
 
     print(f"total time: {stats['total_time']:.2f}s")
-    print(f"elasped time: {stats['elapsed'].seconds}s")
+    print(f"elasped time: {stats['elapsed']:.3f}s")
     print(f"tester errors: {stats['tester_errors']}")
     print(f"tester timeouts: {stats['tester_timeouts']}")
     print()
@@ -1278,16 +2031,19 @@ def stats_header():
     # The provenance columns are appended at the END on purpose:
     # create_batch_graphs() indexes this row positionally, so inserting a column
     # anywhere earlier silently shifts every graph and every existing CSV.
-    return("name, target, version, peers, prefixes per peer, required, received, monitor (s), elapsed (s), prefix received (s), testers (s), total time, max cpu %, max mem (GB), min idle%, min free mem (GB), flags, date, cores, Mem (GB), tester errors, tester timeouts, failed, MSG, filters, max foreign cpu %, target image, tester version, monitor version")
+    return("name, target, version, peers, prefixes per peer, required, received, monitor (s), elapsed (s), prefix received (s), testers (s), total time, max cpu %, max mem (GB), min idle%, min free mem (GB), flags, date, cores, Mem (GB), tester errors, tester timeouts, failed, MSG, filters, max foreign cpu %, max tester cpu %, max monitor cpu %, max cpu pressure %, max memory pressure %, max io pressure %, target threads, effective threads, parallel efficiency %, harness cpu %, harness peak rss (GB), busiest harness thread, harness thread cpu %, p99 queue latency (ms), max queue latency (ms), max anon mem (GB), max file mem (GB), max kernel mem (GB), max sock mem (GB), peak mem (GB), daemon rss (GB), daemon pss (GB), voluntary switches, involuntary switches, minor faults, major faults, cpu migrations, syscalls, max recv-q (bytes), max send-q (bytes), recv-q backlog (s), tcp retransmits, bridge drops, softnet drops, softnet squeezes, t50 (s), t90 (s), t99 (s), t100 (s), peak monitor rate (prefixes/s), mean monitor rate (prefixes/s), peak target rate (prefixes/s), mean target rate (prefixes/s), canary p50 (ms), canary p99 (ms), canary max (ms), canaries lost, cpu user (s), cpu system (s), cpu per prefix (us), cpu per update (us), convergence policy, tracker decided (s), evidence decided (s), target image, tester version, monitor version")
 
 
 def create_output_stats(args, target_version, stats, fail=False, provenance=None):
-    e = stats['elapsed'].seconds
-    f = stats['first_received_time'].seconds
-    d = datetime.date.today().strftime("%Y-%m-%d")
+    # fractional seconds, to the millisecond: at a 100ms sample interval whole
+    # seconds would throw away most of what the extra samples measured
+    e = round(stats['elapsed'], 3)
+    f = round(stats['first_received_time'], 3)
+    # a recomputed row keeps the date it was measured on
+    d = stats.get('date') or datetime.date.today().strftime("%Y-%m-%d")
     out = [run_name(args), args.target, target_version, str(args.neighbor_num), str(args.prefix_num)]
     out.extend([stats['required'], stats['recved']])
-    out.extend([stats['monitor_wait_time'], e, f , e-f, float(format(stats['total_time'], ".2f"))])
+    out.extend([stats['monitor_wait_time'], e, f , round(e-f, 3), float(format(stats['total_time'], ".2f"))])
     out.extend([round(stats['max_cpu']), float(format(stats['max_mem']/1024/1024/1024, ".3f"))])
     out.extend ([round(stats['min_idle']), float(format(stats['min_free']/1024/1024/1024, ".3f"))])
     out.extend(['-s' if args.single_table else '', d, str(stats['cores']), mem_human(stats['memory'])])
@@ -1301,6 +2057,81 @@ def create_output_stats(args, target_version, stats, fail=False, provenance=None
     # because bgperf's own load moves it too. Placed before the provenance
     # columns so those stay last, which test_provenance.py requires.
     out.extend([round(stats.get('max_foreign_cpu', 0))])
+    # What the load generators and the instrument cost, from their cgroups.
+    # Testers are summed: pinned near their core count, the run measured them
+    # rather than the target. Blank when there was no cgroup v2 to read.
+    out.extend([round(stats['max_tester_cpu']) if stats.get('max_tester_cpu') else '',
+                round(stats['max_monitor_cpu']) if stats.get('max_monitor_cpu') else ''])
+    # Worst share of a sample interval in which something on the machine was
+    # stalled waiting for CPU, memory or I/O ('some' in /proc/pressure). Idle
+    # can be low with nothing waiting; pressure is the part that costs time.
+    out.extend([round(stats[k], 1) if stats.get(k) is not None else ''
+                for k in ('max_psi_cpu', 'max_psi_memory', 'max_psi_io')])
+    # Did the daemon's threads work at the same time, or take turns? See
+    # threadstats.py. Blank for a target whose daemon was never sampled.
+    p = stats.get('parallelism')
+    effective = p.effective_threads if p else None
+    out.extend([p.busy_threads if p and p.busy_threads else '',
+                round(effective, 2) if effective is not None else '',
+                round(p.efficiency) if effective is not None else ''])
+    # What bgperf2 itself cost, and how far behind its sample queue fell; see
+    # selfstats.py. A busy harness thread or a latency near the sample
+    # interval means the instrument, not the target, set the pace.
+    # Blank for a row recomputed from an archive that predates them.
+    rss = stats.get('max_harness_rss')
+    thread_cpu = stats.get('max_harness_thread_cpu')
+    out.extend([round(stats['max_harness_cpu']) if stats.get('max_harness_cpu') is not None else '',
+                float(format(rss/1024/1024/1024, ".3f")) if rss is not None else '',
+                stats.get('busiest_harness_thread') or '',
+                round(thread_cpu) if thread_cpu is not None else ''])
+    out.extend([round(stats[k] * 1e3, 1) if stats.get(k) is not None else ''
+                for k in ('p99_queue_latency', 'max_queue_latency')])
+    # The target's memory by kind, its cgroup's high-water mark, and the
+    # daemon's own RSS and PSS at convergence; see cgroups.py. Compare memory
+    # per route across daemons on anon: max mem (GB) includes page cache.
+    out.extend([float(format(stats[k]/1024/1024/1024, ".3f")) if stats.get(k) is not None else ''
+                for k in ('max_mem_anon', 'max_mem_file', 'max_mem_kernel', 'max_mem_sock',
+                          'peak_mem', 'daemon_rss', 'daemon_pss')])
+    # How the daemon used its CPU over the convergence window; see
+    # swcounters.py. Blank for a counter that was not available, and syscalls
+    # are only counted by perf.
+    counters = stats.get('counters') or {}
+    out.extend([counters.get(k, '') for k in COUNTERS])
+    # The target's sockets and the bench network; see netstats.py. A Recv-Q
+    # backlog is the target not reading what the testers sent it; drops are
+    # the network losing it on the way.
+    out.extend([int(stats[k]) if stats.get(k) is not None else ''
+                for k in ('max_recv_q', 'max_send_q')])
+    out.extend([round(stats['recv_q_backlog'], 1) if stats.get('recv_q_backlog') is not None else ''])
+    out.extend([int(stats[k]) if stats.get(k) is not None else ''
+                for k in ('tcp_retransmits', 'bridge_drops', 'softnet_drops', 'softnet_squeezes')])
+    # The shape of convergence: when the monitor had 50/90/99/100% of the
+    # table, and how fast prefixes went in at the target and came out at the
+    # monitor; see convergence.py. Blank for a share never reached.
+    out.extend([round(stats[k], 3) if stats.get(k) is not None else ''
+                for k in ('t50', 't90', 't99', 't100')])
+    out.extend([round(stats[k]) if stats.get(k) is not None else ''
+                for k in ('peak_monitor_rate', 'mean_monitor_rate',
+                          'peak_target_rate', 'mean_target_rate')])
+    # How long one route took to cross the target while it converged; see
+    # canary.py. Blank for a run without --canary.
+    out.extend([round(stats[k] * 1e3, 1) if stats.get(k) is not None else ''
+                for k in ('canary_p50', 'canary_p99', 'canary_max')])
+    out.extend([stats['canaries_lost'] if stats.get('canaries_lost') is not None else ''])
+    # The target's CPU-seconds from the first prefix to convergence, and per
+    # prefix accepted and per UPDATE sent on to the monitor; see samples.py.
+    # Blank without the target's cgroup.
+    out.extend([round(stats[k], 3) if stats.get(k) is not None else ''
+                for k in ('cpu_user', 'cpu_system')])
+    out.extend([round(stats[k] * 1e6, 2) if stats.get(k) is not None else ''
+                for k in ('cpu_per_prefix', 'cpu_per_update')])
+    # Which convergence policy ended the run, and when each policy decided it
+    # was over, on the same samples; see convergence.py. Blank for a policy
+    # that had not decided when the run ended.
+    decided = stats.get('decided') or {}
+    out.extend([stats.get('convergence') or ''])
+    out.extend([round(decided[k], 3) if decided.get(k) is not None else ''
+                for k in ('tracker', 'evidence')])
     # Which builds produced this row. The target's own version already sits in
     # the 'version' column; these say which image it came from and which builds
     # generated and measured the load.
@@ -1326,25 +2157,10 @@ def results_path(results_dir, filename):
     return str(directory / filename)
 
 
-def create_ts_graph(bench_stats, stat_index=1, filename='ts.png', ylabel='%cpu', diviser=1,
-                    results_dir=DEFAULT_RESULTS_DIR):
-    plt.figure()
-    #bench_stats.pop(0)
+def bench_graph_jobs(bench_stats, prefix='ts_data', results_dir=DEFAULT_RESULTS_DIR):
+    '''The run's time-series graphs as render jobs; see render.py.'''
     data = np.array(bench_stats)
-    plt.plot(data[:,0], data[:,stat_index]/diviser)
-    
-    #don't want to see 0 element of data, not an accurate measure of what's happening
-    #plt.xlim([1, len(data)])
-    plt.ylabel(ylabel)
-    plt.xlabel('elapsed seconds')
-    plt.show()
-    plt.savefig(results_path(results_dir, filename))
-    plt.close()
-    plt.cla()
-    plt.clf()
-
-
-def create_bench_graphs(bench_stats, prefix='ts_data', results_dir=DEFAULT_RESULTS_DIR):
+    jobs = []
     for stat_index, suffix, ylabel, diviser in [
         (1, 'cpu', '%cpu', 1),
         (2, 'mem_used', 'GB', 1024*1024*1024),
@@ -1353,11 +2169,57 @@ def create_bench_graphs(bench_stats, prefix='ts_data', results_dir=DEFAULT_RESUL
         (5, 'machine_idle', '%', 1),
         (6, 'free_mem', 'GB', 1024*1024*1024),
     ]:
-        create_ts_graph(bench_stats, stat_index=stat_index, filename=f"{prefix}_{suffix}.png",
-                        ylabel=ylabel, diviser=diviser, results_dir=results_dir)
+        jobs.append(('series', {'path': results_path(results_dir, f"{prefix}_{suffix}.png"),
+                                'x': data[:, 0], 'y': data[:, stat_index] / diviser,
+                                'ylabel': ylabel}))
+    return jobs
+
 
-def create_graph(stats, test_name='total time', stat_index=8, test_file='total_time.png', ylabel='seconds',
-                 results_dir=DEFAULT_RESULTS_DIR):
+def create_bench_graphs(bench_stats, prefix='ts_data', results_dir=DEFAULT_RESULTS_DIR):
+    render_jobs(bench_graph_jobs(bench_stats, prefix=prefix, results_dir=results_dir))
+
+
+def thread_graph_job(samples, prefix='ts_data', results_dir=DEFAULT_RESULTS_DIR, limit=8):
+    '''CPU of the target's busiest threads over the run, one line each.'''
+    threads = samples['threads'].until(samples.meta.get('elapsed'))
+    tids = np.unique(threads['tid'])
+    busiest = sorted(tids, key=lambda tid: -threads['cpu'][threads['tid'] == tid].sum())[:limit]
+    lines = []
+    for tid in busiest:
+        rows = threads['tid'] == tid
+        name = samples.thread_names[threads['name'][rows][0]]
+        lines.append((f"{name} ({tid})", threads['t'][rows], threads['cpu'][rows]))
+    return ('lines', {'path': results_path(results_dir, f"{prefix}_threads.png"),
+                      'lines': lines, 'ylabel': '%cpu'})
+
+
+def ingest_graph_job(samples, prefix='ts_data', results_dir=DEFAULT_RESULTS_DIR):
+    '''Prefixes per second accepted at the target and received at the monitor.'''
+    end = samples.meta.get('elapsed')
+    ticks = samples['ticks'].until(end)
+    accepted = samples['target_accepted'].until(end)
+    lines = [('monitor received',) + ingest_rates(ticks['t'], ticks['recved'])]
+    if len(accepted):
+        lines.append(('target accepted',) + ingest_rates(accepted['t'], accepted['accepted']))
+    return ('lines', {'path': results_path(results_dir, f"{prefix}_ingest_rate.png"),
+                      'lines': lines, 'ylabel': 'prefixes/s'})
+
+
+def canary_graph_job(samples, prefix='ts_data', results_dir=DEFAULT_RESULTS_DIR):
+    '''Each marker's trip through the target, against when it was sent.'''
+    c = samples['canary'].until(None)
+    arrived = ~np.isnan(c['latency'])
+    return ('series', {'path': results_path(results_dir, f"{prefix}_canary.png"),
+                       'x': c['t'][arrived], 'y': c['latency'][arrived] * 1e3,
+                       'ylabel': 'canary latency (ms)'})
+
+
+def create_thread_graph(samples, prefix='ts_data', results_dir=DEFAULT_RESULTS_DIR, limit=8):
+    render_jobs([thread_graph_job(samples, prefix=prefix, results_dir=results_dir, limit=limit)])
+
+
+def batch_graph_job(stats, test_name='total time', stat_index=8, test_file='total_time.png', ylabel='seconds',
+                    results_dir=DEFAULT_RESULTS_DIR):
     labels = {}
     data = defaultdict(list)
 
@@ -1371,6 +2233,10 @@ def create_graph(stats, test_name='total time', stat_index=8, test_file='total_t
 
             if len(stat) > 23 and stat[22] == 'FAILED':# this means that it failed for some reason
                 data[key].append(0)
+            elif stat_index >= len(stat) or stat[stat_index] == '':
+                # a measurement this run did not have, or an older, shorter
+                # row written before the column existed
+                data[key].append(0)
             else:
                 data[key].append(float(stat[stat_index]))
     except IndexError as e:
@@ -1379,22 +2245,8 @@ def create_graph(stats, test_name='total time', stat_index=8, test_file='total_t
         print(f"stat_index {stat_index}")
         exit(-1)
 
-    x = np.arange(len(labels))
-  
-    bars = len(data)
-    width = 0.7 / bars
-    plt.figure()
-    for i, d in enumerate(data):
-        plt.bar(x -0.2+i*width, data[d], width=width, label=d)
-
-    plt.ylabel(ylabel)
-    #plt.xlabel('neighbors_prefixes')
-    plt.title(test_name)
-    plt.xticks(x,labels.keys())
-    plt.legend()
-
-    plt.show()
-    plt.savefig(results_path(results_dir, test_file))
+    return ('bars', {'path': results_path(results_dir, test_file), 'title': test_name,
+                     'labels': list(labels.keys()), 'data': dict(data), 'ylabel': ylabel})
 
 class BatchLoader(yaml.SafeLoader):
     '''YAML loader that leaves version-shaped scalars alone.
@@ -1436,7 +2288,7 @@ def expand_target_versions(targets):
                 elif len(versions) > 1:
                     # An explicit label on a multi-version entry would name every
                     # run the same thing: duplicate rows in the CSV, per-run PNGs
-                    # overwriting each other, and create_graph() raising a shape
+                    # overwriting each other, and batch_graph_job() raising a shape
                     # mismatch because it de-duplicates labels but not data.
                     entry['label'] = '{0} {1}'.format(t['label'], v)
             expanded.append(entry)
@@ -1495,6 +2347,9 @@ def batch(args):
             os.unlink(progress_path)
         results = []
         cell_ordinal = 0
+        cells = (len(test['neighbors']) * len(test['prefixes']) * len(test['filter_test'])
+                 * len(targets))
+        live_metrics.set_progress(test['name'], len(completed), cells)
         for n in test['neighbors']:
             for p in test['prefixes']:
                 for filter in test['filter_test']:
@@ -1524,7 +2379,10 @@ def batch(args):
                         for field in ['single_table', 'docker_network_name', 'repeat', 'file', 'target_local_address',
                                         'label', 'target_local_address', 'monitor_local_address', 'target_router_id',
                                         'monitor_router_id', 'target_config_file', 'filter_type','mrt_injector', 'mrt_file',
-                                        'tester_type', 'license_file', 'version', 'threads']:
+                                        'tester_type', 'license_file', 'version', 'threads', 'monitor',
+                                        'sample_interval', 'command_channel', 'frr_eor',
+                                        'neighbor_source', 'profile', 'canary', 'convergence',
+                                        'confidence']:
                             setattr(a, field, t[field]) if field in t else setattr(a, field, None)
 
                         for field in ['as_path_list_num', 'prefix_list_num', 'community_list_num', 'ext_community_list_num']:
@@ -1537,6 +2395,7 @@ def batch(args):
                         # the process dies later, --resume can skip every cell
                         # whose result made it to disk.
                         write_batch_progress(progress_path, completed)
+                        live_metrics.set_progress(test['name'], len(completed), cells)
                         write_batch_csv(
                             results_path(args.results_dir, f"{test['name']}.csv"), results)
 
@@ -1575,13 +2434,28 @@ def batch_cell_description(neighbors, prefixes, filter_test, target):
         target_name, neighbors, prefixes, filter_test)
 
 
+# Version 1 cells are rows from before the columns between 'max foreign cpu %'
+# and the three provenance columns at the end were added.
+BATCH_PROGRESS_SCHEMA = 2
+V1_ROW_HEAD = 26
+
+
+def upgrade_batch_row(stat):
+    '''A version 1 row, with blanks where the columns it predates now sit.'''
+    width = len(stats_header().split(','))
+    return stat[:V1_ROW_HEAD] + [''] * (width - len(stat)) + stat[V1_ROW_HEAD:]
+
+
 def load_batch_progress(path):
     if not os.path.exists(path):
         return {}
     with open(path, 'r') as f:
         document = json.load(f)
-    if document.get('schema_version') != 1 or not isinstance(document.get('cells'), dict):
+    version = document.get('schema_version')
+    if version not in (1, BATCH_PROGRESS_SCHEMA) or not isinstance(document.get('cells'), dict):
         raise ValueError('unsupported or malformed batch progress file: {0}'.format(path))
+    if version == 1:
+        return {cell: upgrade_batch_row(stat) for cell, stat in document['cells'].items()}
     return document['cells']
 
 
@@ -1600,7 +2474,7 @@ def atomic_write(path, write):
 
 def write_batch_progress(path, completed):
     def write(f):
-        json.dump({'schema_version': 1, 'cells': completed}, f,
+        json.dump({'schema_version': BATCH_PROGRESS_SCHEMA, 'cells': completed}, f,
                   indent=2, sort_keys=True)
         f.write('\n')
     atomic_write(path, write)
@@ -1613,9 +2487,15 @@ def write_batch_csv(path, results):
             f.write(','.join(map(str, stat)) + '\n')
     atomic_write(path, write)
 
+def column_index(name):
+    '''Position of a column in the row, by its name in stats_header().'''
+    return [c.strip() for c in stats_header().split(',')].index(name)
+
+
 def create_batch_graphs(results, name, results_dir=DEFAULT_RESULTS_DIR):
     # stat_index values are positions in the row built by create_output_stats();
     # changing that row's layout silently mislabels every graph below.
+    jobs = []
     for test_name, stat_index, suffix, ylabel in [
         ('total time', 11, 'total_time', 'seconds'),
         ('elapsed', 8, 'elapsed', 'seconds'),
@@ -1630,10 +2510,27 @@ def create_batch_graphs(results, name, results_dir=DEFAULT_RESULTS_DIR):
         ('min free mem', 15, 'min_free', 'GB'),
         ('tester errors', 20, 'tester_error', 'errors'),
         ('prefixes at monitor', 6, 'monitor_prefixes', 'seconds'),
+        # the later columns by name, so they follow the row as it grows
+        ('t50', column_index('t50 (s)'), 't50', 'seconds'),
+        ('t90', column_index('t90 (s)'), 't90', 'seconds'),
+        ('t99', column_index('t99 (s)'), 't99', 'seconds'),
+        ('t100', column_index('t100 (s)'), 't100', 'seconds'),
+        ('peak monitor rate', column_index('peak monitor rate (prefixes/s)'),
+         'peak_monitor_rate', 'prefixes/s'),
+        ('mean monitor rate', column_index('mean monitor rate (prefixes/s)'),
+         'mean_monitor_rate', 'prefixes/s'),
+        ('peak target rate', column_index('peak target rate (prefixes/s)'),
+         'peak_target_rate', 'prefixes/s'),
+        ('mean target rate', column_index('mean target rate (prefixes/s)'),
+         'mean_target_rate', 'prefixes/s'),
+        ('cpu per prefix', column_index('cpu per prefix (us)'), 'cpu_per_prefix', 'CPU µs'),
+        ('cpu per update', column_index('cpu per update (us)'), 'cpu_per_update', 'CPU µs'),
     ]:
-        create_graph(results, test_name=test_name, stat_index=stat_index,
-                     test_file=f"bgperf_{name}_{suffix}.png", ylabel=ylabel,
-                     results_dir=results_dir)
+        jobs.append(batch_graph_job(results, test_name=test_name, stat_index=stat_index,
+                                    test_file=f"bgperf_{name}_{suffix}.png", ylabel=ylabel,
+                                    results_dir=results_dir))
+    # only the charts whose numbers changed since they were last drawn
+    render_jobs(jobs, results_dir=results_dir or DEFAULT_RESULTS_DIR)
 
 def mem_human(v):
     if v > 1024 * 1024 * 1024:
@@ -1921,6 +2818,14 @@ def create_args_parser(main=True):
                             help='monitor\' router ID; default: same as --monitor-local-address')
         parser.add_argument('--filter_test', choices=['transit', 'ixp'], default=None)
 
+    def add_metrics_args(parser):
+        parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                            help='serve the running cell\'s metrics as OpenMetrics on '
+                                 'http://<host>:PORT/metrics')
+        parser.add_argument('--metrics-textfile', type=str, default=None, metavar='PATH',
+                            help='rewrite the running cell\'s metrics to PATH every sample, '
+                                 'for node_exporter\'s textfile collector')
+
     parser_bench = s.add_parser('bench', help='run benchmarks')
     parser_bench.add_argument('-t', '--target', choices=sorted(TARGET_CLASSES), default='bird')
     parser_bench.add_argument('-v', '--version', type=str,
@@ -1940,11 +2845,50 @@ def create_args_parser(main=True):
                               'the Docker network name in case of tests of '
                               'remote targets.')
     parser_bench.add_argument('-r', '--repeat', action='store_true', help='use existing tester/monitor container')
+    parser_bench.add_argument('--monitor', choices=['gobgp', 'native'], default='gobgp',
+                              help='gobgp: a GoBGP container polled once a second; native: a BGP '
+                                   'session held by bgperf2 itself, which timestamps every UPDATE '
+                                   'as it arrives. default: gobgp')
     parser_bench.add_argument('-f', '--file', metavar='CONFIG_FILE')
     parser_bench.add_argument('-o', '--output', metavar='STAT_FILE')
     parser_bench.add_argument('--results-dir', default=DEFAULT_RESULTS_DIR,
                               help='directory for generated graphs and CSVs; '
                                    'default: {}'.format(DEFAULT_RESULTS_DIR))
+    parser_bench.add_argument('--command-channel', action='store_true',
+                              help='run commands in the target, testers and monitor through one '
+                                   'long-lived shell per container instead of a docker exec each')
+    add_metrics_args(parser_bench)
+    parser_bench.add_argument('--neighbor-source', choices=('poll', 'bmp'), default=None,
+                              help="how the target's peers are followed: 'poll' its CLI every "
+                                   "sample, or 'bmp' have it export BMP to bgperf2. default: poll")
+    parser_bench.add_argument('--frr-eor', choices=FRRoutingTarget.EOR_METHODS, default=None,
+                              help="how FRR's End-of-RIB is found: 'json' asks bgpd per peer, "
+                                   "'log' tails bgpd.log at debug level. default: json")
+    parser_bench.add_argument('--sample-interval', type=sample_interval_arg, default=None,
+                              metavar='[SOURCE=]SECONDS[,...]',
+                              help='seconds between samples: a number for every source, or '
+                                   'source=seconds pairs, from {0}; at least {1}s. '
+                                   'default: {2}'.format(
+                                       ', '.join(SAMPLE_INTERVALS), MIN_SAMPLE_INTERVAL,
+                                       ','.join('{0}={1:g}'.format(k, v)
+                                                for k, v in SAMPLE_INTERVALS.items())))
+    parser_bench.add_argument('--canary', type=float, nargs='?', const=CANARY_RATE, default=None,
+                              metavar='PER_SECOND',
+                              help='announce marker prefixes from 198.18.0.0/15 through the target '
+                                   'at this rate for the whole run and report how long each took '
+                                   'to reach the monitor; needs --monitor native. '
+                                   'default rate: {0}/s'.format(CANARY_RATE))
+    parser_bench.add_argument('--convergence', choices=sorted(POLICIES), default=None,
+                              help="when a run is done: 'tracker' once the count has held for a "
+                                   "fixed 5-20s, 'evidence' once EoR, the target's CPU and the "
+                                   "count together say so with --confidence. Both are evaluated "
+                                   "and their decision times recorded. default: tracker")
+    parser_bench.add_argument('--confidence', type=confidence_arg, default=None,
+                              help='for --convergence evidence, between 0 and 1. '
+                                   'default: {0}'.format(DEFAULT_CONFIDENCE))
+    parser_bench.add_argument('--profile', action='store_true',
+                              help='perf record the target daemon while it converges, and write '
+                                   'its folded stacks and a flamegraph to the results directory')
     add_gen_conf_args(parser_bench)
     parser_bench.set_defaults(func=bench)
 
@@ -1953,6 +2897,23 @@ def create_args_parser(main=True):
     add_gen_conf_args(parser_config)
     parser_config.set_defaults(func=config)
 
+    parser_recompute = s.add_parser('recompute',
+                                    help='rebuild stats rows from saved .samples.npz archives')
+    parser_recompute.add_argument('archives', nargs='+', metavar='SAMPLES_NPZ')
+    parser_recompute.add_argument('-o', '--output', metavar='CSV',
+                                  help='write the rows here instead of printing them')
+    parser_recompute.set_defaults(func=recompute)
+
+    parser_profile_diff = s.add_parser('profile-diff',
+                                       help="compare two runs' folded stacks from bench --profile")
+    parser_profile_diff.add_argument('before', metavar='BEFORE_FOLDED')
+    parser_profile_diff.add_argument('after', metavar='AFTER_FOLDED')
+    parser_profile_diff.add_argument('-o', '--output', metavar='SVG',
+                                     help='write a differential flamegraph of AFTER here')
+    parser_profile_diff.add_argument('-n', '--limit', type=int, default=20,
+                                     help='functions to list; default: 20')
+    parser_profile_diff.set_defaults(func=profile_diff)
+
     parser_batch = s.add_parser('batch', help='run batch benchmarks')
     parser_batch.add_argument('-c', '--batch_config', type=str, help='batch config file')
     parser_batch.add_argument('--results-dir', default=DEFAULT_RESULTS_DIR,
@@ -1960,6 +2921,7 @@ def create_args_parser(main=True):
                                    'default: {}'.format(DEFAULT_RESULTS_DIR))
     parser_batch.add_argument('--resume', action='store_true',
                               help='resume a partial batch by skipping cells with durable results')
+    add_metrics_args(parser_batch)
     parser_batch.set_defaults(func=batch)
 
     return parser
@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from base import *
-import textfsm
+from birdctl import BirdControl, neighbor_counts
 
 class BIRD(Container):
 
@@ -87,8 +87,17 @@ RUN cd bird && autoreconf -i && ./configure {configure_extra} && make && make in
 class BIRDTarget(BIRD, Target):
 
     CONTAINER_NAME = 'bgperf_bird_target'
+    DAEMON_PROCESSES = ('bird',)
     CONFIG_FILE_NAME = 'bird.conf'
     DYNAMIC_NEIGHBORS = True
+    # In the bind-mounted config directory rather than BIRD's default under
+    # /run, so bgperf2 can reach it from the host; see birdctl.py.
+    CONTROL_SOCKET = 'bird.ctl'
+    # the open BirdControl, once there is a socket to connect to
+    control = None
+    # BIRD 3's bmp protocol; a BIRD 2 built without it rejects the config, so
+    # bmp_supported() checks the build before the config asks for it
+    BMP_SUPPORTED = True
 
     def write_config(self):
         # BIRD 3 is the multi-threaded rewrite, but it starts a single worker
@@ -218,6 +227,8 @@ return true;
                             f.write(gen_ext_community_filter(n, match))
                         match_info.append((match['type'], n))
                     f.write(gen_filter(k, match_info))
+            if self.bmp is not None:
+                f.write(self.get_bmp_config())
             if self.DYNAMIC_NEIGHBORS:
                 config = self.get_dynamic_neighbor_config()
                 f.write(config)
@@ -245,6 +256,18 @@ return true;
         return config
 
 
+    def bmp_supported(self):
+        m = re.match(r'(\d+)\.', self.version_string())
+        return m is not None and int(m.group(1)) >= 3
+
+    def get_bmp_config(self):
+        return '''protocol bmp {{
+    station address ip {0} port {1};
+    monitoring rib in pre_policy;
+    monitoring rib in post_policy;
+}}
+'''.format(self.bmp.address, self.bmp.port)
+
     def get_filter_test_config(self): 
         with open(REPO_ROOT / 'filters' / 'bird.conf') as file:
             return file.read()
@@ -253,25 +276,24 @@ return true;
         return '\n'.join(
             ['#!/bin/bash',
              'ulimit -n 65536',
-             'bird -c {guest_dir}/{config_file_name} -d > {guest_dir}/bird.log 2>&1']
+             'bird -c {guest_dir}/{config_file_name} -s {guest_dir}/{control_socket} -d > {guest_dir}/bird.log 2>&1']
         ).format(
             guest_dir=self.guest_dir,
-            config_file_name=self.CONFIG_FILE_NAME)
+            config_file_name=self.CONFIG_FILE_NAME,
+            control_socket=self.CONTROL_SOCKET)
 
     def get_neighbors_state(self):
-        neighbors_accepted = {}
-        neighbors_received = {}
-        neighbor_received_output = self.local("birdc 'show protocols all'").decode('utf-8')
-        
-        with open(REPO_ROOT / 'bird.tfsm') as template:
-            fsm = textfsm.TextFSM(template)
-            result = fsm.ParseText(neighbor_received_output)
-
-        for r in result:
-            if r[0] == '' :
-                continue
-            else:
-                neighbors_accepted[r[0]] = int(r[2]) if r[2] != '' else 0
-                neighbors_received[r[0]] = int(r[1]) if r[1] != '' else 0
-
-        return neighbors_received, neighbors_accepted
+        # Straight from the control socket when it can be reached from here;
+        # through birdc in the container when it cannot -- bgperf2 without
+        # permission on the socket, or before BIRD has created it.
+        path = os.path.join(self.host_dir, self.CONTROL_SOCKET)
+        if os.path.exists(path):
+            if self.control is None:
+                self.control = BirdControl(path)
+            try:
+                return self.control.neighbor_counts()
+            except Exception:
+                pass
+        output = self.observe("birdc -s {0}/{1} 'show protocols all'".format(
+            self.GUEST_DIR, self.CONTROL_SOCKET))
+        return neighbor_counts(output.decode('utf-8').splitlines())
@@ -0,0 +1,145 @@
+# BIRD's neighbor counts, read from its control socket rather than via birdc.
+#
+# BIRDTarget.get_neighbors_state() used to exec `birdc 'show protocols all'`
+# into the container every sample and parse the text with a TextFSM template
+# it re-read and recompiled on every call. The output is ~50 lines per
+# protocol, so at 500 dynamic peers each poll was a fork, an exec and tens of
+# thousands of lines through a general-purpose state machine, on the machine
+# whose CPU is being measured.
+#
+# birdc is only a front end for the control socket: it writes a command line
+# and prints the reply. The target now puts that socket in its bind-mounted
+# config directory (`bird -s`), so bgperf2 can hold one connection to it from
+# the host and read the reply as it streams in.
+#
+# The reply format: every line starts with a four-digit code and '-' while
+# more follows, or a space on the last line; a line starting with a space
+# continues the previous code. 0000 is success, and codes from 8000 up are
+# errors. The text after the code is exactly what birdc prints, so the same
+# parser reads both, which is what the birdc fallback relies on.
+#
+# Kept free of Docker so the test suite can cover it.
+
+import re
+import socket
+
+# Reply codes from here up are errors (BIRD's doc/reply_codes).
+FIRST_ERROR_CODE = 8000
+
+_CODED = re.compile(rb'^(\d{4})([ -])(.*)$')
+_NEIGHBOR = re.compile(r'^\s+Neighbor address:\s+(\d+\.\d+\.\d+\.\d+)')
+_IMPORT_UPDATES = re.compile(r'^\s+Import updates:\s+(\d+)\s+\S+\s+\S+\s+\S+\s+(\d+)')
+
+
+class BirdControlError(Exception):
+    pass
+
+
+def reply_lines(lines):
+    '''(code, text) per line of one reply, stopping after its last line.
+
+    `lines` yields raw lines of bytes as read from the socket. Continuation
+    lines, which carry no code, are given the code of the line they continue.
+    '''
+    code = None
+    for raw in lines:
+        raw = raw.rstrip(b'\r\n')
+        m = _CODED.match(raw)
+        if m:
+            code = int(m.group(1))
+            text = m.group(3).decode('utf-8', 'replace')
+            if code >= FIRST_ERROR_CODE:
+                raise BirdControlError('BIRD replied {0:04d} {1}'.format(code, text))
+            yield code, text
+            if m.group(2) == b' ':
+                return
+        elif raw.startswith(b' '):
+            yield code, raw[1:].decode('utf-8', 'replace')
+        else:
+            raise BirdControlError('unexpected reply line {0!r}'.format(raw))
+    raise BirdControlError('connection closed mid-reply')
+
+
+def neighbor_counts(lines):
+    '''({neighbor: received}, {neighbor: accepted}) from `show protocols all` text.
+
+    Reads the text birdc prints or the text of reply_lines(), one line at a
+    time. A protocol starts at every unindented line; one with a neighbor
+    address is a BGP session, and its ipv4 channel's Import updates line holds
+    the counts. Device, Direct, Kernel and the passive template for dynamic
+    peers have no neighbor address and are left out.
+    '''
+    received = {}
+    accepted = {}
+    neighbor = counts = None
+
+    def finish():
+        if neighbor is not None:
+            received[neighbor], accepted[neighbor] = counts or (0, 0)
+
+    for line in lines:
+        if line and not line[0].isspace():
+            finish()
+            neighbor = counts = None
+            continue
+        m = _NEIGHBOR.match(line)
+        if m:
+            neighbor = m.group(1)
+            continue
+        if counts is None:
+            m = _IMPORT_UPDATES.match(line)
+            if m:
+                counts = (int(m.group(1)), int(m.group(2)))
+    finish()
+    return received, accepted
+
+
+class BirdControl(object):
+    '''One connection to a BIRD control socket, kept open across commands.'''
+
+    def __init__(self, path, timeout=10):
+        self.path = path
+        self.timeout = timeout
+        self.sock = None
+        self.file = None
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+            self.sock, self.file = sock, sock.makefile('rb')
+            # the greeting, '0001 BIRD 2.17.1 ready.'
+            for _ in reply_lines(self.file):
+                pass
+        except Exception:
+            self.close()
+            sock.close()
+            raise
+
+    def command(self, text):
+        '''The reply to one command, yielded line by line as it arrives.
+
+        Read it to the end: a reply left half-read would be taken for the
+        start of the next one, so anything that interrupts it closes the
+        connection instead.
+        '''
+        if self.sock is None:
+            self.connect()
+        try:
+            self.sock.sendall(text.encode('utf-8') + b'\n')
+            for line in reply_lines(self.file):
+                yield line
+        except BaseException:
+            self.close()
+            raise
+
+    def neighbor_counts(self):
+        return neighbor_counts(text for _, text in self.command('show protocols all'))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = self.file = None
@@ -0,0 +1,330 @@
+# A BMP (RFC 7854) station inside bgperf2, fed by the target itself.
+#
+# Every target's get_neighbors_state() learns how far each peer has got by
+# polling: an exec of vtysh, birdc, bgpctl or gobgp into the target every
+# sample, or a log tail for FRR's End-of-RIB -- one mechanism per daemon, each
+# paid for on the machine being measured, and none of them seeing more than
+# once a second. FRR, GoBGP and BIRD can all export BMP instead. With
+# --neighbor-source bmp the target is configured to connect to this collector,
+# which runs on the host beside the native monitor, and reports as it goes:
+#
+#   Peer Up / Down      a session coming up or going down, when it happens
+#   Route Monitoring    each UPDATE the target received, before its import
+#                       policy (received) and after it (accepted)
+#   Statistics Report   the daemon's own Adj-RIB-In and Loc-RIB route counts
+#
+# A pre-policy UPDATE with nothing in it is the peer's End-of-RIB, stamped
+# with the moment it arrived. The station runs on the box being measured, so
+# it keeps counters, not tables: a copy of every peer's routes would be
+# gigabytes of Python ints on a 10 x 1M run. Route Monitoring is only counted
+# -- announced less withdrawn -- and the daemon's own Statistics Report
+# counts win as soon as they arrive, since a counter cannot tell a
+# re-advertisement from a new prefix. Only IPv4 unicast is read, like
+# everything else in bgperf2.
+#
+# The message parsing is kept free of sockets so the test suite can cover it;
+# BMPCollector is the asyncio server around it.
+
+import asyncio
+import struct
+import threading
+import time
+
+import netaddr
+
+from bgpwire import BGPError, HEADER_LEN, UPDATE, count_update, parse_header
+
+BMP_VERSION = 3
+# No port is assigned to BMP; this is the one most collectors default to.
+BMP_PORT = 11019
+
+COMMON_HEADER = struct.Struct('!BIB')
+PER_PEER_HEADER = struct.Struct('!BB8s16sI4sII')
+
+ROUTE_MONITORING = 0
+STATISTICS_REPORT = 1
+PEER_DOWN = 2
+PEER_UP = 3
+INITIATION = 4
+TERMINATION = 5
+
+# Per-peer header flags
+PEER_FLAG_IPV6 = 0x80
+PEER_FLAG_POST_POLICY = 0x40
+
+# Statistics Report counters read here (RFC 7854 4.8)
+STAT_ADJ_RIB_IN = 7
+STAT_LOC_RIB = 8
+STAT_ADJ_RIB_IN_AFI = 9
+STAT_LOC_RIB_AFI = 10
+
+AFI_IPV4 = 1
+SAFI_UNICAST = 1
+
+# Messages larger than this are taken for a broken stream, not a big UPDATE.
+MAX_MESSAGE_LEN = 1 << 20
+
+
+class BMPError(Exception):
+    pass
+
+
+def parse_common_header(header):
+    '''(length, type) from the 6-byte common header.'''
+    version, length, msg_type = COMMON_HEADER.unpack(header)
+    if version != BMP_VERSION:
+        raise BMPError('unsupported BMP version {0}'.format(version))
+    if length < COMMON_HEADER.size or length > MAX_MESSAGE_LEN:
+        raise BMPError('bad BMP message length {0}'.format(length))
+    return length, msg_type
+
+
+def parse_per_peer(body):
+    '''(peer address, post-policy?, rest of the message) from a per-peer message.'''
+    if len(body) < PER_PEER_HEADER.size:
+        raise BMPError('short per-peer header')
+    _, flags, _, address, _, _, _, _ = PER_PEER_HEADER.unpack_from(body)
+    if flags & PEER_FLAG_IPV6:
+        peer = str(netaddr.IPAddress(int.from_bytes(address, 'big'), 6))
+    else:
+        peer = str(netaddr.IPAddress(int.from_bytes(address[12:], 'big'), 4))
+    return peer, bool(flags & PEER_FLAG_POST_POLICY), body[PER_PEER_HEADER.size:]
+
+
+def parse_statistics(data):
+    '''{counter type: value} for the counters above, from a Statistics Report.
+
+    The per-AFI counters are only taken for IPv4 unicast and, where a daemon
+    sends both, win over the totals.
+    '''
+    if len(data) < 4:
+        raise BMPError('short Statistics Report')
+    count = struct.unpack_from('!I', data)[0]
+    at = 4
+    stats = {}
+    for _ in range(count):
+        if at + 4 > len(data):
+            raise BMPError('truncated Statistics Report')
+        stat_type, length = struct.unpack_from('!HH', data, at)
+        value = data[at + 4:at + 4 + length]
+        at += 4 + length
+        if stat_type in (STAT_ADJ_RIB_IN, STAT_LOC_RIB) and length == 8:
+            stats.setdefault(stat_type, struct.unpack('!Q', value)[0])
+        elif stat_type in (STAT_ADJ_RIB_IN_AFI, STAT_LOC_RIB_AFI) and length == 11:
+            afi, safi, gauge = struct.unpack('!HBQ', value)
+            if (afi, safi) == (AFI_IPV4, SAFI_UNICAST):
+                stats[stat_type - 2] = gauge
+    return stats
+
+
+def encode_message(msg_type, body=b''):
+    return COMMON_HEADER.pack(BMP_VERSION, COMMON_HEADER.size + len(body), msg_type) + body
+
+
+def encode_per_peer(peer, post_policy=False, asn=65000, bgp_id='0.0.0.0'):
+    '''A per-peer header for an IPv4 peer.'''
+    return PER_PEER_HEADER.pack(0, PEER_FLAG_POST_POLICY if post_policy else 0, b'\x00' * 8,
+                                b'\x00' * 12 + netaddr.IPAddress(peer).packed, asn,
+                                netaddr.IPAddress(bgp_id).packed, 0, 0)
+
+
+class PeerState(object):
+    '''What the target has told us about one of its peers.'''
+
+    def __init__(self):
+        self.up = False
+        # Route Monitoring, announced less withdrawn, before and after policy
+        self.pre = 0
+        self.post = 0
+        self.post_updates = 0
+        self.stats = {}
+        self.end_of_rib = None       # monotonic_ns it arrived, once it has
+
+    def count(self, post_policy, withdrawn, nlri):
+        if post_policy:
+            self.post = max(self.post + nlri - withdrawn, 0)
+            self.post_updates += 1
+        else:
+            self.pre = max(self.pre + nlri - withdrawn, 0)
+
+    def clear(self):
+        '''The session went down, and every route learned over it with it.'''
+        self.pre = self.post = self.post_updates = 0
+        self.stats = {}
+        self.end_of_rib = None
+
+    @property
+    def received(self):
+        return self.stats.get(STAT_ADJ_RIB_IN, self.pre)
+
+    @property
+    def accepted(self):
+        '''Loc-RIB if the daemon reports it, then post-policy, then received.
+
+        bgperf2's import policies accept everything unless a filter test is
+        running, so the fallback only differs from the truth under one.
+        '''
+        if STAT_LOC_RIB in self.stats:
+            return self.stats[STAT_LOC_RIB]
+        if self.post_updates:
+            return self.post
+        return self.received
+
+
+class BMPState(object):
+    '''Every peer of one target, as its BMP messages describe them.
+
+    `events` records, with its arrival time, every session change and
+    End-of-RIB, and every `sample()` -- the per-peer ingest curves.
+    '''
+
+    def __init__(self):
+        self.peers = {}
+        self.events = []             # (monotonic_ns, peer, event, received, accepted)
+        self.initiated = False
+        self.messages = 0
+
+    def peer(self, address):
+        if address not in self.peers:
+            self.peers[address] = PeerState()
+        return self.peers[address]
+
+    def _event(self, now, address, event):
+        p = self.peers[address]
+        self.events.append((now, address, event, p.received, p.accepted))
+
+    def feed(self, msg_type, body, now):
+        '''Fold in one message, with the time it arrived.'''
+        self.messages += 1
+        if msg_type == INITIATION:
+            self.initiated = True
+            return
+        if msg_type not in (ROUTE_MONITORING, STATISTICS_REPORT, PEER_DOWN, PEER_UP):
+            return
+        address, post_policy, rest = parse_per_peer(body)
+        p = self.peer(address)
+        if msg_type == PEER_UP:
+            p.up = True
+            self._event(now, address, 'up')
+        elif msg_type == PEER_DOWN:
+            # like any BGP speaker, the target forgets what the session taught it
+            p.up = False
+            p.clear()
+            self._event(now, address, 'down')
+        elif msg_type == STATISTICS_REPORT:
+            p.stats.update(parse_statistics(rest))
+        else:
+            if len(rest) < HEADER_LEN:
+                raise BMPError('short Route Monitoring message')
+            try:
+                length, bgp_type = parse_header(rest[:HEADER_LEN])
+            except BGPError as e:
+                raise BMPError(str(e))
+            if bgp_type != UPDATE:
+                return
+            withdrawn, nlri, eor = count_update(rest[HEADER_LEN:length])
+            p.count(post_policy, withdrawn, nlri)
+            if eor and not post_policy and p.end_of_rib is None:
+                p.end_of_rib = now
+                self._event(now, address, 'eor')
+
+    def sample(self, now):
+        for address in self.peers:
+            self._event(now, address, 'sample')
+
+    def neighbor_counts(self):
+        '''({neighbor: received}, {neighbor: accepted}), as get_neighbors_state() returns.'''
+        return ({a: p.received for a, p in self.peers.items()},
+                {a: p.accepted for a, p in self.peers.items()})
+
+    def end_of_rib(self):
+        '''{neighbor: True} for every peer whose End-of-RIB has arrived.'''
+        return {a: True for a, p in self.peers.items() if p.end_of_rib is not None}
+
+
+class BMPCollector(object):
+    '''The BMP station the target connects to, served from an asyncio loop.
+
+    Like NativeMonitor it listens on the bridge gateway, the host's own
+    address on the bench network, so the target reaches it as it would any
+    collector. A reconnecting target starts from a clean BMPState, since it
+    will replay every peer's Adj-RIB-In.
+    '''
+
+    def __init__(self, address, port=BMP_PORT, interval=1):
+        self.address = address
+        self.port = port
+        self.interval = interval
+        self.state = BMPState()
+        self.connected = threading.Event()
+        self.error = None
+        # bench() sets this to its own start, so the curves share its clock
+        self.origin = time.monotonic_ns()
+        self._loop = None
+        self._task = None
+        self._started = threading.Event()
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        t = threading.Thread(target=self._run_loop, name='bmp-collector')
+        t.daemon = True
+        t.start()
+        self._started.wait()
+        if self.error is not None:
+            raise BMPError('cannot listen on {0}:{1}: {2}'.format(self.address, self.port,
+                                                                  self.error))
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._task = self._loop.create_task(self._serve())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    async def _serve(self):
+        try:
+            server = await asyncio.start_server(self._session, self.address, self.port)
+        except OSError as e:
+            self.error = str(e)
+            self._started.set()
+            return
+        self._started.set()
+        async with server:
+            while True:
+                await asyncio.sleep(self.interval)
+                if self.connected.is_set():
+                    self.state.sample(time.monotonic_ns())
+
+    async def _session(self, reader, writer):
+        self.state = BMPState()
+        self.connected.set()
+        try:
+            while True:
+                length, msg_type = parse_common_header(
+                    await reader.readexactly(COMMON_HEADER.size))
+                body = await reader.readexactly(length - COMMON_HEADER.size)
+                self.state.feed(msg_type, body, time.monotonic_ns())
+                if msg_type == TERMINATION:
+                    break
+        except (OSError, asyncio.IncompleteReadError, BMPError, BGPError) as e:
+            self.error = str(e)
+        finally:
+            self.connected.clear()
+            writer.close()
+
+    def neighbor_counts(self):
+        return self.state.neighbor_counts()
+
+    def end_of_rib(self):
+        return self.state.end_of_rib()
+
+    def close(self):
+        if self._loop is not None and self._task is not None and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            except RuntimeError:
+                # the loop closed between the check and the call
+                pass
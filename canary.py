@@ -0,0 +1,208 @@
+# How long one route takes to cross the target while it is busy.
+#
+# elapsed (s) says when the whole table had arrived. It says nothing about
+# how long a single new route waits inside the target while that table is
+# pouring in -- and that wait is what an operator sees when a customer's
+# prefix takes thirty seconds to show up on a box that is busy with a
+# full-table reload.
+#
+# With `bench --canary RATE` bgperf2 holds one more BGP session to the target,
+# from a second address on the bench bridge, and announces a new marker
+# prefix on it RATE times a second for the whole run: before the testers are
+# launched, through the storm, and after. The markers are /32s out of
+# 198.18.0.0/15, the range RFC 2544 sets aside for benchmarking, so no tester
+# table or MRT dump carries them. The native monitor (see monitor.py) picks
+# them out of every UPDATE it receives and stamps each one's arrival on the
+# same monotonic clock the canary stamped its sending with. The difference is
+# the route's trip through the target.
+#
+# The markers are kept out of the monitor's table, so they never count
+# towards received or move convergence. They need the native monitor: the
+# GoBGP one only reports a count once a second.
+#
+# The ledger is kept free of Docker and sockets so the test suite can cover
+# it; CanarySpeaker is the BGP session around it.
+
+import asyncio
+import threading
+import time
+from threading import Thread
+
+import netaddr
+
+from bgpwire import (BGPError, HEADER_LEN, KEEPALIVE, NOTIFICATION, OPEN, encode_keepalive,
+                     encode_open, encode_update, parse_header, parse_notification, parse_open,
+                     prefix_key)
+
+CANARY_NETWORK = netaddr.IPNetwork('198.18.0.0/15')
+# The monitor is 1001 and the testers start at 1003.
+CANARY_AS = 1002
+DEFAULT_RATE = 10
+
+_FIRST = int(CANARY_NETWORK.network)
+_LOW = prefix_key(_FIRST, 32)
+_HIGH = prefix_key(int(CANARY_NETWORK.broadcast), 32)
+
+
+def canary_key(seq):
+    '''The prefix_key() of the seq'th marker prefix.'''
+    return prefix_key(_FIRST + seq % CANARY_NETWORK.size, 32)
+
+
+def is_canary(key):
+    return _LOW <= key <= _HIGH and key & 0x3f == 32
+
+
+class CanaryLedger(object):
+    '''When each marker was sent and when it first came back, in monotonic_ns.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = {}
+        self.arrived = {}
+
+    def mark_sent(self, key, now):
+        with self.lock:
+            self.sent[key] = now
+            self.arrived.pop(key, None)
+
+    def take(self, keys, now):
+        '''Record the markers among `keys` as arrived at `now` and return the rest.
+
+        Only the first arrival counts: a marker the target sends again after a
+        best-path change has already made its trip.
+        '''
+        if not any(_LOW <= k <= _HIGH for k in keys):
+            return keys
+        rest = []
+        with self.lock:
+            for k in keys:
+                if not is_canary(k):
+                    rest.append(k)
+                elif k in self.sent and k not in self.arrived:
+                    self.arrived[k] = now
+        return rest
+
+    def rows(self, origin):
+        '''[(seconds sent after origin, latency in seconds or None if lost)], in order.'''
+        with self.lock:
+            sent = sorted(self.sent.items(), key=lambda item: item[1])
+            arrived = dict(self.arrived)
+        return [((at - origin) / 1e9,
+                 (arrived[k] - at) / 1e9 if k in arrived else None) for k, at in sent]
+
+
+class CanarySpeaker(object):
+    '''A BGP session from the host to the target that announces one marker
+    prefix every 1/rate seconds, until close().'''
+
+    CONNECT_RETRY = 1
+    HOLD_TIME = 90
+
+    def __init__(self, peer, local_address, rate=DEFAULT_RATE, asn=CANARY_AS, port=179):
+        self.peer = peer
+        self.local_address = local_address
+        self.rate = float(rate)
+        self.asn = asn
+        self.port = port
+        self.ledger = CanaryLedger()
+        self.established = threading.Event()
+        self.origin = time.monotonic_ns()
+        self.error = None
+        self.seq = 0
+        self.stopping = False
+        self._loop = None
+        self._task = None
+
+    def neighbor(self):
+        '''The canary as a scenario neighbor, so every target configures it as a peer.'''
+        return {'as': self.asn, 'router-id': self.local_address,
+                'local-address': self.local_address, 'count': 0, 'check-points': 0}
+
+    def run(self):
+        self._loop = asyncio.new_event_loop()
+        t = Thread(target=self._run_loop, name='canary')
+        t.daemon = True
+        t.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._task = self._loop.create_task(self._connect())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    def close(self):
+        self.stopping = True
+        if self._loop is not None and self._task is not None and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            except RuntimeError:
+                # the loop closed between the check and the call
+                pass
+
+    async def _connect(self):
+        while not self.stopping:
+            try:
+                reader, writer = await asyncio.open_connection(
+                    self.peer, self.port, local_addr=(self.local_address, 0))
+            except OSError as e:
+                self.error = str(e)
+                await asyncio.sleep(self.CONNECT_RETRY)
+                continue
+            try:
+                await self._session(reader, writer)
+            except (OSError, asyncio.IncompleteReadError, BGPError) as e:
+                self.error = str(e)
+            finally:
+                self.established.clear()
+                writer.close()
+            await asyncio.sleep(self.CONNECT_RETRY)
+
+    async def _session(self, reader, writer):
+        writer.write(encode_open(self.asn, self.local_address, self.HOLD_TIME))
+        await writer.drain()
+        tasks = []
+        try:
+            while True:
+                length, msg_type = parse_header(await reader.readexactly(HEADER_LEN))
+                body = await reader.readexactly(length - HEADER_LEN)
+                if msg_type == OPEN:
+                    hold = min(self.HOLD_TIME, parse_open(body)['hold_time'])
+                    writer.write(encode_keepalive())
+                    await writer.drain()
+                    if hold > 0:
+                        tasks.append(asyncio.ensure_future(self._keepalive(writer, hold / 3)))
+                elif msg_type == KEEPALIVE and not self.established.is_set():
+                    self.established.set()
+                    tasks.append(asyncio.ensure_future(self._announce(writer)))
+                elif msg_type == NOTIFICATION:
+                    raise BGPError(parse_notification(body))
+                # the target's own UPDATEs to us are of no interest
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _keepalive(self, writer, interval):
+        while True:
+            await asyncio.sleep(interval)
+            writer.write(encode_keepalive())
+            await writer.drain()
+
+    async def _announce(self, writer):
+        # on a fixed schedule rather than a fixed sleep, so a slow drain does
+        # not lower the rate
+        loop = asyncio.get_event_loop()
+        interval = 1 / self.rate
+        due = loop.time()
+        while True:
+            key = canary_key(self.seq)
+            self.seq += 1
+            self.ledger.mark_sent(key, time.monotonic_ns())
+            writer.write(encode_update(nlri=[key], next_hop=self.local_address, as_path=[self.asn]))
+            await writer.drain()
+            due += interval
+            await asyncio.sleep(max(due - loop.time(), 0))
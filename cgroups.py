@@ -0,0 +1,224 @@
+# Per-container resource accounting read straight from cgroup v2.
+#
+# The target's CPU and memory used to come from `docker stats`, one streaming
+# HTTP request per container that dockerd itself fills in by reading these same
+# files once a second. It only ever ran for the target, so nothing said how hard
+# the testers or the monitor were working -- and a run where the generators are
+# pinned at 100% measures the generators, not the daemon (see "Reading a result"
+# in the README). Opening fifty such streams to find out would cost more than it
+# measures. Reading cpu.stat and friends is a handful of small file reads per
+# container per sample, at whatever rate the caller asks for.
+#
+# CPU is reported like `docker stats` does, as a percentage of one core, so
+# 'max cpu %' keeps its meaning when the source changes underneath it.
+#
+# Memory is reported as memory.current, as before, and broken down by what it
+# is. memory.current counts the page cache of every file the container
+# touched -- bgpd.log at debug level, the bind-mounted config -- so a daemon
+# that logs heavily reads as fatter than it is. memory.stat splits it: anon
+# is the daemon's own heap and stacks, and the only part that compares across
+# BIRD, FRR and OpenBGPD as memory per route; file is cache the kernel can
+# drop; kernel and sock are what the kernel holds on the daemon's behalf.
+# memory.peak is the cgroup's high-water mark, which catches a spike between
+# two samples. At convergence, smaps_rollup gives the daemon processes' own
+# RSS and PSS -- shared libraries counted once per process, or shared out.
+#
+# CPU is also kept as the cgroup's running totals, user and system apart, so
+# the CPU-seconds the daemon spent between any two moments -- first prefix and
+# convergence, say -- is a subtraction rather than a sum of sampled peaks.
+#
+# Kept free of Docker and privileges so the test suite can cover it.
+
+import os
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# Where dockerd puts a container's cgroup under the systemd and cgroupfs
+# drivers respectively, for when /proc/<pid>/cgroup cannot be used.
+DOCKER_CGROUP_LAYOUTS = ('system.slice/docker-{0}.scope', 'docker/{0}')
+
+
+def is_cgroup_v2(cgroup_root=CGROUP_ROOT):
+    '''True on a unified (v2-only) hierarchy, the only layout read here.'''
+    return os.path.exists(os.path.join(cgroup_root, 'cgroup.controllers'))
+
+
+def parse_proc_cgroup(text):
+    '''The v2 path out of the contents of /proc/<pid>/cgroup, or None.
+
+    On a unified hierarchy that is the single '0::<path>' line; a hybrid host
+    also lists v1 controllers, which are ignored.
+    '''
+    for line in text.splitlines():
+        parts = line.split(':', 2)
+        if len(parts) == 3 and parts[0] == '0' and parts[1] == '':
+            return parts[2]
+    return None
+
+
+def container_cgroup(pid, container_id='', proc_root='/proc', cgroup_root=CGROUP_ROOT):
+    '''Directory of a running container's cgroup, or None if there is none to read.
+
+    The container's init pid says where it is regardless of cgroup driver.
+    That can fail -- the pid is gone, or this process sits in a cgroup
+    namespace where the path reads as '/' -- so the usual Docker layouts are
+    tried by container id after it.
+    '''
+    if not is_cgroup_v2(cgroup_root):
+        return None
+    candidates = []
+    try:
+        with open(os.path.join(proc_root, str(pid), 'cgroup')) as f:
+            path = parse_proc_cgroup(f.read())
+        if path and path != '/':
+            candidates.append(path.lstrip('/'))
+    except (OSError, ValueError):
+        pass
+    if container_id:
+        candidates.extend(layout.format(container_id) for layout in DOCKER_CGROUP_LAYOUTS)
+    for candidate in candidates:
+        directory = os.path.join(cgroup_root, candidate)
+        if os.path.exists(os.path.join(directory, 'cpu.stat')):
+            return directory
+    return None
+
+
+def parse_flat_keyed(text):
+    '''cpu.stat, memory.stat and the like: one 'key value' pair per line.'''
+    values = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) != 2:
+            continue
+        try:
+            values[fields[0]] = int(fields[1])
+        except ValueError:
+            continue
+    return values
+
+
+def parse_io_stat(text):
+    '''io.stat summed over devices: {'rbytes', 'wbytes', 'rios', 'wios', ...}.'''
+    totals = {}
+    for line in text.splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition('=')
+            try:
+                totals[key] = totals.get(key, 0) + int(value)
+            except ValueError:
+                continue
+    return totals
+
+
+def _read(directory, name):
+    try:
+        with open(os.path.join(directory, name)) as f:
+            return f.read()
+    except OSError:
+        return ''
+
+
+def read_cgroup(directory):
+    '''One sample of a cgroup: its cpu.stat, memory and io counters.
+
+    A file that cannot be read -- io.stat is absent when the io controller is
+    not delegated, memory.peak on kernels before 5.19 -- reads as empty rather
+    than failing the sample.
+    '''
+    memory_current = _read(directory, 'memory.current').strip()
+    memory_peak = _read(directory, 'memory.peak').strip()
+    return {
+        'cpu': parse_flat_keyed(_read(directory, 'cpu.stat')),
+        'memory_current': int(memory_current) if memory_current.isdigit() else 0,
+        'memory_peak': int(memory_peak) if memory_peak.isdigit() else None,
+        'memory': parse_flat_keyed(_read(directory, 'memory.stat')),
+        'io': parse_io_stat(_read(directory, 'io.stat')),
+    }
+
+
+def cpu_percent(previous, current, elapsed_seconds):
+    '''CPU used between two read_cgroup() samples, as a percentage of one core.'''
+    if elapsed_seconds <= 0:
+        return 0.0
+    used = current['cpu'].get('usage_usec', 0) - previous['cpu'].get('usage_usec', 0)
+    return max(used, 0) / (elapsed_seconds * 1_000_000) * 100.0
+
+
+def discount_cpu(reading, usec):
+    '''A read_cgroup() reading with `usec` of CPU taken off its usage.
+
+    For the target's status commands when they had to run inside its cgroup:
+    their CPU is counted up separately and removed here, so cpu_percent()
+    reports the daemon alone. See observer.py.
+    '''
+    if not usec:
+        return reading
+    cpu = dict(reading['cpu'])
+    usage = cpu.get('usage_usec', 0)
+    cpu['usage_usec'] = usage - usec
+    # the commands' own split is not known; take it off user and system in
+    # the proportion the cgroup as a whole used them
+    if usage > 0:
+        for key in ('user_usec', 'system_usec'):
+            if key in cpu:
+                cpu[key] -= usec * cpu[key] / usage
+    return dict(reading, cpu=cpu)
+
+
+# memory.stat's 'kernel' total arrived in 5.18; before it, these are its parts.
+KERNEL_MEMORY_PARTS = ('kernel_stack', 'pagetables', 'sec_pagetables', 'percpu', 'slab')
+
+
+def memory_breakdown(memory_stat):
+    '''{'anon', 'file', 'kernel', 'sock'} in bytes, from a parsed memory.stat.
+
+    None for each when memory.stat could not be read at all, so a missing
+    file is not reported as a daemon using no memory.
+    '''
+    if not memory_stat:
+        return {'anon': None, 'file': None, 'kernel': None, 'sock': None}
+    kernel = memory_stat.get('kernel')
+    if kernel is None:
+        kernel = sum(memory_stat.get(k, 0) for k in KERNEL_MEMORY_PARTS)
+    return {'anon': memory_stat.get('anon', 0), 'file': memory_stat.get('file', 0),
+            'kernel': kernel, 'sock': memory_stat.get('sock', 0)}
+
+
+def parse_smaps_rollup(text):
+    '''{'rss', 'pss'} in bytes from /proc/<pid>/smaps_rollup.'''
+    values = {}
+    for line in text.splitlines():
+        key, _, rest = line.partition(':')
+        fields = rest.split()
+        if key in ('Rss', 'Pss') and fields and fields[0].isdigit():
+            values[key.lower()] = int(fields[0]) * 1024
+    return values
+
+
+def read_smaps_rollup(pids, proc_root='/proc'):
+    '''RSS and PSS summed over `pids`, or None if none could be read --
+    smaps_rollup needs the same access as ptrace, so root, and Linux 4.14.'''
+    totals = None
+    for pid in pids:
+        values = parse_smaps_rollup(_read(os.path.join(proc_root, str(pid)), 'smaps_rollup'))
+        if 'rss' in values:
+            totals = totals or {'rss': 0, 'pss': 0}
+            totals['rss'] += values['rss']
+            totals['pss'] += values.get('pss', 0)
+    return totals
+
+
+def summarize(previous, current, elapsed_seconds):
+    '''The per-container numbers bench() records from two samples.'''
+    out = {
+        'cpu': cpu_percent(previous, current, elapsed_seconds),
+        'mem': current['memory_current'],
+        'mem_peak': current.get('memory_peak'),
+        'io_read': current['io'].get('rbytes', 0) - previous['io'].get('rbytes', 0),
+        'io_write': current['io'].get('wbytes', 0) - previous['io'].get('wbytes', 0),
+        # running totals, in seconds; None when cpu.stat could not be read
+        'cpu_user': current['cpu']['user_usec'] / 1e6 if 'user_usec' in current['cpu'] else None,
+        'cpu_system': current['cpu']['system_usec'] / 1e6 if 'system_usec' in current['cpu'] else None,
+    }
+    out.update(('mem_' + k, v) for k, v in memory_breakdown(current['memory']).items())
+    return out
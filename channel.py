@@ -0,0 +1,186 @@
+# One long-lived shell per container for the commands bench() runs in it.
+#
+# Container.local() was a Docker exec_create plus exec_start per command. Each
+# one is two API round trips, and behind them dockerd and containerd set up a
+# fresh process with `runc exec` -- a few tens of milliseconds of CPU on the
+# machine under test, outside every container, so it showed up nowhere except
+# as jitter in the very samples being taken. With the monitor, the neighbor
+# pollers and the address setup that is hundreds of execs a minute.
+#
+# --command-channel starts `sh` once per container with stdin attached and
+# writes each command to it as one line. The shell still forks the command,
+# but the round trips and the runc setup are paid once. Each command is
+# followed by an `echo` of a numbered marker, which is how the reader knows
+# where its output ends.
+#
+# Commands mean exactly what they meant under exec: a string is split the way
+# Docker splits it (shlex, no shell), and every word is quoted back for sh.
+#
+# The framing and demultiplexing are kept free of Docker so the test suite can
+# cover them; CommandChannel is handed the Docker client to use.
+
+import os
+import shlex
+import struct
+import threading
+import time
+
+SENTINEL = '__bgperf2_channel_done__'
+
+# Docker's attach stream for a non-tty exec: an 8-byte header per frame, the
+# stream id then three pad bytes then the payload length, big-endian.
+FRAME_HEADER = struct.Struct('>BxxxL')
+STDOUT = 1
+STDERR = 2
+
+# A command that has not answered in this long is taken to have hung; the
+# channel is dropped and local() goes back to exec.
+CHANNEL_TIMEOUT = 30
+
+
+class ChannelClosed(Exception):
+    pass
+
+
+class Demux(object):
+    '''Splits Docker's multiplexed attach stream into (stream, payload) frames.'''
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while len(self.buffer) >= FRAME_HEADER.size:
+            stream, size = FRAME_HEADER.unpack_from(self.buffer)
+            end = FRAME_HEADER.size + size
+            if len(self.buffer) < end:
+                break
+            frames.append((stream, bytes(self.buffer[FRAME_HEADER.size:end])))
+            del self.buffer[:end]
+        return frames
+
+
+def shell_command(cmd, stderr=False):
+    '''`cmd`, as exec would have run it, as one line of sh.
+
+    stdin is closed so a command cannot eat the requests queued behind it, and
+    stderr is folded into the output only when exec would have returned it.
+    '''
+    argv = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+    return '{0} </dev/null {1}'.format(' '.join(shlex.quote(str(a)) for a in argv),
+                                       '2>&1' if stderr else '2>/dev/null')
+
+
+def request(cmd, number, stderr=False):
+    '''The bytes written to the shell for request `number`.
+
+    The bare `echo` puts the marker on its own line whether or not the output
+    ended with a newline; split_response() takes that newline back off.
+    '''
+    return '{0}; echo; echo {1} {2}\n'.format(shell_command(cmd, stderr), SENTINEL,
+                                              number).encode('utf-8')
+
+
+def split_response(buffer, number):
+    '''(output, what follows) once request `number` has answered, else None.'''
+    marker = '\n{0} {1}\n'.format(SENTINEL, number).encode('utf-8')
+    at = buffer.find(marker)
+    if at < 0:
+        return None
+    return bytes(buffer[:at]), buffer[at + len(marker):]
+
+
+def command_name(cmd):
+    '''What a command is filed under in CommandStats: its program's name.'''
+    argv = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+    return os.path.basename(str(argv[0])) if argv else ''
+
+
+class CommandStats(object):
+    '''Count, total and worst latency of each command, by how it was run.'''
+
+    def __init__(self):
+        self.commands = {}          # (name, via) -> [count, total_ns, max_ns]
+
+    def record(self, cmd, via, nanoseconds):
+        entry = self.commands.setdefault((command_name(cmd), via), [0, 0, 0])
+        entry[0] += 1
+        entry[1] += nanoseconds
+        entry[2] = max(entry[2], nanoseconds)
+
+    def rows(self):
+        '''(command, via, count, mean ms, max ms), sorted.'''
+        return [(name, via, count, total / count / 1e6, worst / 1e6)
+                for (name, via), (count, total, worst) in sorted(self.commands.items())]
+
+
+class CommandChannel(object):
+    '''An attached `sh` in a container, answering one command at a time.'''
+
+    def __init__(self, client, container, timeout=CHANNEL_TIMEOUT):
+        self.client = client
+        self.container = container
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sock = None
+        self.number = 0
+        self.demux = Demux()
+        self.output = bytearray()
+
+    def open(self):
+        i = self.client.exec_create(container=self.container, cmd=['sh'], stdin=True,
+                                    stdout=True, stderr=True, tty=False)
+        sock = self.client.exec_start(i['Id'], socket=True)
+        # docker-py hands back a SocketIO wrapper; writing needs the socket
+        self.sock = getattr(sock, '_sock', sock)
+        self.sock.settimeout(self.timeout)
+        self.demux = Demux()
+        self.output = bytearray()
+
+    def run(self, cmd, stderr=False):
+        '''The output of `cmd`, as exec_start(stream=False) would return it.
+
+        Any failure closes the channel before raising: a half-read answer
+        left in the stream would otherwise be taken for the next one's.
+        '''
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self.open()
+                self.number += 1
+                self.sock.sendall(request(cmd, self.number, stderr))
+                while True:
+                    done = split_response(self.output, self.number)
+                    if done is not None:
+                        output, self.output = done
+                        return output
+                    data = self.sock.recv(65536)
+                    if not data:
+                        raise ChannelClosed('shell in {0} exited'.format(self.container))
+                    for stream, payload in self.demux.feed(data):
+                        if stream == STDOUT:
+                            self.output += payload
+            except Exception:
+                self._close()
+                raise
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+
+def timed(stats, cmd, via, run):
+    '''run(), with its latency recorded in `stats` under `via`.'''
+    started = time.monotonic_ns()
+    result = run()
+    stats.record(cmd, via, time.monotonic_ns() - started)
+    return result
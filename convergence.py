@@ -9,8 +9,14 @@
 #
 # This lives apart from bench() so the rules can be tested without Docker.
 
+import math
+
+# The sample counts below are at the default one-second monitor interval. A
+# tracker built with a shorter sample_interval scales them up, so each keeps
+# its length in seconds however often the monitor is polled.
+
 # A run is converged once the received count has been unchanged for this many
-# consecutive samples (samples arrive about once a second).
+# consecutive samples.
 ASSURANCE_SAMPLES = 20
 
 # ...but only this many if the configured check-point was already reached, since
@@ -21,6 +27,22 @@ ASSURANCE_SAMPLES_AFTER_CHECKPOINT = 5
 # under heavy load some stacks genuinely pause this long.
 STUCK_SAMPLES = 600
 
+# ...but a pause is only a pause while something is still working. A count
+# that is flat while the target is back at its pre-load CPU, nothing sits in
+# its sockets' queues and every tester has gone quiet is not going to move
+# again, and is failed after this many samples instead. Any of the three
+# that is unknown -- a remote target, no cgroup v2, no socket sampling, no
+# target CPU read before the first prefix arrived to say what its baseline
+# is -- counts as busy, which keeps the long wait.
+IDLE_STUCK_SAMPLES = 30
+
+# Within this many points of one core of its pre-load CPU, the target counts as
+# back at baseline.
+CPU_BASELINE_MARGIN = 10.0
+
+# The busiest tester below this % of one core has finished sending.
+TESTER_IDLE_CPU = 5.0
+
 # A sustained drop in the received count means the target is losing routes.
 # Both conditions must hold: enough consecutive drops, and a big enough one.
 DROP_SAMPLES = 10
@@ -42,7 +64,11 @@ class ConvergenceTracker(object):
     CONVERGED = 'converged'
     FAILED = 'failed'
 
-    def __init__(self):
+    def __init__(self, sample_interval=1.0):
+        self.sample_interval = sample_interval
+        self.stuck_samples = self.samples(STUCK_SAMPLES)
+        self.idle_stuck_samples = self.samples(IDLE_STUCK_SAMPLES)
+        self.drop_samples = self.samples(DROP_SAMPLES)
         # True once the monitor has seen at least the configured check-point.
         self.recved_checkpoint = False
         # True once every tester neighbor has sent everything it was going to.
@@ -56,22 +82,58 @@ class ConvergenceTracker(object):
         self.last_neighbors_checked = 0
         # Consecutive samples where the received count went backwards.
         self.less_last_received = 0
+        # Consecutive unchanged samples with nothing left working; see
+        # IDLE_STUCK_SAMPLES.
+        self.idle_flat_count = 0
+        # the target's CPU while nothing had reached the monitor yet
+        self.idle_cpu = []
         self.fail_msg = None
 
+    def samples(self, one_second_samples):
+        '''A count of one-second samples, at this tracker's sample interval.'''
+        return max(1, int(round(one_second_samples / self.sample_interval)))
+
     @property
     def assurance_samples(self):
         '''How long the count must hold steady before we call it converged.'''
         if self.recved_checkpoint:
-            return ASSURANCE_SAMPLES_AFTER_CHECKPOINT
-        return ASSURANCE_SAMPLES
+            return self.samples(ASSURANCE_SAMPLES_AFTER_CHECKPOINT)
+        return self.samples(ASSURANCE_SAMPLES)
+
+    @property
+    def baseline_cpu(self):
+        '''The target's CPU % before any prefix reached the monitor, or None.'''
+        if not self.idle_cpu:
+            return None
+        ordered = sorted(self.idle_cpu)
+        return ordered[len(ordered) // 2]
+
+    def target_idle(self, target_cpu):
+        '''Whether the target's CPU is back at its baseline; False if either is unknown.'''
+        baseline = self.baseline_cpu
+        return target_cpu is not None and baseline is not None and \
+            target_cpu <= baseline + CPU_BASELINE_MARGIN
+
+    def idle(self, target_cpu, queued_bytes, tester_cpu):
+        '''Nothing left working: the target, its sockets and the testers.'''
+        return self.target_idle(target_cpu) and queued_bytes == 0 \
+            and tester_cpu is not None and tester_cpu < TESTER_IDLE_CPU
 
     def note_neighbors_checkpoint(self):
         '''Called when the target reports every neighbor has finished sending.'''
         self.neighbors_checkpoint = True
 
     def update(self, elapsed_seconds, recved, neighbors_checked,
-               neighbors_received_full, checked):
-        '''Fold in one monitor sample and return the resulting status.'''
+               neighbors_received_full, checked, target_cpu=None, queued_bytes=None,
+               tester_cpu=None):
+        '''Fold in one monitor sample and return the resulting status.
+
+        The rest are the latest readings of what else is going on: the
+        target's CPU %, the bytes queued in its sockets, and the busiest
+        tester's CPU %. None for any that is not being measured.
+        '''
+        if recved == 0 and target_cpu is not None:
+            self.idle_cpu.append(target_cpu)
         previous_recved = self.last_recved
         # Regression is measured against the high-water mark, not the previous
         # sample. Comparing against the previous sample means a count that
@@ -109,7 +171,7 @@ class ConvergenceTracker(object):
                 self.less_last_received += 1
             else:
                 self.less_last_received = 0
-            if self.less_last_received >= DROP_SAMPLES:
+            if self.less_last_received >= self.drop_samples:
                 self.fail_msg = (f"FAILED: dropping received count {recved} "
                                  f"neighbors_checked {neighbors_checked}")
                 return self.FAILED
@@ -146,9 +208,8 @@ class ConvergenceTracker(object):
         # that lost half its routes and held there was reported CONVERGED, with
         # the loss visible only as a low 'received' column. Every real run sets
         # the checkpoint, so this is the ordinary path, not a corner case.
-        if (self.neighbors_checkpoint
-                and self.last_recved_count >= self.assurance_samples
-                and dropped <= DROP_FRACTION):
+        if self.neighbors_checkpoint and dropped <= DROP_FRACTION \
+                and self.settled(recved, target_cpu):
             return self.CONVERGED
 
         if (elapsed_seconds > NO_PROGRESS_DEADLINE_SECONDS
@@ -157,11 +218,174 @@ class ConvergenceTracker(object):
                 and recved == 0):
             # Nothing has arrived at all; trip the stuck check immediately
             # rather than waiting out STUCK_SAMPLES.
-            self.last_recved_count = STUCK_SAMPLES
+            self.last_recved_count = self.stuck_samples
 
-        if self.last_recved_count >= STUCK_SAMPLES:
+        if self.last_recved_count >= self.stuck_samples:
             self.fail_msg = (f"FAILED: stuck received count {recved} "
                              f"neighbors_checked {neighbors_checked}")
             return self.FAILED
 
+        if self.last_recved_count > 0 and self.idle(target_cpu, queued_bytes, tester_cpu):
+            self.idle_flat_count += 1
+        else:
+            self.idle_flat_count = 0
+        if self.idle_flat_count >= self.idle_stuck_samples:
+            self.fail_msg = (f"FAILED: stuck received count {recved} "
+                             f"neighbors_checked {neighbors_checked} with the target idle, "
+                             f"its sockets drained and the testers finished")
+            return self.FAILED
+
         return self.CONTINUE
+
+    def settled(self, recved, target_cpu):
+        '''Whether the count has held still long enough to call the run done.'''
+        return self.last_recved_count >= self.assurance_samples
+
+    @property
+    def quiet_samples(self):
+        '''At CONVERGED, how many samples ago the count stopped changing.'''
+        return self.assurance_samples
+
+
+# The shape of a run, not just its end: how long the monitor took to see each
+# share of the table. Two daemons with the same elapsed (s) can ingest 99% in
+# ten seconds and dribble the rest, or ramp steadily the whole way.
+PERCENTILES = (50, 90, 99, 100)
+
+
+def percentile_times(t, counts, total, percentiles=PERCENTILES):
+    '''{percentile: seconds} at which `counts` first reached that share of `total`.
+
+    Interpolated between the two samples either side of the crossing, so a
+    once-a-second series still gives sub-second answers. None for a share
+    never reached -- t100 under a filter test, or a failed run.
+    '''
+    out = {}
+    for p in percentiles:
+        goal = total * p / 100.0
+        out[p] = None
+        if total <= 0:
+            continue
+        for i in range(len(counts)):
+            if counts[i] >= goal:
+                if i == 0 or counts[i] == counts[i - 1]:
+                    out[p] = float(t[i])
+                else:
+                    share = (goal - counts[i - 1]) / (counts[i] - counts[i - 1])
+                    out[p] = float(t[i - 1] + share * (t[i] - t[i - 1]))
+                break
+    return out
+
+
+def ingest_rates(t, counts):
+    '''(times, prefixes per second) between consecutive samples, each rate
+    placed at the end of its interval.'''
+    rates = []
+    times = []
+    for i in range(1, len(counts)):
+        dt = t[i] - t[i - 1]
+        if dt > 0:
+            times.append(float(t[i]))
+            rates.append((counts[i] - counts[i - 1]) / dt)
+    return times, rates
+
+
+def rate_summary(t, counts):
+    '''(peak, mean) prefixes per second; (None, None) if nothing arrived.
+
+    The mean is over the ingest window only: from the last sample before the
+    first prefix to the first sample at the final count, so neither the wait
+    for sessions nor the assurance samples dilute it.
+    '''
+    if len(counts) < 2 or max(counts) <= 0:
+        return None, None
+    _, rates = ingest_rates(t, counts)
+    final = max(counts)
+    first = next(i for i, c in enumerate(counts) if c > 0)
+    start = t[first - 1] if first > 0 else t[0]
+    end = t[next(i for i, c in enumerate(counts) if c >= final)]
+    peak = max(rates) if rates else None
+    mean = final / (end - start) if end > start else None
+    return peak, mean
+
+
+# An alternative to waiting out a fixed assurance window: weigh the evidence
+# that the run is over and stop as soon as it is strong enough.
+#
+# Three things have to agree. Every peer has finished sending, as for
+# ConvergenceTracker. The target's CPU is back at its pre-load baseline: a
+# target still working may be about to emit a burst, so while its CPU is known
+# nothing else makes up for it being busy. And the count has held still for
+# long compared with how this run behaved while it was still ingesting: tau is
+# the longest gap the run itself left between two count changes after its
+# first prefix -- at least one sample -- and halved once the count reached the
+# configured check-point, which needs less confirming. The chance that more
+# routes are on their way after `quiet` seconds is taken as exp(-quiet / tau),
+# and the run is converged once 1 - exp(-quiet / tau) reaches the confidence
+# asked for: about 4.6 tau at the default 0.99.
+#
+# Without a CPU reading or a baseline to compare it with, there is no evidence
+# from the target, and the fixed window decides as ConvergenceTracker's does.
+# The failure rules are ConvergenceTracker's own.
+DEFAULT_CONFIDENCE = 0.99
+
+class EvidenceTracker(ConvergenceTracker):
+    '''ConvergenceTracker, converging on the weight of the evidence rather
+    than after a fixed number of unchanged samples.'''
+
+    def __init__(self, sample_interval=1.0, confidence=DEFAULT_CONFIDENCE):
+        super(EvidenceTracker, self).__init__(sample_interval)
+        if not 0 < confidence < 1:
+            raise ValueError('confidence must be between 0 and 1, not {0}'.format(confidence))
+        self.confidence = confidence
+        # the count as last seen, when it last changed, and the longest wait
+        # between two changes since the first prefix, in seconds
+        self.seen = 0
+        self.changed_at = None
+        self.longest_gap = 0.0
+
+    def update(self, elapsed_seconds, recved, *args, **kwargs):
+        if recved != self.seen:
+            if self.seen > 0 and self.changed_at is not None:
+                self.longest_gap = max(self.longest_gap, elapsed_seconds - self.changed_at)
+            self.seen = recved
+            self.changed_at = elapsed_seconds
+        return super(EvidenceTracker, self).update(elapsed_seconds, recved, *args, **kwargs)
+
+    @property
+    def tau(self):
+        '''Seconds of quiet per unit of evidence, from this run's own pauses.'''
+        tau = max(self.longest_gap, self.sample_interval)
+        if self.recved_checkpoint:
+            tau /= 2
+        return tau
+
+    def evidence(self):
+        '''Confidence, from 0 to 1, that the run is over.'''
+        quiet = self.last_recved_count * self.sample_interval
+        return 1 - math.exp(-quiet / self.tau)
+
+    def settled(self, recved, target_cpu):
+        if target_cpu is None or self.baseline_cpu is None:
+            return super(EvidenceTracker, self).settled(recved, target_cpu)
+        return self.last_recved_count > 0 and self.target_idle(target_cpu) \
+            and self.evidence() >= self.confidence
+
+    @property
+    def quiet_samples(self):
+        return self.last_recved_count
+
+
+# bench --convergence
+POLICIES = {'tracker': ConvergenceTracker, 'evidence': EvidenceTracker}
+
+
+def make_trackers(sample_interval=1.0, confidence=DEFAULT_CONFIDENCE):
+    '''{policy: tracker}, one of each in POLICIES, for bench() to feed every sample.'''
+    trackers = {}
+    for name, cls in POLICIES.items():
+        if issubclass(cls, EvidenceTracker):
+            trackers[name] = cls(sample_interval, confidence=confidence)
+        else:
+            trackers[name] = cls(sample_interval)
+    return trackers
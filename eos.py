@@ -41,6 +41,7 @@ class Eos(Container):
 class EosTarget(Eos, Target):
     
     CONTAINER_NAME = 'bgperf_eos_target'
+    DAEMON_PROCESSES = ('Bgp', 'Rib')
     CONFIG_FILE_NAME = 'startup-config'
 
     def __init__(self, host_dir, conf, image='ceos'):
@@ -83,7 +84,7 @@ class EosTarget(Eos, Target):
     def get_neighbors_state(self):
         neighbors_accepted = {}
         neighbors_received = {}
-        neighbor_received_output = self.local("Cli -c 'sh ip bgp summary |json'")
+        neighbor_received_output = self.observe("Cli -c 'sh ip bgp summary |json'")
         if neighbor_received_output:
             neighbor_received_output = json.loads(neighbor_received_output.decode('utf-8'))["vrfs"]["default"]["peers"]
 
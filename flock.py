@@ -36,6 +36,7 @@ RUN curl 'https://www.flocknetworks.com/?smd_process_download=1&download_id=429'
 class FlockTarget(Flock, Target):
     
     CONTAINER_NAME = 'bgperf_flock_target'
+    DAEMON_PROCESSES = ('flockd',)
     CONFIG_FILE_NAME = 'bgpd.conf'
 
     def __init__(self, host_dir, conf, image='bgperf/flock'):
@@ -98,7 +99,7 @@ class FlockTarget(Flock, Target):
 
     def get_neighbors_state(self):
         neighbors_accepted = {}
-        neighbor_received_output = json.loads(self.local("/usr/bin/flockc bgp --host 127.0.0.1 -J").decode('utf-8'))
+        neighbor_received_output = json.loads(self.observe("/usr/bin/flockc bgp --host 127.0.0.1 -J").decode('utf-8'))
         return neighbor_received_output['neighbor_summary']['default']['recv_converged']
     
     def get_neighbor_received_routes(self):
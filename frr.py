@@ -34,10 +34,81 @@ class FRRouting(Container):
         super(FRRouting, self).__init__(self.CONTAINER_NAME, image, host_dir, self.GUEST_DIR, conf)
 
 
+def eor_states(text):
+    '''{peer: True/False/None} from the output of `show bgp neighbors <peer> json`.
+
+    vtysh prints one JSON document per -c, back to back. A peer reads True
+    once endOfRibRecv lists IPv4 Unicast, False while it does not or the
+    session is not yet up, and None if the session is up and bgpd reports no
+    End-of-RIB state at all -- older releases, and peers without the graceful
+    restart capability, leave it out.
+    '''
+    states = {}
+    decoder = json.JSONDecoder()
+    at = 0
+    text = text.strip()
+    while at < len(text):
+        try:
+            doc, at = decoder.raw_decode(text, at)
+        except ValueError:
+            # bgpd not answering yet prints an error, not JSON
+            break
+        while at < len(text) and text[at].isspace():
+            at += 1
+        for addr, info in (doc.items() if isinstance(doc, dict) else ()):
+            if not isinstance(info, dict):
+                continue
+            received = _eor_received(info)
+            if received is not None:
+                states[addr] = received
+            elif info.get('bgpState') == 'Established':
+                states[addr] = None
+            else:
+                states[addr] = False
+    return states
+
+
+def _eor_received(doc, afi=False):
+    '''Whether an endOfRibRecv in `doc` covers IPv4 Unicast; None if there is none.
+
+    bgpd reports it twice: as a map of address families under
+    gracefulRestartInfo, and as a flag under each family's own section.
+    '''
+    found = None
+    if isinstance(doc, dict):
+        for key, value in doc.items():
+            if key == 'endOfRibRecv':
+                if isinstance(value, dict):
+                    got = bool(value.get('ipv4Unicast'))
+                elif isinstance(value, bool) and afi:
+                    got = value
+                else:
+                    continue
+            else:
+                got = _eor_received(value, afi or key == 'ipv4Unicast')
+            if got is not None:
+                found = bool(found) or got
+    return found
+
+
 class FRRoutingTarget(FRRouting, Target):
 
     CONTAINER_NAME = 'bgperf_frrouting_target'
+    # bgpd only: zebra works too, but it is a separate process, and the
+    # threads being asked about are bgpd's I/O and keepalive pthreads
+    DAEMON_PROCESSES = ('bgpd',)
     CONFIG_FILE_NAME = 'bgpd.conf'
+    # How End-of-RIB is found (--frr-eor). 'json' asks bgpd, with `show bgp
+    # neighbors <peer> json`, about the peers that have not sent it yet, and
+    # bgpd logs at its normal level. 'log' tails bgpd.log for it, which only
+    # works with bgpd logging every UPDATE at debug -- over 1GB of formatting
+    # and writing on a 1M-prefix run, billed to FRR's own CPU. The choice is
+    # made once, by choose_eor_method() before the testers launch: turning
+    # debug on later would miss every End-of-RIB that came before it.
+    EOR_METHODS = ('json', 'log')
+    eor_method = 'json'
+    # bgpd's bmp module, loaded with -M bmp when there is a station to feed
+    BMP_SUPPORTED = True
 
     def write_config(self):
 
@@ -80,6 +151,8 @@ no bgp ebgp-requires-policy
             for n in neighbors:
                 f.write(gen_address_family_neighbor(n))
             f.write("  exit-address-family\n")
+            if self.bmp is not None:
+                f.write(self.get_bmp_config())
 
             if 'policy' in self.scenario_global_conf:
                 seq = 10
@@ -118,8 +191,18 @@ no bgp ebgp-requires-policy
             if 'filter_test' in self.conf:
                 f.write(self.get_filter_test_config())
 
-            # we need log level to debug so that we can find End-of-RIB
-            f.write("log stdout debug\n") 
+            if self.eor_method == 'log':
+                # we need log level to debug so that we can find End-of-RIB
+                f.write("log stdout debug\n")
+
+    def get_bmp_config(self):
+        return ''' bmp targets bgperf2
+  bmp stats interval 1000
+  bmp monitor ipv4 unicast pre-policy
+  bmp monitor ipv4 unicast post-policy
+  bmp connect {0} port {1} min-retry 100 max-retry 1000
+ exit
+'''.format(self.bmp.address, self.bmp.port)
 
     def get_filter_test_config(self): 
         with open(REPO_ROOT / 'filters' / 'frr.conf') as file:
@@ -132,14 +215,13 @@ no bgp ebgp-requires-policy
              'mv /etc/frr /etc/frr.old',
              'mkdir /etc/frr',
              'cp {guest_dir}/{config_file_name} /etc/frr/{config_file_name} && chown frr:frr /etc/frr/{config_file_name}',
-             '/usr/lib/frr/bgpd -u frr -f /etc/frr/{config_file_name} -Z > {guest_dir}/bgpd.log 2>&1 &',
-             #'cd /root/config',   
-             #'perf record -F 99 -p 17 -g -- sleep 1300 > perf.out',
-             #'perf script > /root/config/out.perf',
+             '/usr/lib/frr/bgpd -u frr -f /etc/frr/{config_file_name} -Z{modules} > {guest_dir}/bgpd.log 2>&1 &',
+             # to profile bgpd, use `bench --profile` -- see profiling.py
              ]
         ).format(
             guest_dir=self.guest_dir,
-            config_file_name=self.CONFIG_FILE_NAME)
+            config_file_name=self.CONFIG_FILE_NAME,
+            modules=' -M bmp' if self.bmp is not None else '')
     
     def get_version_cmd(self):
         # The '|' and 'head -1' are argv words handed to vtysh, not a shell
@@ -163,7 +245,7 @@ no bgp ebgp-requires-policy
     def get_neighbors_state(self):
         neighbors_accepted = {}
         neighbors_received = {}
-        neighbor_received_output = self.local("vtysh -c 'sh ip bgp summary json'")
+        neighbor_received_output = self.observe("vtysh -c 'sh ip bgp summary json'")
         if not neighbor_received_output:
             # bgpd is not answering yet; polling starts before it is up
             return neighbors_received, neighbors_accepted
@@ -279,13 +361,75 @@ no bgp ebgp-requires-policy
 
         return neighbors
 
+    def _get_EOR_from_json(self, neighbors, checked):
+        '''Mark the peers bgpd says sent End-of-RIB.
+
+        Only peers not yet seen to finish are asked about, all in one vtysh
+        call, so the query shrinks as the run goes on. A peer bgpd reports no
+        End-of-RIB state for -- one without graceful restart -- is not asked
+        again, and is polled like any other daemon's instead: finished once
+        `checked` says it reached its check-point. A count that merely holds
+        still is not an End-of-RIB; under load a peer can pause for seconds.
+        '''
+        if not hasattr(self, '_eor_json_seen'):
+            self._eor_json_seen = set()
+            self._eor_no_state = set()
+        pending = [a for a in neighbors
+                   if a not in self._eor_json_seen and a not in self._eor_no_state]
+        if pending:
+            cmd = ['vtysh']
+            for addr in pending:
+                cmd += ['-c', 'show bgp neighbors {0} json'.format(addr)]
+            output = self.observe(cmd)
+            for addr, state in eor_states((output or b'').decode('utf-8', 'replace')).items():
+                if state is None:
+                    self._eor_no_state.add(addr)
+                elif state:
+                    self._eor_json_seen.add(addr)
+        for addr in self._eor_no_state:
+            if checked.get(addr):
+                self._eor_json_seen.add(addr)
+        for addr in self._eor_json_seen:
+            if addr in neighbors:
+                neighbors[addr] = True
+        return neighbors
+
+    def choose_eor_method(self, monitor_address):
+        '''Settle on 'json' or 'log' before the testers launch.
+
+        The monitor's session is already Established, so bgpd's JSON for it
+        shows whether this release reports End-of-RIB state at all. If it does
+        not, debug logging goes on now, while there is no End-of-RIB yet to
+        miss.
+        '''
+        if self.eor_method == 'json':
+            output = self.observe(['vtysh', '-c', 'show bgp neighbors {0} json'.format(monitor_address)])
+            states = eor_states((output or b'').decode('utf-8', 'replace'))
+            if monitor_address in states and states[monitor_address] is None:
+                print('FRR does not report End-of-RIB in its JSON; reading bgpd.log at debug instead')
+                self._enable_debug_log()
+                self.eor_method = 'log'
+        return self.eor_method
+
+    def _enable_debug_log(self):
+        '''Turn on the debug logging the 'log' method reads, in a running bgpd.'''
+        self.local(['vtysh', '-c', 'configure terminal', '-c', 'log stdout debug'])
+
     def get_neighbor_received_routes(self):
-        # FRR doesn't have a counter to look at to see if all the prefixes have been sent
-        # instead we have to look at the log file and see if End-of-RIB has been sent for the neighbor
+        # FRR doesn't have a counter to look at to see if all the prefixes have
+        # been sent; instead we look for End-of-RIB from each neighbor, in
+        # bgpd's own per-peer state or in its debug log
         neighbors_received_full, neighbors_checked = super(FRRoutingTarget, self).get_neighbor_received_routes()
-
-        assert(all(value == False for value in neighbors_received_full.values()))
-        neighbors_received_full = self._get_EOR_from_log(neighbors_received_full)
+        if self.bmp is not None and self.bmp.connected.is_set():
+            # End-of-RIB came in over BMP with everything else. Asked on every
+            # poll: once the session drops, it is bgpd again.
+            return neighbors_received_full, neighbors_checked
+
+        if self.eor_method == 'json':
+            neighbors_received_full = self._get_EOR_from_json(neighbors_received_full,
+                                                              neighbors_checked)
+        else:
+            neighbors_received_full = self._get_EOR_from_log(neighbors_received_full)
 
         assert(len(neighbors_received_full) == len(neighbors_checked))
 
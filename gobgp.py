@@ -14,6 +14,8 @@
 # limitations under the License.
 
 from base import *
+import gobgp_api
+import threading
 import yaml
 import json
 
@@ -80,8 +82,10 @@ RUN rm -rf /root/gobgp && cp /go/bin/gobgp /root/gobgp
 class GoBGPTarget(GoBGP, Target):
 
     CONTAINER_NAME = 'bgperf_gobgp_target'
+    DAEMON_PROCESSES = ('gobgpd',)
     CONFIG_FILE_NAME = 'gobgpd.conf'
     DYNAMIC_NEIGHBORS = True
+    BMP_SUPPORTED = True
 
     def write_config(self):
 
@@ -160,6 +164,10 @@ class GoBGPTarget(GoBGP, Target):
             config['dynamic-neighbors'] = [{'config': {'prefix': '10.0.0.0/8', 'peer-group': 'everything'}}]
         else:
             config['neighbors'] = [gen_neighbor_config(n) for n in list(flatten(list(t.get('neighbors', {}).values()) for t in self.scenario_global_conf['testers'])) + [self.scenario_global_conf['monitor']]]
+        if self.bmp is not None:
+            config['bmp-servers'] = [{'config': {'address': self.bmp.address, 'port': self.bmp.port,
+                                                 'route-monitoring-policy': 'both',
+                                                 'statistics-timeout': 1}}]
         with open('{0}/{1}'.format(self.host_dir, self.CONFIG_FILE_NAME), 'w') as f:
             f.write(yaml.dump(config, default_flow_style=False))
         return config
@@ -174,10 +182,75 @@ class GoBGPTarget(GoBGP, Target):
             config_file_name=self.CONFIG_FILE_NAME,
             debug_level='info')
 
+    # The gRPC connection once it has answered; see gobgp_api.py. Until then
+    # each poll tries again, up to API_ATTEMPTS, to cover the daemon starting.
+    # The poll and the watch thread both connect, so under api_lock: one
+    # target runs at a time, and a lock per class is enough.
+    api = None
+    api_attempts = 0
+    API_ATTEMPTS = 30
+    api_lock = threading.Lock()
+
+    def connect_api(self):
+        with self.api_lock:
+            if self.api is not None or self.api_attempts >= self.API_ATTEMPTS \
+                    or not gobgp_api.available() or self.stop_monitoring:
+                return self.api
+            self.api_attempts += 1
+            api = None
+            try:
+                api = gobgp_api.GoBGPApi(self.conf['local-address'])
+                api.peers()
+            except Exception:
+                if api is not None:
+                    api.close()
+                return None
+            self.api = api
+            self.neighbor_source = 'grpc'
+            return api
+
+    def close_api(self):
+        '''Cancel the peer event stream and close the channel; finish_bench()
+        calls this once monitoring has stopped.'''
+        with self.api_lock:
+            if self.api is not None:
+                self.api.close()
+                self.api = None
+
+    def neighbor_stats(self, queue, interval=1):
+        super(GoBGPTarget, self).neighbor_stats(queue, interval)
+        if not gobgp_api.available():
+            return
+
+        def watch():
+            # Report a session coming up or going down the moment the daemon
+            # says so, on top of the polls. A daemon without peer events --
+            # or a dropped stream -- just leaves the polls.
+            while self.connect_api() is None:
+                if self.stop_monitoring or self.api_attempts >= self.API_ATTEMPTS:
+                    return
+                time.sleep(interval)
+            try:
+                for _ in self.api.watch_peers():
+                    if self.stop_monitoring:
+                        return
+                    self.put_neighbor_state(queue)
+            except Exception:
+                return
+
+        t = Thread(target=watch, name='neighbor-watch')
+        t.daemon = True
+        t.start()
+
     def get_neighbors_state(self):
+        if self.connect_api() is not None:
+            try:
+                return self.api.neighbor_counts()
+            except Exception:
+                pass
         neighbors_accepted = {}
         neighbors_received = {}
-        neighbor_received_output = self.local("/root/gobgp neighbor -j")
+        neighbor_received_output = self.observe("/root/gobgp neighbor -j")
         if neighbor_received_output:
             neighbor_received_output = json.loads(neighbor_received_output.decode('utf-8'))
 
@@ -0,0 +1,85 @@
+# GoBGP and RustyBGP target state over their gRPC API instead of the gobgp CLI.
+#
+# GoBGPTarget.get_neighbors_state(), which RustyBGPTarget inherits, used to exec
+# `/root/gobgp neighbor -j` into the target every sample: a fork and exec of a
+# Go binary on the machine being measured, which then asked gobgpd over gRPC
+# anyway, marshalled every peer to JSON, and had bgperf2 parse the lot. Both
+# daemons serve that API on :50051, so bgperf2 now asks it directly from the
+# host -- one connection, no exec, no JSON -- and subscribes to its peer
+# events, so a session coming up or going down is reported when it happens
+# rather than at the next poll.
+#
+# The prefix counts still come from ListPeer once per sample. The API's table
+# watch would push them as they change, but only by streaming every path the
+# target learns, which is work the daemon under test would be doing for us.
+#
+# grpc and the GoBGP stubs are optional. Generate the stubs from the GoBGP
+# release the targets run (see the README); without them, or when the target
+# cannot be reached, the CLI path is used as before.
+
+try:
+    import grpc
+    import gobgp_pb2
+    import gobgp_pb2_grpc
+except ImportError:
+    grpc = None
+
+API_PORT = 50051
+
+
+def available():
+    '''Whether the grpc package and the GoBGP stubs are importable.'''
+    return grpc is not None
+
+
+def peer_counts(peers):
+    '''({neighbor: received}, {neighbor: accepted}) from ListPeer's Peer messages.
+
+    The same numbers, with the same defaults, as the `gobgp neighbor -j` path:
+    a peer with no address family state yet counts zero.
+    '''
+    received = {}
+    accepted = {}
+    for peer in peers:
+        address = peer.state.neighbor_address
+        state = peer.afi_safis[0].state if len(peer.afi_safis) else None
+        received[address] = int(state.received) if state is not None else 0
+        accepted[address] = int(state.accepted) if state is not None else 0
+    return received, accepted
+
+
+class GoBGPApi(object):
+    '''A gRPC connection to one gobgpd or rustybgpd.'''
+
+    def __init__(self, address, port=API_PORT, timeout=5):
+        self.target = '{0}:{1}'.format(address, port)
+        self.timeout = timeout
+        self.channel = grpc.insecure_channel(self.target)
+        self.stub = gobgp_pb2_grpc.GobgpApiStub(self.channel)
+        # the WatchEvent call, once watch_peers() has started it
+        self.events = None
+
+    def peers(self):
+        return [r.peer for r in self.stub.ListPeer(gobgp_pb2.ListPeerRequest(),
+                                                   timeout=self.timeout)]
+
+    def neighbor_counts(self):
+        return peer_counts(self.peers())
+
+    def watch_peers(self):
+        '''(neighbor address, session state) for every peer event, as they happen.
+
+        Blocks for as long as the stream lasts; run it on its own thread.
+        '''
+        request = gobgp_pb2.WatchEventRequest(peer=gobgp_pb2.WatchEventRequest.Peer())
+        self.events = self.stub.WatchEvent(request)
+        for response in self.events:
+            if response.HasField('peer'):
+                peer = response.peer.peer
+                yield peer.state.neighbor_address, peer.state.session_state
+
+    def close(self):
+        '''Cancel the event stream, so watch_peers() returns, and close the channel.'''
+        if self.events is not None:
+            self.events.cancel()
+        self.channel.close()
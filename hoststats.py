@@ -0,0 +1,113 @@
+# Whole-machine idle CPU, available memory and pressure stall, read from /proc.
+#
+# min idle% and min free mem (GB) used to come from forking `mpstat 1 1` and
+# `free -m` in two loops, so every second of every run the machine under test
+# also ran two short-lived processes for the harness, and parsed their text
+# with regexes that broke whenever sysstat changed its column layout. Both
+# tools only read /proc/stat and /proc/meminfo; this reads them directly and
+# takes the deltas itself.
+#
+# The meanings are kept: idle is mpstat's %idle (iowait is not idle), and free
+# is what `free` calls "available", MemAvailable, which is the field the old
+# regex captured. Pressure stall information is new, and says what idle cannot:
+# whether anything was actually waiting for a CPU, for memory, or for I/O.
+#
+# Kept free of Docker and privileges so the test suite can cover it.
+
+import os
+
+PRESSURE_RESOURCES = ('cpu', 'memory', 'io')
+
+
+def parse_cpu_times(text):
+    '''(idle, total) jiffies from the aggregate 'cpu' line of /proc/stat.
+
+    guest and guest_nice are already counted inside user and nice, so they are
+    left out of the total rather than counted twice.
+    '''
+    for line in text.splitlines():
+        if line.startswith('cpu '):
+            fields = [int(v) for v in line.split()[1:]]
+            # user nice system idle iowait irq softirq steal [guest guest_nice]
+            return fields[3], sum(fields[:8])
+    return None
+
+
+def idle_percent(previous, current):
+    '''mpstat's %idle between two parse_cpu_times() samples.'''
+    if previous is None or current is None:
+        return None
+    total = current[1] - previous[1]
+    if total <= 0:
+        return None
+    return (current[0] - previous[0]) / total * 100.0
+
+
+def parse_meminfo(text):
+    '''MemAvailable in bytes, from /proc/meminfo.'''
+    for line in text.splitlines():
+        if line.startswith('MemAvailable:'):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+def parse_pressure(text):
+    '''{'some': total_usec, 'full': total_usec} from a /proc/pressure file.
+
+    Only the cumulative totals are used. The kernel's avg10/avg60 are decaying
+    averages over windows that have nothing to do with when the samples were
+    taken, so the stall between two samples is computed from the totals.
+    '''
+    totals = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        for field in fields[1:]:
+            key, _, value = field.partition('=')
+            if key == 'total':
+                try:
+                    totals[fields[0]] = int(value)
+                except ValueError:
+                    pass
+    return totals
+
+
+def stall_percent(previous, current, elapsed_seconds, kind='some'):
+    '''Share of the interval in which some task was stalled on a resource.'''
+    if not previous or not current or elapsed_seconds <= 0 or kind not in current:
+        return None
+    stalled = current[kind] - previous.get(kind, 0)
+    return max(stalled, 0) / (elapsed_seconds * 1_000_000) * 100.0
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return ''
+
+
+def sample_host(proc_root='/proc'):
+    '''One reading of everything the host sampler reports on.
+
+    /proc/pressure is absent before 4.20 and on kernels booted with psi=0; its
+    entries then read as empty and the stall percentages as None.
+    '''
+    return {
+        'cpu': parse_cpu_times(_read(os.path.join(proc_root, 'stat'))),
+        'available': parse_meminfo(_read(os.path.join(proc_root, 'meminfo'))),
+        'pressure': {r: parse_pressure(_read(os.path.join(proc_root, 'pressure', r)))
+                     for r in PRESSURE_RESOURCES},
+    }
+
+
+def summarize(previous, current, elapsed_seconds):
+    '''The queue message fields bench() reads: idle, free and psi_<resource>.'''
+    out = {'idle': idle_percent(previous['cpu'], current['cpu']),
+           'free': current['available']}
+    for r in PRESSURE_RESOURCES:
+        out['psi_' + r] = stall_percent(previous['pressure'][r], current['pressure'][r],
+                                        elapsed_seconds)
+    return out
@@ -37,6 +37,7 @@ class Junos(Container):
 class JunosTarget(Junos, Target):
     
     CONTAINER_NAME = 'bgperf_junos_target'
+    DAEMON_PROCESSES = ('rpd',)
     CONFIG_FILE_NAME = 'juniper.conf.gz'
 
     def __init__(self, host_dir, conf, image='crpd'):
@@ -96,7 +97,7 @@ class JunosTarget(Junos, Target):
     def get_neighbors_state(self):
         neighbors_accepted = {}
         neighbors_received = {}
-        neighbor_received_output = json.loads(self.local(r"cli show bgp neighbor \| no-more \| display json").decode('utf-8'))
+        neighbor_received_output = json.loads(self.observe(r"cli show bgp neighbor \| no-more \| display json").decode('utf-8'))
 
         for neighbor in neighbor_received_output['bgp-information'][0]['bgp-peer']:
 
@@ -0,0 +1,150 @@
+# The running cell's numbers, live, for Prometheus.
+#
+# During a batch the only view of a cell in flight was bench()'s progress
+# line, rewritten in place on one terminal. With --metrics-port bgperf2 serves
+# the same numbers, and the batch's progress through its cells, as OpenMetrics
+# on http://<host>:<port>/metrics; with --metrics-textfile it rewrites them to
+# a file for node_exporter's textfile collector instead. Either way a lab that
+# already scrapes Prometheus can watch every bench machine for saturation and
+# stalls without tailing terminals.
+#
+# bench() updates a LiveMetrics once per monitor sample; serving reads a
+# snapshot of it under a lock, so a scrape never waits on the run and the run
+# never waits on a scrape.
+#
+# Kept free of Docker so the test suite can cover it.
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# name -> help text; every metric is a gauge, labelled with the run
+GAUGES = {
+    'elapsed_seconds': 'Seconds since the current cell started sampling.',
+    'target_cpu_percent': "The target's CPU, percent of one core.",
+    'target_memory_bytes': "The target's memory.",
+    'monitor_received_prefixes': 'Prefixes the monitor has received from the target.',
+    'monitor_ingest_rate': 'Prefixes per second reaching the monitor, over the last sample.',
+    'neighbors_received': 'Tester peers the target has received everything from.',
+    'neighbors_accepted': 'Tester peers whose prefixes the target has all accepted.',
+    'host_idle_percent': 'Idle CPU on the bench machine.',
+    'foreign_cpu_percent': 'CPU used on the bench machine by processes outside the benchmark.',
+    'harness_cpu_percent': "bgperf2's own CPU, its children included, percent of one core.",
+    'harness_rss_bytes': "bgperf2's own resident memory, its children included.",
+}
+# and for the batch as a whole, labelled with the test
+PROGRESS = {
+    'batch_cells_completed': 'Cells of the batch test with a result on disk.',
+    'batch_cells_total': 'Cells in the batch test.',
+}
+PREFIX = 'bgperf2_'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')
+                                                      .replace('\n', '\\n'))
+                          for k, v in sorted(labels.items())) + '}'
+
+
+def _value(value):
+    return repr(float(value))
+
+
+class LiveMetrics(object):
+    '''The latest value of every gauge, for one cell at a time.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.labels = {}
+        self.values = {}
+        self.progress = {}          # test -> (completed, total)
+        self._last = None           # (time, received) at the previous sample
+
+    def start_cell(self, **labels):
+        '''A new cell: its labels, and none of the last cell's values.'''
+        with self.lock:
+            self.labels = labels
+            self.values = {}
+            self._last = None
+
+    def update(self, **values):
+        '''Set gauges by name; a `monitor_received_prefixes` with an `elapsed_seconds`
+        also sets the ingest rate since the previous one.'''
+        with self.lock:
+            values = {k: v for k, v in values.items() if v is not None}
+            if 'monitor_received_prefixes' in values and 'elapsed_seconds' in values:
+                now = (values['elapsed_seconds'], values['monitor_received_prefixes'])
+                if self._last is not None and now[0] > self._last[0]:
+                    values['monitor_ingest_rate'] = (now[1] - self._last[1]) / (now[0] - self._last[0])
+                self._last = now
+            self.values.update(values)
+
+    def set_progress(self, test, completed, total):
+        with self.lock:
+            self.progress[test] = (completed, total)
+
+    def render(self):
+        '''Every gauge in the OpenMetrics text format, ending with # EOF.'''
+        with self.lock:
+            labels, values, progress = dict(self.labels), dict(self.values), dict(self.progress)
+        lines = []
+        for name, help_text in GAUGES.items():
+            if name not in values:
+                continue
+            lines += ['# TYPE {0}{1} gauge'.format(PREFIX, name),
+                      '# HELP {0}{1} {2}'.format(PREFIX, name, help_text),
+                      '{0}{1}{2} {3}'.format(PREFIX, name, _labels(labels), _value(values[name]))]
+        for i, (name, help_text) in enumerate(PROGRESS.items() if progress else ()):
+            lines += ['# TYPE {0}{1} gauge'.format(PREFIX, name),
+                      '# HELP {0}{1} {2}'.format(PREFIX, name, help_text)]
+            lines += ['{0}{1}{2} {3}'.format(PREFIX, name, _labels({'test': test}), _value(p[i]))
+                      for test, p in sorted(progress.items())]
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        '''Replace `path` with the current metrics, atomically, as the textfile
+        collector requires.'''
+        temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+
+class MetricsServer(object):
+    '''GET /metrics on a port of its own, answered from a thread.'''
+
+    def __init__(self, metrics, port, address=''):
+        self.metrics = metrics
+        self.port = port
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] != '/metrics':
+                    handler.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', CONTENT_TYPE)
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                # a scrape every few seconds would bury the progress line
+                pass
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        t = threading.Thread(target=self.server.serve_forever, name='metrics')
+        t.daemon = True
+        t.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
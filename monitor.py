@@ -20,8 +20,14 @@ from  settings import dckr
 import yaml
 import json
 from threading import Thread
+import threading
+import asyncio
+import platform
 import time
-import datetime
+from bgpwire import (BGPError, HEADER_LEN, OPEN, UPDATE, NOTIFICATION, KEEPALIVE,
+                     PrefixTable, encode_open, encode_keepalive, parse_header,
+                     parse_open, parse_update, parse_notification)
+from canary import is_canary
 
 def rm_line():
     print('\x1b[1A\x1b[2K\x1b[1D\x1b[1A')
@@ -60,8 +66,9 @@ gobgpd -t yaml -f {1}/{2} -l {3} > {1}/gobgpd.log 2>&1
         return ctn
 
     def local(self, cmd, stream=False):
-        i = dckr.exec_create(container=self.name, cmd=cmd)
-        return dckr.exec_start(i['Id'], stream=stream)
+        # gobgp's errors are part of what the callers parse, so unlike
+        # Container.local() stderr comes back with the output
+        return super(Monitor, self).local(cmd, stream=stream, stderr=True)
 
     def wait_established(self, neighbor):
         n = 0
@@ -86,7 +93,7 @@ gobgpd -t yaml -f {1}/{2} -l {3} > {1}/gobgpd.log 2>&1
 
             n = n+1
 
-    def stats(self, queue):
+    def stats(self, queue, interval=1):
         self.stop_monitoring = False
         def stats():
             cps = self.config['monitor']['check-points'] if 'check-points' in self.config['monitor'] else []
@@ -101,16 +108,197 @@ gobgpd -t yaml -f {1}/{2} -l {3} > {1}/gobgpd.log 2>&1
 
                 info['who'] = self.name
                 state = info['afi_safis'][0]['state']
+                # top-level, so bench() reads the count the same way from
+                # either monitor
+                info['accepted'] = int(state.get('accepted', 0))
+                # UPDATEs the target sent us, as the native monitor counts them
+                updates = info.get('state', {}).get('messages', {}).get('received', {}).get('update')
+                info['updates'] = int(updates) if updates is not None else None
                 if 'accepted'in state and len(cps) > 0 and int(cps[0]) <= int(state['accepted']):
                     #cps.pop(0)
                     info['checked'] = True
                 else:
                     info['checked'] = False
-                info['time'] = datetime.datetime.now()
+                info['time'] = time.monotonic_ns()
                 queue.put(info)
-                time.sleep(1)
+                time.sleep(interval)
 
-        t = Thread(target=stats)
+        t = Thread(target=stats, name='monitor-stats')
         t.daemon = True
         t.start()
 
+
+
+class NativeMonitor(object):
+    '''The monitor as a BGP speaker inside bgperf2 itself, not a container.
+
+    Monitor asks a GoBGP container for its `accepted` count once a second over
+    `docker exec`, so convergence could only ever be seen to the second, and the
+    exec itself costs a fork on the machine under test every sample. This one
+    holds the session from an asyncio loop on the host and counts prefixes as
+    the UPDATEs arrive, so it knows to the millisecond when the target first
+    sent a route and when its table last changed.
+
+    It binds to the Docker bridge's gateway address, the host's own address on
+    the bench network; bench() puts that into conf['monitor'] before the target
+    writes its config, so the target peers with it like any other monitor.
+    Its messages to the queue carry the same 'accepted' and 'checked' Monitor's
+    do, plus 'first_update' and 'last_change'.
+    '''
+
+    CONTAINER_NAME = 'bgperf_native_monitor'
+    PORT = 179
+    CONNECT_RETRY = 1
+    HOLD_TIME = 90
+
+    def __init__(self, host_dir, conf):
+        self.name = self.CONTAINER_NAME
+        self.host_dir = host_dir
+        self.conf = conf
+        # nothing was pulled or built; collect_provenance() records it as such
+        self.image = None
+        self.port = self.PORT
+        self.table = PrefixTable()
+        self.established = threading.Event()
+        self.stop_monitoring = False
+        self.peer_open = None
+        self.first_update = None
+        self.last_change = None
+        self.error = None
+        # bench --canary: a CanarySpeaker whose marker prefixes are timed
+        # rather than counted; see canary.py
+        self.canary = None
+        self._loop = None
+        self._task = None
+
+    def run(self, conf, dckr_net_name=''):
+        self.config = conf
+        self.peer = conf['target']['local-address']
+        self.local_address = conf['monitor']['local-address']
+        self._loop = asyncio.new_event_loop()
+        t = Thread(target=self._run_loop, name='native-monitor')
+        t.daemon = True
+        t.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._task = self._loop.create_task(self._connect())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    def close(self):
+        self.stop_monitoring = True
+        if self._loop is not None and self._task is not None and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            except RuntimeError:
+                # the loop closed between the check and the call
+                pass
+
+    async def _connect(self):
+        while not self.stop_monitoring:
+            try:
+                reader, writer = await asyncio.open_connection(
+                    self.peer, self.port, local_addr=(self.local_address, 0))
+            except OSError as e:
+                self.error = str(e)
+                await asyncio.sleep(self.CONNECT_RETRY)
+                continue
+            try:
+                await self._session(reader, writer)
+            except (OSError, asyncio.IncompleteReadError, BGPError) as e:
+                self.error = str(e)
+            finally:
+                # like any BGP speaker, forget what the session taught us
+                self.established.clear()
+                self.table.clear()
+                writer.close()
+            await asyncio.sleep(self.CONNECT_RETRY)
+
+    async def _session(self, reader, writer):
+        asn = int(self.conf['as'])
+        writer.write(encode_open(asn, self.conf['router-id'], self.HOLD_TIME))
+        await writer.drain()
+        keepalives = None
+        try:
+            while True:
+                length, msg_type = parse_header(await reader.readexactly(HEADER_LEN))
+                body = await reader.readexactly(length - HEADER_LEN)
+                if msg_type == UPDATE:
+                    withdrawn, nlri, eor = parse_update(body)
+                    now = time.monotonic_ns()
+                    if self.canary is not None:
+                        nlri = self.canary.ledger.take(nlri, now)
+                        withdrawn = [k for k in withdrawn if not is_canary(k)] if withdrawn else withdrawn
+                    if self.table.apply(withdrawn, nlri, eor):
+                        if self.first_update is None:
+                            self.first_update = now
+                        self.last_change = now
+                elif msg_type == KEEPALIVE:
+                    self.established.set()
+                elif msg_type == OPEN:
+                    self.peer_open = parse_open(body)
+                    hold = min(self.HOLD_TIME, self.peer_open['hold_time'])
+                    writer.write(encode_keepalive())
+                    await writer.drain()
+                    if hold > 0:
+                        keepalives = asyncio.ensure_future(self._keepalive(writer, hold / 3))
+                elif msg_type == NOTIFICATION:
+                    raise BGPError(parse_notification(body))
+        finally:
+            if keepalives is not None:
+                keepalives.cancel()
+
+    async def _keepalive(self, writer, interval):
+        while True:
+            await asyncio.sleep(interval)
+            writer.write(encode_keepalive())
+            await writer.drain()
+
+    def wait_established(self, neighbor):
+        n = 0
+        while True:
+            if n > 0:
+                 rm_line()
+            print(f"Waiting {n} seconds for monitor")
+            if self.established.wait(1):
+                return n
+            n = n+1
+
+    def sample(self):
+        '''One queue message: what Monitor.stats() sends, from our own table.'''
+        cps = self.config['monitor']['check-points'] if 'check-points' in self.config['monitor'] else []
+        accepted = self.table.accepted
+        return {'who': self.name,
+                'accepted': accepted,
+                'received': self.table.nlri,
+                'withdrawn': self.table.withdrawn,
+                'updates': self.table.updates,
+                'end_of_rib': self.table.end_of_rib,
+                'checked': len(cps) > 0 and int(cps[0]) <= accepted,
+                'first_update': self.first_update,
+                'last_change': self.last_change,
+                'time': time.monotonic_ns()}
+
+    def stats(self, queue, interval=1):
+        self.stop_monitoring = False
+        def stats():
+            # The counting happens as UPDATEs arrive; this only reports it,
+            # every `interval` seconds, for bench()'s convergence checks.
+            while True:
+                if self.stop_monitoring:
+                    self.close()
+                    return
+                queue.put(self.sample())
+                time.sleep(interval)
+
+        t = Thread(target=stats, name='monitor-stats')
+        t.daemon = True
+        t.start()
+
+    def version_string(self):
+        return 'bgperf2 native monitor (python {0})'.format(platform.python_version())
@@ -0,0 +1,178 @@
+# The BGP sessions' TCP state and the bench network's packet counters.
+#
+# When convergence is slow, elapsed (s) cannot say where the time went: the
+# target not reading its sockets, a tester not writing, or the bridge between
+# them dropping packets. Each one leaves its own mark:
+#
+#   Recv-Q     bytes the kernel has received for the target that the daemon
+#              has not read yet. Growing while the testers' side is quiet is
+#              backpressure: the daemon, not the network, is the bottleneck.
+#   Send-Q     bytes the target has written and the peer has not acknowledged
+#              -- the monitor falling behind, from the target's side
+#   rwnd       the window the peer advertises (ss's snd_wnd); near zero means
+#              the peer stopped reading
+#   rtt        a bridge between containers should be microseconds; a
+#              millisecond RTT means a queue somewhere
+#   retrans    segments sent again, per session over its lifetime
+#
+# These come from `ss -tin` run in the target's network namespace -- the
+# host's ss, entered with `nsenter -n` as observer.py enters the container for
+# its status commands -- for every session on port 179. Without root the
+# queues are still readable from /proc/<pid>/net/tcp, which every user can
+# read; RTT, window and retransmits are then left blank.
+#
+# On the host side, /proc/net/dev has the bridge's and every veth's byte,
+# packet and drop counters, and /proc/net/softnet_stat the packets each CPU's
+# backlog dropped or left for the next softirq (time squeeze).
+#
+# Kept free of Docker so the test suite can cover it.
+
+import os
+import re
+import shutil
+import subprocess
+
+BGP_PORT = 179
+
+# What one session sample holds, in the order samples.py stores it.
+SESSION_FIELDS = ('recv_q', 'send_q', 'rtt', 'retrans', 'rwnd')
+DEVICE_FIELDS = ('rx_bytes', 'rx_packets', 'rx_drop', 'tx_bytes', 'tx_packets', 'tx_drop')
+
+_SS_STATE = re.compile(r'^(\S+)\s+(\d+)\s+(\d+)\s+(\S+)\s+(\S+)')
+_SS_RTT = re.compile(r'\brtt:([\d.]+)/')
+_SS_RETRANS = re.compile(r'\bretrans:\d+/(\d+)')
+_SS_SND_WND = re.compile(r'\bsnd_wnd:(\d+)')
+
+
+def _split_address(address):
+    '''('10.10.0.3', 179) from '10.10.0.3:179', '[::ffff:10.10.0.3]:179'
+    or '::ffff:10.10.0.3:179'.'''
+    host, _, port = address.rpartition(':')
+    host = host.strip('[]')
+    if host.startswith('::ffff:'):
+        host = host[len('::ffff:'):]
+    return host, int(port) if port.isdigit() else 0
+
+
+def parse_ss(text, port=BGP_PORT):
+    '''{peer address: {field: value}} for every established session to or
+    from `port`, from `ss -tin` output.'''
+    sessions = {}
+    current = None
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if line[0].isspace():
+            if current is None:
+                continue
+            m = _SS_RTT.search(line)
+            if m:
+                current['rtt'] = float(m.group(1)) / 1e3
+            m = _SS_RETRANS.search(line)
+            current['retrans'] = int(m.group(1)) if m else 0
+            m = _SS_SND_WND.search(line)
+            if m:
+                current['rwnd'] = int(m.group(1))
+            continue
+        current = None
+        m = _SS_STATE.match(line)
+        if not m or m.group(1) != 'ESTAB':
+            continue
+        local, peer = _split_address(m.group(4)), _split_address(m.group(5))
+        if port not in (local[1], peer[1]):
+            continue
+        current = sessions[peer[0]] = {'recv_q': int(m.group(2)), 'send_q': int(m.group(3))}
+    return sessions
+
+
+def _hex_address(text):
+    address, port = text.split(':')
+    # /proc/net/tcp stores the IPv4 address in host byte order
+    octets = [str(int(address[i:i + 2], 16)) for i in range(0, 8, 2)][::-1]
+    return '.'.join(octets), int(port, 16)
+
+
+def parse_proc_tcp(text, port=BGP_PORT):
+    '''parse_ss() from /proc/<pid>/net/tcp: the queues only.'''
+    sessions = {}
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 5 or fields[3] != '01':          # TCP_ESTABLISHED
+            continue
+        try:
+            local, peer = _hex_address(fields[1]), _hex_address(fields[2])
+            send_q, recv_q = (int(v, 16) for v in fields[4].split(':'))
+        except ValueError:
+            continue
+        if port in (local[1], peer[1]):
+            sessions[peer[0]] = {'recv_q': recv_q, 'send_q': send_q}
+    return sessions
+
+
+def parse_net_dev(text, names=None):
+    '''{interface: {field: count}} from /proc/net/dev, for `names` if given.'''
+    devices = {}
+    for line in text.splitlines()[2:]:
+        name, _, counters = line.partition(':')
+        name = name.strip()
+        if not counters or (names is not None and name not in names):
+            continue
+        v = counters.split()
+        if len(v) < 12:
+            continue
+        devices[name] = {'rx_bytes': int(v[0]), 'rx_packets': int(v[1]), 'rx_drop': int(v[3]),
+                         'tx_bytes': int(v[8]), 'tx_packets': int(v[9]), 'tx_drop': int(v[11])}
+    return devices
+
+
+def parse_softnet(text):
+    '''{'dropped', 'squeezed'} summed over every CPU in /proc/net/softnet_stat.'''
+    dropped = squeezed = 0
+    for line in text.splitlines():
+        v = line.split()
+        if len(v) >= 3:
+            dropped += int(v[1], 16)
+            squeezed += int(v[2], 16)
+    return {'dropped': dropped, 'squeezed': squeezed}
+
+
+def bridge_members(bridge, sys_root='/sys/class/net'):
+    '''The bridge and every interface enslaved to it.'''
+    try:
+        return [bridge] + sorted(os.listdir(os.path.join(sys_root, bridge, 'brif')))
+    except OSError:
+        return []
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return ''
+
+
+def read_sessions(pid, use_ss, proc_root='/proc'):
+    '''The target's BGP sessions, through ss when `use_ss`, else /proc.'''
+    if use_ss:
+        try:
+            out = subprocess.run(['nsenter', '-t', str(pid), '-n', '--', 'ss', '-tin'],
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                 timeout=10).stdout
+            return parse_ss(out.decode('utf-8', 'replace'))
+        except (OSError, subprocess.SubprocessError):
+            pass
+    return parse_proc_tcp(_read(os.path.join(proc_root, str(pid), 'net', 'tcp')))
+
+
+def can_use_ss():
+    return os.geteuid() == 0 and shutil.which('nsenter') is not None \
+        and shutil.which('ss') is not None
+
+
+def read_network(bridge, proc_root='/proc', sys_root='/sys/class/net'):
+    '''({device: counters}, softnet) for the bench bridge and its veths, on the host.'''
+    members = bridge_members(bridge, sys_root) if bridge else []
+    devices = parse_net_dev(_read(os.path.join(proc_root, 'net', 'dev')), set(members)) \
+        if members else {}
+    return devices, parse_softnet(_read(os.path.join(proc_root, 'net', 'softnet_stat')))
@@ -16,7 +16,6 @@ sudo apt update
 sudo apt upgrade --yes
 sudo apt install docker.io --yes
 sudo apt install python3-venv --yes
-sudo apt install sysstat --yes
 sudo usermod -aG docker "$USER"
 
 python3 -m venv venv
@@ -0,0 +1,89 @@
+# Running the target's status commands without billing them to the target.
+#
+# Every second bench() asks the target how its neighbors are doing -- birdc,
+# vtysh, bgpctl, gobgp, or on the commercial images Junos `cli ... display
+# json` and EOS `Cli`, which are heavy programs in their own right. Through
+# `docker exec` each of those runs inside the target's cgroup, so max cpu % and
+# max mem (GB) included bgperf2's own polling: the instrument was inflating the
+# number it reports.
+#
+# Two ways out, best first:
+#
+#   nsenter  Run the command from the host, entering the container's mount,
+#            network, IPC, UTS and PID namespaces but not its cgroup. It reaches
+#            the same control socket with the same binary, and its CPU and
+#            memory land in bgperf2's own cgroup. Needs root.
+#
+#   exec     Still `docker exec`, but wrapped in a shell that reports, once the
+#            command has been waited for, its children's CPU (cutime and
+#            cstime from /proc/$$/stat). That CPU is then taken off the
+#            target's cgroup reading. Memory cannot be taken off that way; a
+#            status command's few MB are only resident while it runs.
+#
+# Kept free of Docker and privileges so the test suite can cover it.
+
+import os
+import shlex
+import shutil
+
+# Separates a wrapped command's own output from the accounting after it.
+SENTINEL = b'__bgperf2_observer_accounting__'
+
+# Fields of /proc/<pid>/stat counted from after the comm field, as in
+# contention.py: cutime is field 16 and cstime 17.
+_CUTIME_AFTER_COMM = 13
+_CSTIME_AFTER_COMM = 14
+
+# The namespaces nsenter joins. Not the cgroup namespace, and it would not
+# matter if it did: only moving the process changes where it is accounted.
+NSENTER_NAMESPACES = ('-m', '-u', '-i', '-n', '-p')
+
+
+def can_nsenter():
+    '''Whether this process can enter another process's namespaces.'''
+    return os.geteuid() == 0 and shutil.which('nsenter') is not None
+
+
+def _argv(cmd):
+    return shlex.split(cmd) if isinstance(cmd, str) else [str(a) for a in cmd]
+
+
+def nsenter_argv(pid, cmd):
+    '''The host-side argv that runs `cmd` in the namespaces of `pid`.
+
+    `cmd` is split the way `docker exec` splits a string command -- no shell --
+    so every target's command means exactly what it did before. An argv list
+    is used as it is.
+    '''
+    return ['nsenter', '-t', str(pid)] + list(NSENTER_NAMESPACES) + ['--'] + _argv(cmd)
+
+
+def accounted_argv(cmd):
+    '''A `docker exec` argv that runs `cmd` and then reports what it cost.
+
+    The shell waits for `cmd` before reading its own stat, so cutime and
+    cstime hold exactly that command's CPU; the cat that prints them has not
+    been waited for yet and is not included.
+    '''
+    if not isinstance(cmd, str):
+        cmd = ' '.join(shlex.quote(str(a)) for a in cmd)
+    script = '{0}; echo; echo {1}; cat /proc/$$/stat'.format(cmd, SENTINEL.decode())
+    return ['sh', '-c', script]
+
+
+def split_accounted(output):
+    '''(command output, CPU ticks it used) from an accounted_argv() run.
+
+    The ticks are None when the accounting is missing, so a target with no
+    `sh` still returns its command's output and simply goes uncorrected.
+    '''
+    head, sep, tail = output.rpartition(b'\n' + SENTINEL + b'\n')
+    if not sep:
+        return output, None
+    text = tail.decode('utf-8', 'replace')
+    fields = text[text.rfind(')') + 1:].split()
+    try:
+        ticks = int(fields[_CUTIME_AFTER_COMM]) + int(fields[_CSTIME_AFTER_COMM])
+    except (IndexError, ValueError):
+        ticks = None
+    return head, ticks
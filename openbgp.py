@@ -66,6 +66,8 @@ CMD ["/bin/sh"]
 class OpenBGPTarget(OpenBGP, Target):
     
     CONTAINER_NAME = 'bgperf_openbgp_target'
+    # the parent, session engine and route decision engine all call themselves bgpd
+    DAEMON_PROCESSES = ('bgpd',)
     CONFIG_FILE_NAME = 'bgpd.conf'
 
     def __init__(self, host_dir, conf, image='bgperf/openbgp'):
@@ -157,7 +159,7 @@ fib-update no
     def get_neighbors_state(self):
         neighbors_accepted = {}
         neighbors_received_full = {}
-        neighbor_received_output = json.loads(self.local("/usr/sbin/bgpctl -j show neighbor").decode('utf-8'))
+        neighbor_received_output = json.loads(self.observe("/usr/sbin/bgpctl -j show neighbor").decode('utf-8'))
         for neigh in neighbor_received_output['neighbors']:
             neighbors_accepted[neigh['remote_addr']] = neigh['stats']['prefixes']['received']
             neighbors_received_full[neigh['remote_addr']] = False if neigh['stats']['update']['received']['eor'] == 0 else True
@@ -0,0 +1,99 @@
+# Where a run's wall-clock time goes, as a Chrome trace.
+#
+# total time (s) in the CSV is one number for everything bench() does: tear
+# down the last run, create the network, start the monitor, create every
+# tester container, launch them, wait for the monitor's session, converge,
+# scan the tester logs, read every daemon's version and draw the graphs.
+# docs/architecture-and-benchmark-roadmap.md already notes that testers (s)
+# comes out close to elapsed (s); before the harness can be made faster it
+# has to be seen where it is slow.
+#
+# bench() marks each of those phases, and base.py each container start and
+# each command run in a container, as a span on `tracer`: a name, a category,
+# and monotonic start and end times. finish_bench() writes them as
+# `<run>.trace.json` in the Chrome trace event format, which Perfetto
+# (ui.perfetto.dev) and chrome://tracing open as a timeline, one row per
+# thread -- bench() itself, the samplers, the asyncio loops.
+#
+# Kept free of Docker so the test suite can cover it.
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PhaseTrace(object):
+    '''Spans recorded from any thread, against one monotonic origin.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''Start a new trace: bench() calls this once per run.'''
+        with self.lock:
+            self.origin = time.monotonic_ns()
+            self.events = []
+            self.threads = {}
+            self.open = {}
+
+    def record(self, name, cat, started, ended, **args):
+        '''One complete span, from monotonic_ns `started` to `ended`.'''
+        thread = threading.current_thread()
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'pid': os.getpid(), 'tid': thread.ident,
+                 'ts': (started - self.origin) / 1e3, 'dur': max(ended - started, 0) / 1e3}
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+            self.threads[thread.ident] = thread.name
+
+    @contextmanager
+    def span(self, name, cat='phase', **args):
+        started = time.monotonic_ns()
+        try:
+            yield
+        finally:
+            self.record(name, cat, started, time.monotonic_ns(), **args)
+
+    def begin(self, name, cat='phase'):
+        '''Open a phase that end(name) closes, for spans too long for a `with`.'''
+        self.open[name] = (cat, time.monotonic_ns())
+
+    def end(self, name, **args):
+        '''Close the phase begin(name) opened; a phase never opened is ignored.'''
+        opened = self.open.pop(name, None)
+        if opened is not None:
+            self.record(name, opened[0], opened[1], time.monotonic_ns(), **args)
+
+    def durations(self, cat='phase'):
+        '''{span name: total seconds} for one category, in order of first appearance.'''
+        totals = {}
+        with self.lock:
+            for event in self.events:
+                if event['cat'] == cat:
+                    totals[event['name']] = totals.get(event['name'], 0) + event['dur'] / 1e6
+        return totals
+
+    def to_json(self):
+        '''The trace in Chrome's JSON object format.'''
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        pid = os.getpid()
+        meta = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'bgperf2'}}]
+        meta += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in threads.items()]
+        return {'traceEvents': meta + sorted(events, key=lambda e: e['ts']),
+                'displayTimeUnit': 'ms'}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f)
+            f.write('\n')
+        return path
+
+
+tracer = PhaseTrace()
@@ -0,0 +1,282 @@
+# Where the target daemon spent its CPU while it converged.
+#
+# The stats row says a version regressed; it cannot say why. Profiling used to
+# mean uncommenting `perf record -F 99 -p 17 -g` in FRR's startup script and
+# reading the output by hand. With `bench --profile` bgperf2 attaches
+# `perf record` from the host to the target daemon's own PIDs -- found the way
+# threadstats.py finds them -- for the convergence window only. perf runs
+# from the moment the testers are launched until the run ends, which is after
+# the assurance samples that confirm the count has stopped moving; it records
+# on the monotonic clock bench() keeps time with, so the samples taken after
+# the count last changed can be cut off when the stacks are folded. Startup
+# and the assurance samples are not in the profile.
+#
+# When the run ends the samples are folded into the collapsed-stack format
+# Brendan Gregg's FlameGraph tools read ("comm;outer;...;leaf count", one
+# stack per line) and drawn as an SVG flamegraph, both beside the run's other
+# output. `bgperf2.py profile-diff A.folded B.folded` compares two runs -- FRR
+# 9.1 against 10.7 on the same cell, say: a table of the functions whose share
+# of the samples moved most, and a differential flamegraph of B, red where it
+# spent a larger share than A and blue where a smaller one.
+#
+# Shares rather than sample counts, because a slower version is sampled for
+# longer: 20% more samples everywhere is a slower run, not a hotter function.
+#
+# The folding and drawing are kept free of perf and Docker so the test suite
+# can cover them; Profiler is the perf process around them.
+
+import os
+import re
+import signal
+import shutil
+import subprocess
+import zlib
+from collections import Counter
+from xml.sax.saxutils import escape
+
+# perf's default-ish rate, and the one the FRR notes used: off the 100Hz timer
+# tick, so sampling does not lock step with the daemon's own timers.
+PERF_FREQUENCY = 99
+
+FLAME_WIDTH = 1200
+FRAME_HEIGHT = 16
+FONT_SIZE = 11
+# Frames narrower than this are not drawn; they cannot be read anyway.
+MIN_FRAME_WIDTH = 0.1
+
+# A perf script sample header: "comm  pid/tid  timestamp: period event:"
+_SAMPLE_HEADER = re.compile(r'^(\S.*?)\s+(\d+)(?:/\d+)?\s+(?:\[\d+\]\s+)?[\d.]+:')
+# A stack frame: "\taddress symbol+offset (dso)"
+_FRAME = re.compile(r'^\s+[0-9a-f]+\s+(.*?)\s+\((.*)\)\s*$')
+
+
+def perf_record_cmd(pids, output, frequency=PERF_FREQUENCY):
+    '''argv for `perf record` of `pids`, with call graphs, into `output`.
+
+    Stamped with CLOCK_MONOTONIC, time.monotonic_ns()'s clock, so a sample's
+    time can be compared with bench()'s.
+    '''
+    return ['perf', 'record', '-F', str(frequency), '-g', '-k', 'CLOCK_MONOTONIC',
+            '-p', ','.join(map(str, pids)), '-o', output]
+
+
+def perf_script_cmd(data, until=None):
+    '''argv for `perf script` of `data`, up to monotonic_ns `until` if given.'''
+    cmd = ['perf', 'script', '-i', data]
+    if until is not None:
+        cmd += ['--time', ',{0:.6f}'.format(until / 1e9)]
+    return cmd
+
+
+def _frame_name(symbol, dso):
+    if symbol.startswith('[unknown]'):
+        # better than nothing: which binary or library it was in
+        return '[{0}]'.format(os.path.basename(dso)) if dso and dso != 'unknown' else '[unknown]'
+    # drop the +0x offset: every sample in a function is the same frame
+    return re.sub(r'\+0x[0-9a-f]+$', '', symbol).replace(';', ':')
+
+
+def fold_perf_script(text):
+    '''Counter {"comm;outermost;...;leaf": samples} from `perf script` output.'''
+    folded = Counter()
+    comm = None
+    frames = []
+
+    def flush():
+        if comm is not None:
+            folded[';'.join([comm] + frames[::-1])] += 1
+
+    for line in text.splitlines():
+        if not line.strip():
+            flush()
+            comm, frames = None, []
+            continue
+        if comm is None:
+            m = _SAMPLE_HEADER.match(line)
+            if m:
+                comm = m.group(1).strip().replace(' ', '_')
+            continue
+        m = _FRAME.match(line)
+        if m:
+            frames.append(_frame_name(m.group(1), m.group(2)))
+    flush()
+    return folded
+
+
+def write_folded(folded, path):
+    with open(path, 'w') as f:
+        for stack, count in sorted(folded.items()):
+            f.write('{0} {1}\n'.format(stack, count))
+    return path
+
+
+def read_folded(path):
+    folded = Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack and count.isdigit():
+                folded[stack] += int(count)
+    return folded
+
+
+def frame_shares(folded):
+    '''({call path: inclusive share}, {function: self share}), shares of all samples.'''
+    total = sum(folded.values())
+    inclusive = Counter()
+    own = Counter()
+    if not total:
+        return {}, {}
+    for stack, count in folded.items():
+        frames = stack.split(';')
+        for depth in range(1, len(frames) + 1):
+            inclusive[tuple(frames[:depth])] += count
+        own[frames[-1]] += count
+    return ({path: n / total for path, n in inclusive.items()},
+            {name: n / total for name, n in own.items()})
+
+
+def diff_table(before, after, limit=20):
+    '''[(function, % of before, % of after)] for the functions whose self
+    share moved most, largest change first.'''
+    _, a = frame_shares(before)
+    _, b = frame_shares(after)
+    rows = [(name, a.get(name, 0.0) * 100, b.get(name, 0.0) * 100) for name in set(a) | set(b)]
+    rows.sort(key=lambda r: (-abs(r[2] - r[1]), r[0]))
+    return rows[:limit]
+
+
+def _color(name):
+    # the flamegraph.pl "hot" palette, keyed on the name so a function keeps
+    # its colour from one graph to the next
+    h = zlib.crc32(name.encode('utf-8'))
+    return 'rgb({0},{1},{2})'.format(205 + h % 50, (h >> 8) % 230, (h >> 16) % 55)
+
+
+def _diff_color(delta):
+    # red for a larger share than the baseline, blue for smaller, white for none;
+    # full colour at five points of the total
+    strength = min(abs(delta) / 0.05, 1.0)
+    fade = int(255 * (1 - strength))
+    return 'rgb(255,{0},{0})'.format(fade) if delta > 0 else 'rgb({0},{0},255)'.format(fade)
+
+
+def flamegraph_svg(folded, title, baseline=None):
+    '''An SVG flamegraph of `folded`; with `baseline`, coloured by the change
+    in each frame's share from it.'''
+    total = sum(folded.values())
+    shares, _ = frame_shares(folded)
+    base_shares = frame_shares(baseline)[0] if baseline is not None else None
+
+    # children in name order at every level, as flamegraph.pl lays them out
+    children = {}
+    for path in shares:
+        children.setdefault(path[:-1], []).append(path)
+    depth = max((len(p) for p in shares), default=0)
+    height = (depth + 3) * FRAME_HEIGHT
+    scale = FLAME_WIDTH / total if total else 0
+
+    out = ['<?xml version="1.0" standalone="no"?>',
+           '<svg version="1.1" width="{0}" height="{1}" xmlns="http://www.w3.org/2000/svg" '
+           'font-family="Verdana" font-size="{2}">'.format(FLAME_WIDTH, height, FONT_SIZE),
+           '<rect x="0" y="0" width="{0}" height="{1}" fill="rgb(250,250,250)"/>'.format(
+               FLAME_WIDTH, height),
+           '<text x="{0}" y="{1}" text-anchor="middle">{2}</text>'.format(
+               FLAME_WIDTH / 2, FRAME_HEIGHT, escape(title))]
+
+    def draw(path, x):
+        count = shares[path] * total
+        width = count * scale
+        if width < MIN_FRAME_WIDTH:
+            return
+        name = path[-1]
+        y = height - (len(path) + 1) * FRAME_HEIGHT
+        tip = '{0} ({1:.0f} samples, {2:.2f}%)'.format(name, count, shares[path] * 100)
+        if base_shares is not None:
+            delta = shares[path] - base_shares.get(path, 0.0)
+            fill = _diff_color(delta)
+            tip += ', {0:+.2f} points'.format(delta * 100)
+        else:
+            fill = _color(name)
+        out.append('<g><title>{0}</title><rect x="{1:.2f}" y="{2}" width="{3:.2f}" height="{4}" '
+                   'fill="{5}" rx="2" ry="2"/>'.format(escape(tip), x, y, width,
+                                                       FRAME_HEIGHT - 1, fill))
+        # as much of the name as fits, at about 0.6em a character
+        fits = int(width / (FONT_SIZE * 0.6))
+        if fits >= 3:
+            label = name if len(name) <= fits else name[:fits - 2] + '..'
+            out.append('<text x="{0:.2f}" y="{1}">{2}</text>'.format(
+                x + 3, y + FRAME_HEIGHT - 4, escape(label)))
+        out.append('</g>')
+        for child in sorted(children.get(path, ())):
+            draw(child, x)
+            x += shares[child] * total * scale
+
+    x = 0.0
+    for root in sorted(children.get((), ())):
+        draw(root, x)
+        x += shares[root] * total * scale
+    out.append('</svg>')
+    return '\n'.join(out) + '\n'
+
+
+def write_flamegraph(folded, path, title, baseline=None):
+    with open(path, 'w') as f:
+        f.write(flamegraph_svg(folded, title, baseline))
+    return path
+
+
+class ProfilerError(Exception):
+    pass
+
+
+class Profiler(object):
+    '''`perf record` of a set of host PIDs, from start() until stop().'''
+
+    def __init__(self, pids, data_path, frequency=PERF_FREQUENCY):
+        self.pids = list(pids)
+        self.data_path = data_path
+        self.frequency = frequency
+        self.process = None
+        # bench() sets this, in monotonic_ns, to when the count stopped
+        # moving; samples after it are left out of the folded stacks
+        self.until = None
+
+    @staticmethod
+    def available():
+        return shutil.which('perf') is not None
+
+    def start(self):
+        if not self.available():
+            raise ProfilerError('perf is not installed on this host')
+        if not self.pids:
+            raise ProfilerError('no target daemon PIDs to profile')
+        self.process = subprocess.Popen(perf_record_cmd(self.pids, self.data_path, self.frequency),
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            # perf exits at once when it is not allowed to attach
+            _, err = self.process.communicate(timeout=0.5)
+        except subprocess.TimeoutExpired:
+            return
+        self.process = None
+        raise ProfilerError('perf record failed: {0}'.format(err.decode('utf-8', 'replace').strip()))
+
+    def stop(self, timeout=60):
+        '''Stop recording and fold what was recorded; an empty Counter if nothing was.'''
+        if self.process is None:
+            return Counter()
+        # SIGINT is how perf is told to write out its buffers and finish
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.communicate()
+        self.process = None
+        try:
+            script = subprocess.run(perf_script_cmd(self.data_path, self.until),
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                    timeout=600).stdout
+        except (OSError, subprocess.SubprocessError):
+            return Counter()
+        return fold_perf_script(script.decode('utf-8', 'replace'))
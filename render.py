@@ -0,0 +1,217 @@
+# Graph rendering, kept off the thread that takes the measurements.
+#
+# bench() redrew its six time-series PNGs every two minutes from inside the
+# loop that drains the sample queue, through pyplot, with a plt.show() per
+# graph. The whole render blocked the loop: samples piled up in the Queue, and
+# since bench() judges progress by when it reads them, the next few were
+# processed late and in a burst. At the end of a run the same six, the thread
+# graph and a batch's ten bar charts were drawn one after another.
+#
+# Now a graph is a job -- a renderer's name and its inputs -- and jobs are
+# drawn in other processes with the Agg backend, on one figure per process
+# that is cleared and reused:
+#
+#   GraphWorker    one background process for the in-run redraws. bench()
+#                  hands it a snapshot of the rows and carries on; a snapshot
+#                  that arrives while the last is still drawing is dropped,
+#                  since a newer one will follow.
+#   render_jobs()  the final graphs, across a process pool. Given a
+#                  results_dir it keeps a digest of every graph's inputs there
+#                  and redraws only the graphs whose inputs changed -- a batch
+#                  re-plotting after each cell touches one label, not all ten
+#                  charts.
+#
+# Workers are spawned, not forked: bench() has sampler threads and asyncio
+# loops running, and a forked child inherits whatever locks they held. A
+# spawned worker is not cheap to start, though: it re-imports the main module
+# -- bgperf2.py, every module it pulls in, and settings' dockerd round-trip --
+# before it draws anything. bench() calls GraphWorker.start() before its clock
+# starts so that is paid then, not mid-run on the host being measured.
+#
+# Kept free of Docker so the test suite can cover it.
+
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+# Beside the graphs in results_dir: {graph filename: digest of its inputs}.
+DIGEST_FILE = '.graph-digests.json'
+
+_figure = None
+
+
+def figure():
+    '''This process's one figure, cleared for the next graph.'''
+    global _figure
+    if _figure is None:
+        _figure = plt.figure()
+    _figure.clf()
+    return _figure
+
+
+def render_series(path, x, y, ylabel, xlabel='elapsed seconds'):
+    '''One time series, as bench() draws cpu, memory and the rest.'''
+    ax = figure().add_subplot()
+    ax.plot(x, y)
+    ax.set_ylabel(ylabel)
+    ax.set_xlabel(xlabel)
+    _figure.savefig(path)
+
+
+def render_lines(path, lines, ylabel, xlabel='elapsed seconds'):
+    '''Several labelled series on one graph; `lines` is [(label, x, y)].'''
+    ax = figure().add_subplot()
+    for label, x, y in lines:
+        ax.plot(x, y, label=label)
+    ax.set_ylabel(ylabel)
+    ax.set_xlabel(xlabel)
+    ax.legend(fontsize='small')
+    _figure.savefig(path)
+
+
+def render_bars(path, title, labels, data, ylabel):
+    '''Grouped bars: one group per label, one bar per key of `data`.'''
+    ax = figure().add_subplot()
+    x = np.arange(len(labels))
+    width = 0.7 / max(len(data), 1)
+    for i, (key, values) in enumerate(data.items()):
+        ax.bar(x - 0.2 + i * width, values, width=width, label=key)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.set_xticks(x)
+    ax.set_xticklabels(labels)
+    ax.legend()
+    _figure.savefig(path)
+
+
+RENDERERS = {
+    'series': render_series,
+    'lines': render_lines,
+    'bars': render_bars,
+}
+
+
+def render(job):
+    '''Draw one (renderer, kwargs) job; returns the file it wrote.'''
+    kind, kwargs = job
+    RENDERERS[kind](**kwargs)
+    return kwargs['path']
+
+
+def render_all(jobs):
+    return [render(job) for job in jobs]
+
+
+def digest(job):
+    '''A digest of everything a job draws from, arrays by their bytes.'''
+    h = hashlib.sha256()
+
+    def feed(value):
+        if isinstance(value, np.ndarray):
+            h.update(str((value.dtype.str, value.shape)).encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, dict):
+            for k in sorted(value):
+                feed(k)
+                feed(value[k])
+        elif isinstance(value, (list, tuple)):
+            h.update(b'[')
+            for v in value:
+                feed(v)
+            h.update(b']')
+        else:
+            h.update(repr(value).encode())
+        h.update(b'\x00')
+
+    feed(job)
+    return h.hexdigest()
+
+
+def _load_digests(results_dir):
+    try:
+        with open(os.path.join(results_dir, DIGEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_digests(results_dir, digests):
+    path = os.path.join(results_dir, DIGEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(digests, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _pool(processes):
+    return ProcessPoolExecutor(max_workers=processes,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+def render_jobs(jobs, results_dir=None, processes=None):
+    '''Draw `jobs` across a process pool; the files written, in job order.
+
+    With `results_dir`, a job whose file exists and whose inputs match the
+    digest recorded there is skipped.
+    '''
+    jobs = list(jobs)
+    digests = _load_digests(results_dir) if results_dir else {}
+    todo = []
+    for job in jobs:
+        path = job[1]['path']
+        name = os.path.basename(path)
+        d = digest(job)
+        if results_dir and digests.get(name) == d and os.path.exists(path):
+            continue
+        todo.append((job, name, d))
+    processes = min(len(todo), processes or os.cpu_count() or 1)
+    if processes <= 1:
+        render_all([job for job, _, _ in todo])
+    else:
+        with _pool(processes) as pool:
+            list(pool.map(render, [job for job, _, _ in todo]))
+    if results_dir and todo:
+        digests.update({name: d for _, name, d in todo})
+        _save_digests(results_dir, digests)
+    return [job[1]['path'] for job, _, _ in todo]
+
+
+class GraphWorker(object):
+    '''One background process redrawing graphs from snapshots as a run goes.'''
+
+    def __init__(self):
+        self._pool = None
+        self._pending = None
+
+    def start(self):
+        '''Spawn the worker and wait until it has started up and can draw.'''
+        if self._pool is None:
+            self._pool = _pool(1)
+        self._pool.submit(render_all, []).result()
+
+    def submit(self, jobs):
+        '''Queue a redraw without waiting for it; False if the last is still drawing.'''
+        if self._pending is not None and not self._pending.done():
+            return False
+        try:
+            if self._pool is None:
+                self._pool = _pool(1)
+            self._pending = self._pool.submit(render_all, list(jobs))
+        except Exception:
+            # a worker that died takes its pool with it; the next redraw
+            # starts a new one, and the run itself never waits on graphs
+            self._pool = self._pending = None
+            return False
+        return True
+
+    def close(self):
+        '''Wait for a redraw in progress, so it cannot land on top of the final graphs.'''
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        self._pool = self._pending = None
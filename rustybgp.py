@@ -146,6 +146,9 @@ class RustyBGPTarget(RustyBGP, GoBGPTarget):
     #  except some things are different
     
     CONTAINER_NAME = 'bgperf_rustybgp_target'
+    DAEMON_PROCESSES = ('rustybgpd',)
+    # the bmp-servers section GoBGP's config gains is not one RustyBGP reads
+    BMP_SUPPORTED = False
 
     def __init__(self, host_dir, conf, image='bgperf/rustybgp'):
         super(GoBGPTarget, self).__init__(host_dir, conf, image=image)
@@ -0,0 +1,494 @@
+# Every sample a run takes, kept in typed columns and saved with its results.
+#
+# bench() used to fold each sample into a running max or min as it arrived and
+# keep only the one-per-second rows the graphs need, as Python lists. That made
+# two things impossible. Trimming the assurance samples off the end of a run
+# could not un-fold them from max cpu % and the rest, so those columns
+# included readings from after the run was declared done. And changing how a
+# column is defined meant re-running every cell of a campaign to get it.
+#
+# Now the samples are the record and the row is derived from them, by
+# summarize(), which reads nothing but a RunSamples -- live at the end of a
+# run, or loaded back from the run's .samples.npz long after. `bgperf2.py
+# recompute` does exactly that.
+#
+# Columns are NumPy arrays grown by doubling, so an hours-long soak run costs
+# a few bytes per reading rather than a Python object per field.
+#
+# Kept free of Docker so the test suite can cover it.
+
+import json
+
+import numpy as np
+
+from convergence import percentile_times, rate_summary
+from threadstats import ParallelismTracker
+
+# One table per source. 't' is seconds since the run's clock started.
+SOURCES = {
+    # the per-monitor-sample row the time-series graphs are drawn from
+    'ticks': (('t', 'f8'), ('cpu', 'f4'), ('mem', 'i8'), ('recved', 'i8'),
+              ('neighbors_checked', 'i4'), ('idle', 'f4'), ('free', 'f8')),
+    'target': (('t', 'f8'), ('cpu', 'f4'), ('mem', 'i8')),
+    # the target cgroup's running CPU totals, in seconds
+    'target_cpu': (('t', 'f8'), ('user', 'f8'), ('system', 'f8')),
+    # prefixes the target reports having accepted from the testers
+    'target_accepted': (('t', 'f8'), ('accepted', 'i8')),
+    # the target's memory.stat breakdown and memory.peak, from its cgroup
+    'target_memory': (('t', 'f8'), ('anon', 'f8'), ('file', 'f8'), ('kernel', 'f8'),
+                      ('sock', 'f8'), ('peak', 'f8')),
+    'host': (('t', 'f8'), ('idle', 'f4'), ('free', 'f8'), ('psi_cpu', 'f4'),
+             ('psi_memory', 'f4'), ('psi_io', 'f4')),
+    'foreign': (('t', 'f8'), ('cpu', 'f4')),
+    # container and name are indexes into container_names and thread_names
+    'containers': (('t', 'f8'), ('container', 'i4'), ('cpu', 'f4'), ('mem', 'i8'),
+                   ('io_read', 'i8'), ('io_write', 'i8')),
+    'threads': (('t', 'f8'), ('tid', 'i4'), ('name', 'i4'), ('cpu', 'f4')),
+    # bgperf2 itself: see selfstats.py. thread and source index sampler_names.
+    'harness': (('t', 'f8'), ('cpu', 'f4'), ('rss', 'i8'), ('peak', 'i8')),
+    'harness_threads': (('t', 'f8'), ('thread', 'i4'), ('cpu', 'f4')),
+    'latency': (('t', 'f8'), ('source', 'i4'), ('seconds', 'f4')),
+    # the target's BGP sessions and the bench network: see netstats.py. peer
+    # and device index session_names and device_names; the counters are
+    # cumulative, as the kernel keeps them
+    'sessions': (('t', 'f8'), ('peer', 'i4'), ('recv_q', 'i8'), ('send_q', 'i8'), ('rtt', 'f8'),
+                 ('retrans', 'f8'), ('rwnd', 'f8')),
+    'netdev': (('t', 'f8'), ('device', 'i4'), ('rx_bytes', 'i8'), ('rx_packets', 'i8'),
+               ('rx_drop', 'i8'), ('tx_bytes', 'i8'), ('tx_packets', 'i8'), ('tx_drop', 'i8')),
+    'softnet': (('t', 'f8'), ('dropped', 'i8'), ('squeezed', 'i8')),
+    # bench --canary: when each marker prefix was sent, and its trip through
+    # the target to the monitor, NaN if it never arrived; see canary.py
+    'canary': (('t', 'f8'), ('latency', 'f8')),
+}
+
+# Seconds between samples, per source; --sample-interval overrides them.
+# foreign walks all of /proc, so it is the one left slow by default.
+SAMPLE_INTERVALS = {
+    'monitor': 1.0,     # the monitor's accepted count, which convergence runs on
+    'neighbors': 1.0,   # the target's per-neighbor received/accepted state
+    'host': 1.0,        # idle, available memory and pressure stall
+    'foreign': 5.0,     # CPU of processes that are not part of the benchmark
+    'cgroups': 1.0,     # CPU, memory and I/O of every bench container
+    'threads': 1.0,     # CPU of each of the target daemon's threads
+    'harness': 1.0,     # CPU and memory of bgperf2 itself
+    'net': 1.0,         # the target's TCP sessions and the bridge's counters
+}
+
+# Below this the samplers' own reads start to show up in what they measure.
+MIN_SAMPLE_INTERVAL = 0.1
+
+# Run facts that are not samples, carried through summarize() unchanged.
+PASSTHROUGH = ('required', 'recved', 'monitor_wait_time', 'cores', 'memory',
+               'total_time', 'tester_errors', 'tester_timeouts', 'fail_msg', 'date', 'counters',
+               'daemon_rss', 'daemon_pss', 'updates', 'convergence', 'decided', 'expected')
+
+# What summarize() reports for a source that produced no samples at all; the
+# values bench() has always started its running extremes from.
+EMPTY_MIN_IDLE = 100
+EMPTY_MIN_FREE = 1_000_000_000_000_000
+
+
+class SampleSeries(object):
+    '''A growable table of typed columns.'''
+
+    def __init__(self, columns, capacity=256):
+        self.columns = tuple(columns)
+        self.length = 0
+        self.data = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.columns}
+
+    def __len__(self):
+        return self.length
+
+    def append(self, *values):
+        if self.length == len(self.data[self.columns[0][0]]):
+            for name in self.data:
+                grown = np.zeros(max(len(self.data[name]) * 2, 1), dtype=self.data[name].dtype)
+                grown[:self.length] = self.data[name][:self.length]
+                self.data[name] = grown
+        for (name, _), value in zip(self.columns, values):
+            self.data[name][self.length] = np.nan if value is None else value
+        self.length += 1
+
+    def __getitem__(self, name):
+        return self.data[name][:self.length]
+
+    def until(self, end):
+        '''{column: array} of the rows with t <= end; every row if end is None.'''
+        if end is None:
+            return {name: self[name] for name, _ in self.columns}
+        keep = self['t'] <= end
+        return {name: self[name][keep] for name, _ in self.columns}
+
+    @classmethod
+    def from_arrays(cls, columns, arrays):
+        series = cls(columns, capacity=0)
+        series.data = {name: np.asarray(arrays[name], dtype=dtype) for name, dtype in columns}
+        series.length = len(series.data[columns[0][0]])
+        return series
+
+
+class RunSamples(object):
+    '''All of one run's samples, plus the facts needed to summarize them.'''
+
+    def __init__(self, meta=None):
+        self.series = {source: SampleSeries(columns) for source, columns in SOURCES.items()}
+        self.container_names = []
+        self.container_roles = []
+        self.thread_names = []
+        self.sampler_names = []
+        self.session_names = []
+        self.device_names = []
+        # {list attribute: {name: its index}}, so a sample costs a dict lookup
+        self._positions = {}
+        self.meta = dict(meta or {})
+
+    def __getitem__(self, source):
+        return self.series[source]
+
+    def _index(self, names, name):
+        '''Index of `name` in the list attribute `names`, appended if new.'''
+        listing = getattr(self, names)
+        positions = self._positions.get(names)
+        if positions is None or len(positions) != len(listing):
+            # first use, or a list load() filled in
+            positions = self._positions[names] = {n: i for i, n in enumerate(listing)}
+        index = positions.get(name)
+        if index is None:
+            index = positions[name] = len(listing)
+            listing.append(name)
+        return index
+
+    def _container(self, name, role):
+        index = self._index('container_names', name)
+        if index == len(self.container_roles):
+            self.container_roles.append(role)
+        return index
+
+    def record_tick(self, t, cpu, mem, recved, neighbors_checked, idle, free):
+        self.series['ticks'].append(t, cpu, mem, recved, neighbors_checked, idle, free)
+
+    def record_target(self, t, cpu, mem):
+        self.series['target'].append(t, cpu, mem)
+
+    def record_target_cpu(self, t, user, system):
+        self.series['target_cpu'].append(t, user, system)
+
+    def record_target_accepted(self, t, accepted):
+        self.series['target_accepted'].append(t, accepted)
+
+    def record_target_memory(self, t, anon=None, file=None, kernel=None, sock=None, peak=None):
+        self.series['target_memory'].append(t, anon, file, kernel, sock, peak)
+
+    def record_host(self, t, idle=None, free=None, psi_cpu=None, psi_memory=None, psi_io=None):
+        self.series['host'].append(t, idle, free, psi_cpu, psi_memory, psi_io)
+
+    def record_foreign(self, t, cpu):
+        self.series['foreign'].append(t, cpu)
+
+    def record_containers(self, t, containers, roles):
+        '''containers: {name: controller_cgroup_stats() numbers}; roles: {name: role}.'''
+        for name, s in containers.items():
+            self.series['containers'].append(
+                t, self._container(name, roles.get(name, '')), s['cpu'], s['mem'],
+                s['io_read'], s['io_write'])
+
+    def record_threads(self, t, threads):
+        '''threads: thread_percents() output.'''
+        for tid, (comm, pct) in threads.items():
+            self.series['threads'].append(t, int(tid), self._index('thread_names', comm), pct)
+
+    def record_harness(self, t, cpu, rss, peak, threads):
+        '''HarnessSampler.sample() output; threads is {thread name: cpu %}.'''
+        self.series['harness'].append(t, cpu, rss, peak)
+        for name, pct in threads.items():
+            self.series['harness_threads'].append(t, self._index('sampler_names', name), pct)
+
+    def record_latency(self, t, source, seconds):
+        '''How long one sample from `source` waited on the queue.'''
+        self.series['latency'].append(t, self._index('sampler_names', source), seconds)
+
+    def record_network(self, t, sessions, devices, softnet):
+        '''controller_net_stats() output: {peer: ss fields}, {device: counters},
+        {'dropped', 'squeezed'}.'''
+        for peer, s in sessions.items():
+            self.series['sessions'].append(t, self._index('session_names', peer), s['recv_q'],
+                                           s['send_q'], s.get('rtt'), s.get('retrans'),
+                                           s.get('rwnd'))
+        for device, d in devices.items():
+            self.series['netdev'].append(t, self._index('device_names', device), d['rx_bytes'],
+                                         d['rx_packets'], d['rx_drop'], d['tx_bytes'],
+                                         d['tx_packets'], d['tx_drop'])
+        if softnet:
+            self.series['softnet'].append(t, softnet['dropped'], softnet['squeezed'])
+
+    def record_canary(self, t, latency):
+        self.series['canary'].append(t, latency)
+
+    def save(self, path):
+        '''Write every series and the run facts to one compressed .npz.'''
+        arrays = {}
+        for source, series in self.series.items():
+            for name, _ in series.columns:
+                arrays['{0}.{1}'.format(source, name)] = series[name]
+        arrays['container_names'] = np.array(self.container_names, dtype=str)
+        arrays['container_roles'] = np.array(self.container_roles, dtype=str)
+        arrays['thread_names'] = np.array(self.thread_names, dtype=str)
+        arrays['sampler_names'] = np.array(self.sampler_names, dtype=str)
+        arrays['session_names'] = np.array(self.session_names, dtype=str)
+        arrays['device_names'] = np.array(self.device_names, dtype=str)
+        arrays['meta'] = np.array(json.dumps(self.meta, sort_keys=True, default=str))
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as archive:
+            samples = cls(json.loads(str(archive['meta'])))
+            for source, columns in SOURCES.items():
+                # an archive from before a source existed has no samples of it
+                if '{0}.t'.format(source) in archive.files:
+                    samples.series[source] = SampleSeries.from_arrays(
+                        columns, {name: archive['{0}.{1}'.format(source, name)] for name, _ in columns})
+            samples.container_names = [str(n) for n in archive['container_names']]
+            samples.container_roles = [str(r) for r in archive['container_roles']]
+            samples.thread_names = [str(n) for n in archive['thread_names']]
+            for names in ('sampler_names', 'session_names', 'device_names'):
+                if names in archive.files:
+                    setattr(samples, names, [str(n) for n in archive[names]])
+        return samples
+
+    def tick_rows(self):
+        '''The graphs' rows -- [t, cpu, mem, recved, neighbors, idle, free] -- up to the end.'''
+        ticks = self.series['ticks'].until(self.meta.get('elapsed'))
+        return np.column_stack([ticks[name] for name, _ in SOURCES['ticks']]) if len(ticks['t']) else \
+            np.zeros((0, len(SOURCES['ticks'])))
+
+
+def _max(values, empty):
+    values = values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+    return float(values.max()) if len(values) else empty
+
+
+def _min(values, empty):
+    values = values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+    return float(values.min()) if len(values) else empty
+
+
+def _max_per_tick(t, values, mask):
+    '''Largest per-timestamp sum of `values` over the rows in `mask`.'''
+    if not mask.any():
+        return 0
+    _, index = np.unique(t[mask], return_inverse=True)
+    return float(np.bincount(index, weights=values[mask].astype('f8')).max())
+
+
+def _growth(t, key, values):
+    '''Sum over keys of each key's rise from its first to its last value.
+
+    For the kernel's cumulative counters: a counter that fell -- a session
+    that reconnected -- is counted from zero after the fall.
+    '''
+    total = 0
+    for k in np.unique(key):
+        v = values[key == k][np.argsort(t[key == k], kind='stable')].astype('f8')
+        v = v[~np.isnan(v)]
+        if len(v) > 1:
+            steps = np.diff(v)
+            total += float(np.where(steps >= 0, steps, v[1:]).sum())
+    return total
+
+
+def _backlog_seconds(t, key, recv_q):
+    '''Seconds in which some session's Recv-Q stayed above zero from one sample
+    to the next: data that sat unread by the target for a whole interval.'''
+    stuck = set()
+    for k in np.unique(key):
+        order = np.argsort(t[key == k], kind='stable')
+        times, queued = t[key == k][order], recv_q[key == k][order]
+        for i in range(1, len(times)):
+            if queued[i - 1] > 0 and queued[i] > 0:
+                stuck.add((times[i - 1], times[i]))
+    # overlapping intervals from several sessions count once
+    total, reach = 0.0, None
+    for start, end in sorted(stuck):
+        if reach is not None and start < reach:
+            start = reach
+        if end > start:
+            total += end - start
+        reach = end if reach is None else max(reach, end)
+    return total
+
+
+def _cpu_seconds(cpu, start, end):
+    '''(user, system) seconds the target spent between start and end, read off
+    its running totals and interpolated between samples; (None, None) without them.'''
+    keep = ~np.isnan(cpu['user'])
+    t = cpu['t'][keep]
+    if len(t) < 2 or end <= start:
+        return None, None
+    return tuple(float(np.interp(end, t, cpu[k][keep]) - np.interp(start, t, cpu[k][keep]))
+                 for k in ('user', 'system'))
+
+
+def summarize(samples):
+    '''Every output_stats field bench() reports, derived from the samples alone.
+
+    Only samples up to meta['elapsed'] count. The ones after it are the
+    assurance window -- the run was already over, bench() was confirming the
+    count had stopped -- and folding them into max cpu % or min idle% would
+    report the machine's state after the result rather than during it.
+    '''
+    meta = samples.meta
+    end = meta.get('elapsed')
+    stats = {k: meta[k] for k in PASSTHROUGH if k in meta}
+
+    target = samples['target'].until(end)
+    stats['max_cpu'] = _max(target['cpu'], 0)
+    stats['max_mem'] = _max(target['mem'], 0)
+
+    memory = samples['target_memory'].until(end)
+    for part in ('anon', 'file', 'kernel', 'sock'):
+        stats['max_mem_' + part] = _max(memory[part], None)
+    # memory.peak only rises, so its last reading is the run's
+    stats['peak_mem'] = _max(memory['peak'], None)
+
+    host = samples['host'].until(end)
+    stats['min_idle'] = _min(host['idle'], EMPTY_MIN_IDLE)
+    stats['min_free'] = _min(host['free'], EMPTY_MIN_FREE)
+    for resource in ('cpu', 'memory', 'io'):
+        stats['max_psi_' + resource] = _max(host['psi_' + resource], None)
+
+    stats['max_foreign_cpu'] = _max(samples['foreign'].until(end)['cpu'], 0)
+
+    containers = samples['containers'].until(end)
+    roles = np.array(samples.container_roles + [''], dtype=str)[containers['container']] \
+        if len(containers['container']) else np.array([], dtype=str)
+    stats['max_tester_cpu'] = _max_per_tick(containers['t'], containers['cpu'], roles == 'tester')
+    stats['max_monitor_cpu'] = _max_per_tick(containers['t'], containers['cpu'], roles == 'monitor')
+
+    threads = samples['threads'].until(end)
+    parallelism = ParallelismTracker()
+    if len(threads['t']):
+        for at in np.unique(threads['t']):
+            rows = threads['t'] == at
+            parallelism.update({str(tid): (samples.thread_names[name], float(pct))
+                                for tid, name, pct in zip(threads['tid'][rows],
+                                                          threads['name'][rows],
+                                                          threads['cpu'][rows])})
+    stats['parallelism'] = parallelism
+
+    # bgperf2's own cost; None throughout for an archive that predates it
+    harness = samples['harness'].until(end)
+    stats['max_harness_cpu'] = _max(harness['cpu'], None)
+    stats['max_harness_rss'] = _max(np.concatenate([harness['rss'], harness['peak']]), None)
+    harness_threads = samples['harness_threads'].until(end)
+    stats['busiest_harness_thread'] = None
+    stats['max_harness_thread_cpu'] = None
+    if len(harness_threads['t']):
+        # busiest over the run, not at its worst moment: a thread that spikes
+        # once at startup is not the one slowing the run down
+        totals = np.bincount(harness_threads['thread'], weights=harness_threads['cpu'].astype('f8'))
+        busiest = int(totals.argmax())
+        stats['busiest_harness_thread'] = samples.sampler_names[busiest]
+        stats['max_harness_thread_cpu'] = _max(
+            harness_threads['cpu'][harness_threads['thread'] == busiest], None)
+    sessions = samples['sessions'].until(end)
+    stats['max_recv_q'] = _max(sessions['recv_q'], None)
+    stats['max_send_q'] = _max(sessions['send_q'], None)
+    stats['recv_q_backlog'] = _backlog_seconds(sessions['t'], sessions['peer'], sessions['recv_q']) \
+        if len(sessions['t']) else None
+    stats['tcp_retransmits'] = _growth(sessions['t'], sessions['peer'], sessions['retrans']) \
+        if not np.isnan(sessions['retrans']).all() else None
+    netdev = samples['netdev'].until(end)
+    stats['bridge_drops'] = _growth(netdev['t'], netdev['device'], netdev['rx_drop']) + \
+        _growth(netdev['t'], netdev['device'], netdev['tx_drop']) if len(netdev['t']) else None
+    softnet = samples['softnet'].until(end)
+    zeros = np.zeros(len(softnet['t']), dtype='i4')
+    stats['softnet_drops'] = _growth(softnet['t'], zeros, softnet['dropped']) \
+        if len(softnet['t']) else None
+    stats['softnet_squeezes'] = _growth(softnet['t'], zeros, softnet['squeezed']) \
+        if len(softnet['t']) else None
+
+    latency = samples['latency'].until(end)['seconds']
+    stats['p99_queue_latency'] = float(np.percentile(latency, 99)) if len(latency) else None
+    stats['max_queue_latency'] = _max(latency, None)
+
+    ticks = samples['ticks'].until(end)
+    first = meta.get('first_received')
+    if first is None:
+        received = ticks['t'][ticks['recved'] > 0]
+        first = float(received[0]) if len(received) else 0
+    stats['first_received_time'] = float(first)
+    stats['elapsed'] = float(end if end is not None else (ticks['t'][-1] if len(ticks['t']) else 0))
+
+    # markers sent while the run was converging; a lost one had at least the
+    # assurance window to arrive
+    canary = samples['canary'].until(end)['latency']
+    arrived = canary[~np.isnan(canary)]
+    stats['canary_p50'] = float(np.percentile(arrived, 50)) if len(arrived) else None
+    stats['canary_p99'] = float(np.percentile(arrived, 99)) if len(arrived) else None
+    stats['canary_max'] = _max(arrived, None)
+    stats['canaries_lost'] = int(len(canary) - len(arrived)) if len(canary) else None
+
+    # The shape of the run, as shares of every prefix the testers send -- not
+    # of `required`, the check-point already scaled down to 99% of that. An
+    # MRT run's table size is not known up front, so a converged one measures
+    # against the count it converged on. See convergence.py.
+    total = meta.get('expected') or (0 if meta.get('fail') else meta.get('recved') or 0)
+    for p, at in percentile_times(ticks['t'], ticks['recved'], total).items():
+        stats['t{0}'.format(p)] = at
+    stats['peak_monitor_rate'], stats['mean_monitor_rate'] = rate_summary(ticks['t'], ticks['recved'])
+    accepted = samples['target_accepted'].until(end)
+    stats['peak_target_rate'], stats['mean_target_rate'] = rate_summary(accepted['t'],
+                                                                       accepted['accepted'])
+
+    # What converging cost the target in CPU, from the first prefix to the end
+    # -- and per prefix it accepted and per UPDATE the monitor got. Unlike
+    # elapsed (s), these do not shrink when the host has cores to spare. The
+    # totals are read past the end, since the end falls between two samples.
+    stats['cpu_user'], stats['cpu_system'] = _cpu_seconds(
+        samples['target_cpu'].until(None), stats['first_received_time'], stats['elapsed'])
+    prefixes = _max(accepted['accepted'], None) or meta.get('recved')
+    cpu = stats['cpu_user'] + stats['cpu_system'] if stats['cpu_user'] is not None else None
+    stats['cpu_per_prefix'] = cpu / prefixes if cpu is not None and prefixes else None
+    stats['cpu_per_update'] = cpu / meta['updates'] if cpu is not None and meta.get('updates') else None
+    return stats
+
+
+def parse_sample_intervals(text):
+    '''--sample-interval: '0.2', 'monitor=0.1,host=0.5' or '0.2,foreign=5'.
+
+    A bare number sets every source; source=seconds pairs set one each and
+    win over a bare number wherever it appears. Anything left unset keeps its
+    default from SAMPLE_INTERVALS.
+    '''
+    intervals = dict(SAMPLE_INTERVALS)
+    if text is None:
+        return intervals
+    if isinstance(text, dict):
+        items = list(text.items())
+    elif isinstance(text, (int, float)):
+        items = [(None, text)]
+    else:
+        items = []
+        for part in str(text).split(','):
+            if part.strip():
+                source, _, value = part.rpartition('=')
+                items.append((source.strip() or None, value))
+    # bare numbers first, so a pair overrides them regardless of order
+    items.sort(key=lambda item: item[0] is not None)
+    for source, value in items:
+        if source is not None and source not in SAMPLE_INTERVALS:
+            raise ValueError('unknown sample source {0!r}; one of {1}'.format(
+                source, ', '.join(SAMPLE_INTERVALS)))
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            raise ValueError('sample interval {0!r} is not a number of seconds'.format(value))
+        if seconds < MIN_SAMPLE_INTERVAL:
+            raise ValueError('sample interval {0}s is below the {1}s minimum'.format(
+                seconds, MIN_SAMPLE_INTERVAL))
+        for name in ([source] if source is not None else SAMPLE_INTERVALS):
+            intervals[name] = seconds
+    return intervals
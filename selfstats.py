@@ -0,0 +1,117 @@
+# What bgperf2 itself costs the machine it is measuring.
+#
+# Every sampler is a thread in bgperf2's own Python process, and so are the
+# native monitor and the BMP station; the graph workers and every command it
+# shells out to are its children. All of that runs on the box the target is
+# timed on. Its memory comes straight off min free mem, and its CPU competes
+# with the daemon's -- and when a sampler falls behind, bench() reads its
+# samples late and judges convergence by when it reads them. FRR's End-of-RIB
+# log scan was once exactly that, and it took a day to find.
+#
+# So the harness samples itself, like any other source:
+#
+#   tree CPU and RSS   this process and every live descendant, from psutil;
+#                      reaped children's CPU is in the parent's children_*
+#                      times, so a child exiting mid-run moves its CPU from one
+#                      term to the other rather than losing it
+#   peak RSS           the kernel's own high-water mark for this process
+#                      (ru_maxrss), which catches a spike between samples
+#   per-thread CPU     /proc/<pid>/task, as threadstats.py reads the target's,
+#                      named by each Python thread's name -- so the row says
+#                      'neighbor-stats' rather than 'python3'
+#   queue latency      how long each sample waited on the Queue between the
+#                      sampler stamping it and bench() reading it
+#
+# Kept free of Docker so the test suite can cover it.
+
+import resource
+import threading
+import time
+
+import psutil
+
+from threadstats import sample_threads, thread_percents
+
+
+def tree_usage(process):
+    '''(cpu seconds, rss bytes) of a psutil.Process and all its live descendants.'''
+    processes = [process]
+    try:
+        processes += process.children(recursive=True)
+    except psutil.Error:
+        pass
+    cpu = 0.0
+    rss = 0
+    for p in processes:
+        try:
+            times = p.cpu_times()
+            rss += p.memory_info().rss
+        except psutil.Error:
+            continue          # exited between listing and reading
+        cpu += times.user + times.system + times.children_user + times.children_system
+    return cpu, rss
+
+
+def peak_rss():
+    '''This process's peak RSS in bytes; Linux reports ru_maxrss in KiB.'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def thread_names():
+    '''{tid: Python thread name} for every thread threading knows of.'''
+    return {str(t.native_id): t.name for t in threading.enumerate()
+            if getattr(t, 'native_id', None) is not None}
+
+
+def by_thread_name(percents, names):
+    '''Fold thread_percents() output into {thread name: % of one core}.
+
+    Threads threading never started -- a library's native workers -- keep
+    their kernel name. Threads sharing a name are summed, so a sampler that
+    runs once per container reads as one cost.
+    '''
+    out = {}
+    for tid, (comm, pct) in percents.items():
+        name = names.get(tid, comm)
+        out[name] = out.get(name, 0.0) + pct
+    return out
+
+
+def queue_source(info, roles):
+    '''Which sampler a queue message came from, for its latency.
+
+    roles maps container names to 'target', 'tester' or 'monitor'; the
+    target and the controller each send two kinds of sample under one 'who'.
+    '''
+    who = info.get('who')
+    source = roles.get(who, who)
+    if source == 'target' and ('neighbors_checked' in info or 'neighbors_received_full' in info):
+        return 'neighbors'
+    if source == 'controller':
+        return 'foreign' if 'foreign_cpu' in info else 'host'
+    return source
+
+
+class HarnessSampler(object):
+    '''CPU and memory of bgperf2's process tree, and CPU per thread, as deltas.'''
+
+    def __init__(self, process=None, proc_root='/proc'):
+        self.process = process or psutil.Process()
+        self.proc_root = proc_root
+        self.previous = self._read()
+
+    def _read(self):
+        cpu, rss = tree_usage(self.process)
+        threads = sample_threads([self.process.pid], self.proc_root)
+        return time.monotonic_ns(), cpu, rss, threads
+
+    def sample(self):
+        '''{'cpu', 'rss', 'peak', 'threads'} since the last call, CPU as % of one core.'''
+        current = self._read()
+        elapsed = (current[0] - self.previous[0]) / 1e9
+        cpu = max(current[1] - self.previous[1], 0) / elapsed * 100.0 if elapsed > 0 else 0.0
+        threads = by_thread_name(thread_percents(self.previous[3], current[3], elapsed),
+                                 thread_names())
+        self.previous = current
+        return {'cpu': cpu, 'rss': current[2], 'peak': peak_rss(), 'threads': threads,
+                'time': current[0]}
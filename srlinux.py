@@ -26,6 +26,7 @@ class SRLinux(Container):
 class SRLinuxTarget(SRLinux, Target):
     
     CONTAINER_NAME = 'bgperf_SRLinux_target'
+    DAEMON_PROCESSES = ('sr_bgp_mgr',)
     CONFIG_FILE_NAME = 'config.json'
 
     def __init__(self, host_dir, conf, image='ghcr.io/nokia/srlinux'):
@@ -119,7 +120,7 @@ set / network-instance default protocols bgp neighbor {0} peer-group neighbors
 
     def get_neighbors_state(self):
         neighbors_accepted = {}
-        neighbor_received_output = json.loads(self.local("/usr/bin/SRLinuxc bgp --host 127.0.0.1 -J").decode('utf-8'))
+        neighbor_received_output = json.loads(self.observe("/usr/bin/SRLinuxc bgp --host 127.0.0.1 -J").decode('utf-8'))
 
         return neighbor_received_output['neighbor_summary']['recv_converged']
     
@@ -0,0 +1,205 @@
+# Software event counters for the target daemon over the convergence window.
+#
+# max cpu % and max mem (GB) say how much the daemon used, not how. Two
+# versions can burn the same CPU for different reasons: one doing more work,
+# the other thrashing the scheduler or the allocator. The kernel counts the
+# difference for every process, hardware PMU or not, so it works the same in
+# a VM:
+#
+#   voluntary switches     the daemon blocked -- on a socket, a lock, I/O
+#   involuntary switches   the scheduler took the CPU away from it
+#   minor / major faults   pages it touched for the first time / had to read in
+#   cpu migrations         times its threads were moved between CPUs
+#   syscalls               every system call it made
+#
+# `perf stat` on the host counts them for the daemon's PIDs, from when the
+# testers launch until the run converges. Without perf, or without
+# permission to use it, the same window is read from /proc instead: every
+# counter but syscalls is there, and that column is left blank rather than
+# guessed. Either way the numbers go into the row and `<run>.versions.json`,
+# with which source produced them.
+#
+# The parsing is kept free of perf and Docker so the test suite can cover it;
+# SoftwareCounters is the collection around it.
+
+import os
+import re
+import shutil
+import signal
+import subprocess
+
+COUNTERS = ('voluntary_switches', 'involuntary_switches', 'minor_faults', 'major_faults',
+            'migrations', 'syscalls')
+
+# perf event -> counter. Context switches always come from /proc: perf only
+# counts their total, and the split is the point.
+PERF_EVENTS = {
+    'minor-faults': 'minor_faults',
+    'major-faults': 'major_faults',
+    'cpu-migrations': 'migrations',
+    'raw_syscalls:sys_enter': 'syscalls',
+}
+
+# Fields of /proc/<pid>/stat after the comm, as contention.py counts them.
+_MINFLT_AFTER_COMM = 7
+_MAJFLT_AFTER_COMM = 9
+_STARTTIME_AFTER_COMM = 19
+
+_STATUS_SWITCHES = re.compile(r'^(voluntary|nonvoluntary)_ctxt_switches:\s+(\d+)', re.MULTILINE)
+_SCHED_MIGRATIONS = re.compile(r'^se\.nr_migrations\s+:\s+(\d+)', re.MULTILINE)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def read_proc_counters(pids, proc_root='/proc'):
+    '''{counter: total} over `pids` and all their threads, from /proc.
+
+    Faults come from each process's stat, which keeps the counts of threads
+    that have exited; switches and migrations only exist per thread, so a
+    thread that exits mid-window takes its share with it. migrations is
+    missing on a kernel built without CONFIG_SCHED_DEBUG.
+    '''
+    totals = {'voluntary_switches': 0, 'involuntary_switches': 0,
+              'minor_faults': 0, 'major_faults': 0}
+    migrations = None
+    for pid in pids:
+        stat = _read(os.path.join(proc_root, str(pid), 'stat'))
+        if stat is None:
+            continue        # the daemon exited or restarted
+        fields = stat[stat.rfind(')') + 1:].split()
+        try:
+            totals['minor_faults'] += int(fields[_MINFLT_AFTER_COMM])
+            totals['major_faults'] += int(fields[_MAJFLT_AFTER_COMM])
+        except (IndexError, ValueError):
+            pass
+        task_dir = os.path.join(proc_root, str(pid), 'task')
+        try:
+            tids = os.listdir(task_dir)
+        except OSError:
+            continue
+        for tid in tids:
+            status = _read(os.path.join(task_dir, tid, 'status')) or ''
+            for kind, count in _STATUS_SWITCHES.findall(status):
+                key = 'voluntary_switches' if kind == 'voluntary' else 'involuntary_switches'
+                totals[key] += int(count)
+            m = _SCHED_MIGRATIONS.search(_read(os.path.join(task_dir, tid, 'sched')) or '')
+            if m:
+                migrations = (migrations or 0) + int(m.group(1))
+    if migrations is not None:
+        totals['migrations'] = migrations
+    return totals
+
+
+def running_processes(pids, proc_root='/proc'):
+    '''{(pid, start time)} for those of `pids` still running.
+
+    The start time tells a restarted daemon from the one read before, even if
+    it came back on the same PID.
+    '''
+    running = set()
+    for pid in pids:
+        stat = _read(os.path.join(proc_root, str(pid), 'stat'))
+        if stat is None:
+            continue
+        fields = stat[stat.rfind(')') + 1:].split()
+        running.add((str(pid), fields[_STARTTIME_AFTER_COMM]
+                     if len(fields) > _STARTTIME_AFTER_COMM else None))
+    return running
+
+
+def counter_delta(before, after, restarted=False):
+    '''after - before, for the counters both have.
+
+    A counter that went backwards counts from zero if the daemon restarted.
+    If it did not, the counter is switches or migrations that left with an
+    exited thread: what the window added cannot be told from what left, so
+    the counter is left out rather than guessed.
+    '''
+    delta = {}
+    for k in after:
+        if k not in before:
+            continue
+        if after[k] >= before[k]:
+            delta[k] = after[k] - before[k]
+        elif restarted:
+            delta[k] = after[k]
+    return delta
+
+
+def perf_stat_cmd(pids, output):
+    return ['perf', 'stat', '-x', ',', '-e', ','.join(PERF_EVENTS), '-p', ','.join(map(str, pids)),
+            '-o', output]
+
+
+def parse_perf_stat(text):
+    '''{counter: count} from `perf stat -x ,` output; events perf could not
+    count are left out.'''
+    counts = {}
+    for line in text.splitlines():
+        if not line.strip() or line.startswith('#'):
+            continue
+        fields = line.split(',')
+        if len(fields) < 3 or fields[2] not in PERF_EVENTS:
+            continue
+        try:
+            counts[PERF_EVENTS[fields[2]]] = int(float(fields[0]))
+        except ValueError:
+            continue        # <not counted>, <not supported>
+    return counts
+
+
+class SoftwareCounters(object):
+    '''The counters above for a set of host PIDs, from start() until stop().'''
+
+    def __init__(self, pids, output_path, proc_root='/proc', use_perf=True):
+        self.pids = list(pids)
+        self.output_path = output_path
+        self.proc_root = proc_root
+        self.use_perf = use_perf and shutil.which('perf') is not None
+        self.process = None
+        self.before = None
+        self.running = None
+
+    def start(self):
+        self.before = read_proc_counters(self.pids, self.proc_root)
+        self.running = running_processes(self.pids, self.proc_root)
+        if not self.use_perf or not self.pids:
+            return
+        try:
+            self.process = subprocess.Popen(perf_stat_cmd(self.pids, self.output_path),
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            self.process = None
+
+    def stop(self, timeout=30):
+        '''({counter: count over the window}, 'perf' or 'proc').'''
+        restarted = running_processes(self.pids, self.proc_root) != self.running
+        counts = counter_delta(self.before or {}, read_proc_counters(self.pids, self.proc_root),
+                               restarted)
+        if self.process is None:
+            return counts, 'proc'
+        # perf stat prints its totals on SIGINT; one that could not attach has
+        # already exited and printed nothing
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+        perf = parse_perf_stat(_read(self.output_path) or '')
+        try:
+            os.unlink(self.output_path)
+        except OSError:
+            pass
+        if not perf:
+            return counts, 'proc'
+        counts.update(perf)
+        return counts, 'perf'
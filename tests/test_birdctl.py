@@ -0,0 +1,94 @@
+'''Reading BIRD's neighbor counts straight off its control socket.
+
+This replaces a birdc exec and a TextFSM pass per sample, so it has to give
+the same counts the old path gave, from the coded reply stream BIRD actually
+writes. A small server on a real Unix socket plays BIRD.
+'''
+import os
+import socket
+import threading
+
+import pytest
+
+from birdctl import BirdControl, BirdControlError, neighbor_counts, reply_lines
+
+
+def coded(text):
+    '''`show protocols all` text as BIRD's control socket sends it.'''
+    out = [b'2002-Name       Proto      Table      State  Since         Info']
+    for line in text.splitlines()[2:]:
+        if not line:
+            out.append(b'1006-')
+        elif line[0].isspace():
+            out.append(b' ' + line.encode())
+        else:
+            out.append(b'1002-' + line.encode())
+    out.append(b'0000 ')
+    return b'\n'.join(out) + b'\n'
+
+
+@pytest.fixture
+def bird_socket(tmp_path, fixture_text):
+    '''A control socket that answers like BIRD, and counts commands served.'''
+    path = str(tmp_path / 'bird.ctl')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    served = []
+    reply = coded(fixture_text('bird_show_protocols_all.txt'))
+
+    def serve():
+        conn, _ = server.accept()
+        conn.sendall(b'0001 BIRD 2.17.1 ready.\n')
+        for line in conn.makefile('rb'):
+            served.append(line.strip())
+            conn.sendall(reply if line.strip() == b'show protocols all'
+                         else b'9001 syntax error\n')
+        conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield path, served
+    server.close()
+
+
+def test_birdc_text_and_socket_replies_agree(bird_socket, fixture_text):
+    path, served = bird_socket
+    control = BirdControl(path)
+    try:
+        from_socket = control.neighbor_counts()
+        again = control.neighbor_counts()
+    finally:
+        control.close()
+    assert from_socket == neighbor_counts(fixture_text('bird_show_protocols_all.txt').splitlines())
+    assert from_socket == again == ({'10.10.0.2': 0}, {'10.10.0.2': 0})
+    # one connection, reused
+    assert served == [b'show protocols all', b'show protocols all']
+
+
+def test_error_replies_raise(bird_socket):
+    control = BirdControl(bird_socket[0])
+    with pytest.raises(BirdControlError):
+        list(control.command('show nonsense'))
+    assert control.sock is None
+
+
+def test_counts_come_from_the_import_updates_line():
+    text = '''dynbgp7    BGP        ---        up     23:36:31.672  Established
+  BGP state:          Established
+    Neighbor address: 10.10.0.9
+  Channel ipv4
+    Route change stats:     received   rejected   filtered    ignored   accepted
+      Import updates:          10000          0        250          0       9750
+      Import withdraws:            0          0        ---          0          0
+'''
+    assert neighbor_counts(text.splitlines()) == ({'10.10.0.9': 10000}, {'10.10.0.9': 9750})
+
+
+def test_a_session_not_yet_up_reads_zero():
+    text = 'dynbgp2    BGP    ---    start    Connect\n    Neighbor address: 10.10.0.3\n'
+    assert neighbor_counts(text.splitlines()) == ({'10.10.0.3': 0}, {'10.10.0.3': 0})
+
+
+def test_a_reply_cut_short_is_an_error():
+    with pytest.raises(BirdControlError):
+        list(reply_lines([b'1002-dynbgp1 BGP\n']))
@@ -0,0 +1,178 @@
+'''Tests for the BMP station in bmp.py.
+
+With --neighbor-source bmp these messages are the only thing bench() knows
+about the target's peers, so a misread per-peer header or counter would stop
+a run from ever seeing its peers finish. The messages are built here byte for
+byte and fed to BMPState, and once through a real socket to BMPCollector.
+'''
+import socket
+import struct
+import time
+
+import pytest
+
+from bgpwire import encode_update, prefix_key
+from bmp import (BMPCollector, BMPError, BMPState, INITIATION, PEER_DOWN, PEER_UP,
+                 ROUTE_MONITORING, STAT_ADJ_RIB_IN, STAT_ADJ_RIB_IN_AFI, STAT_LOC_RIB,
+                 STATISTICS_REPORT, encode_message, encode_per_peer, parse_common_header,
+                 parse_per_peer, parse_statistics)
+
+PEER = '10.10.0.3'
+
+
+def prefixes(n):
+    return [prefix_key((100 << 24) + (i << 8), 24) for i in range(n)]
+
+
+def route_monitoring(peer, nlri=(), post_policy=False, withdrawn=()):
+    update = encode_update(nlri=nlri, withdrawn=withdrawn,
+                           next_hop=peer if nlri else None, as_path=(65003,))
+    return encode_per_peer(peer, post_policy) + update
+
+
+def statistics(peer, counters):
+    body = struct.pack('!I', len(counters))
+    for stat_type, value in counters:
+        body += struct.pack('!HH', stat_type, len(value)) + value
+    return encode_per_peer(peer) + body
+
+
+def test_common_header_round_trips():
+    msg = encode_message(INITIATION, b'abc')
+    assert parse_common_header(msg[:6]) == (len(msg), INITIATION)
+
+
+def test_common_header_rejects_other_versions():
+    with pytest.raises(BMPError):
+        parse_common_header(struct.pack('!BIB', 1, 6, INITIATION))
+
+
+def test_per_peer_header_reads_address_and_policy():
+    peer, post_policy, rest = parse_per_peer(encode_per_peer(PEER, post_policy=True) + b'x')
+    assert (peer, post_policy, rest) == (PEER, True, b'x')
+
+
+def test_statistics_take_ipv4_unicast_per_afi_over_totals():
+    stats = parse_statistics(statistics(PEER, [
+        (STAT_ADJ_RIB_IN, struct.pack('!Q', 10)),
+        (STAT_ADJ_RIB_IN_AFI, struct.pack('!HBQ', 1, 1, 7)),
+        (STAT_ADJ_RIB_IN_AFI, struct.pack('!HBQ', 2, 1, 99)),
+        (STAT_LOC_RIB, struct.pack('!Q', 5)),
+    ])[42:])
+    assert stats == {STAT_ADJ_RIB_IN: 7, STAT_LOC_RIB: 5}
+
+
+def test_route_monitoring_counts_pre_and_post_policy():
+    state = BMPState()
+    state.feed(PEER_UP, encode_per_peer(PEER), 1)
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER, prefixes(10)), 2)
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER, withdrawn=prefixes(10)[:2]), 3)
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER, prefixes(10)[:6], post_policy=True), 4)
+    assert state.neighbor_counts() == ({PEER: 8}, {PEER: 6})
+
+
+def test_statistics_win_over_the_counters():
+    '''A counter takes a re-advertisement for a new prefix; the daemon does not.'''
+    state = BMPState()
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER, prefixes(10)), 1)
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER, prefixes(10)[:3]), 2)
+    assert state.neighbor_counts() == ({PEER: 13}, {PEER: 13})
+    state.feed(STATISTICS_REPORT, statistics(PEER, [(STAT_ADJ_RIB_IN, struct.pack('!Q', 10))]), 3)
+    assert state.neighbor_counts() == ({PEER: 10}, {PEER: 10})
+
+
+def test_peers_keep_counters_not_tables():
+    state = BMPState()
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER, prefixes(100)), 1)
+    assert all(isinstance(v, (int, dict, bool, type(None)))
+               for v in vars(state.peers[PEER]).values())
+
+
+def test_accepted_falls_back_to_loc_rib_then_received():
+    state = BMPState()
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER, prefixes(4)), 1)
+    assert state.neighbor_counts() == ({PEER: 4}, {PEER: 4})
+    state.feed(STATISTICS_REPORT, statistics(PEER, [(STAT_LOC_RIB, struct.pack('!Q', 3))]), 2)
+    assert state.neighbor_counts() == ({PEER: 4}, {PEER: 3})
+
+
+def test_end_of_rib_is_stamped_with_its_arrival():
+    state = BMPState()
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER, prefixes(2)), 1)
+    assert state.end_of_rib() == {}
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER), 7)
+    assert state.end_of_rib() == {PEER: True}
+    assert state.peers[PEER].end_of_rib == 7
+    assert state.events[-1] == (7, PEER, 'eor', 2, 2)
+
+
+def test_peer_down_forgets_the_peer_routes():
+    state = BMPState()
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER, prefixes(2)), 1)
+    state.feed(ROUTE_MONITORING, route_monitoring(PEER), 2)
+    state.feed(PEER_DOWN, encode_per_peer(PEER) + b'\x02', 3)
+    assert state.neighbor_counts() == ({PEER: 0}, {PEER: 0})
+    assert state.end_of_rib() == {}
+    assert [e[2] for e in state.events] == ['eor', 'down']
+
+
+def test_collector_reads_a_stream():
+    collector = BMPCollector('127.0.0.1', 0, interval=0.05)
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        collector.port = probe.getsockname()[1]
+    collector.start()
+    try:
+        with socket.create_connection(('127.0.0.1', collector.port)) as s:
+            s.sendall(encode_message(INITIATION)
+                      + encode_message(PEER_UP, encode_per_peer(PEER))
+                      + encode_message(ROUTE_MONITORING, route_monitoring(PEER, prefixes(5)))
+                      + encode_message(ROUTE_MONITORING, route_monitoring(PEER)))
+            deadline = time.monotonic() + 5
+            while collector.end_of_rib() != {PEER: True} and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert collector.connected.is_set()
+            assert collector.neighbor_counts() == ({PEER: 5}, {PEER: 5})
+            assert collector.end_of_rib() == {PEER: True}
+    finally:
+        collector.close()
+
+
+def test_frr_goes_back_to_bgpd_when_bmp_drops():
+    '''A dropped BMP session must not leave FRR waiting on End-of-RIB it will
+    never be sent again.'''
+    import threading
+    from frr import FRRoutingTarget
+
+    class Station(object):
+        connected = threading.Event()
+
+        def neighbor_counts(self):
+            return {}, {PEER: 0}
+
+        def end_of_rib(self):
+            return {PEER: True}
+
+    target = object.__new__(FRRoutingTarget)
+    target.scenario_global_conf = {'testers': [{'neighbors': {PEER: {'check-points': 10}}}]}
+    target.bmp = Station()
+    target.get_neighbors_state = lambda: ({}, {PEER: 5})
+    asked = []
+    target._get_EOR_from_json = lambda neighbors, checked: asked.append(dict(neighbors)) or neighbors
+
+    target.bmp.connected.set()
+    assert target.get_neighbor_received_routes()[0] == {PEER: True}
+    assert target.neighbor_source == 'bmp' and not asked
+
+    target.bmp.connected.clear()
+    assert target.get_neighbor_received_routes()[0] == {PEER: False}
+    assert asked == [{PEER: False}]
+
+
+@pytest.mark.parametrize('version,supported', [('3.3.2', True), ('2.19.2', False),
+                                               ('UNKNOWN (no output from version command)', False)])
+def test_bird_asks_for_bmp_only_from_bird_3(version, supported):
+    from bird import BIRDTarget
+    target = object.__new__(BIRDTarget)
+    target.version_string = lambda: version
+    assert target.bmp_supported() is supported
@@ -0,0 +1,100 @@
+'''The canary's marker prefixes, the ledger that times them, and its session.
+
+A marker counted as a tester prefix would move received and convergence; one
+timed against the wrong send would make a busy target look fast. The session
+test peers the speaker with a scripted target on loopback.
+'''
+import asyncio
+import threading
+import time
+
+import netaddr
+import pytest
+
+from bgpwire import (HEADER_LEN, OPEN, UPDATE, encode_keepalive, encode_open, parse_header,
+                     parse_update, prefix_key)
+from canary import CANARY_NETWORK, CanaryLedger, CanarySpeaker, canary_key, is_canary
+
+
+def key(prefix):
+    p = netaddr.IPNetwork(prefix)
+    return prefix_key(int(p.network), p.prefixlen)
+
+
+def test_markers_are_host_routes_in_the_benchmarking_range():
+    assert canary_key(0) == key('198.18.0.0/32')
+    assert canary_key(257) == key('198.18.1.1/32')
+    assert canary_key(CANARY_NETWORK.size) == canary_key(0)
+    assert all(is_canary(canary_key(i)) for i in (0, 1, CANARY_NETWORK.size - 1))
+
+
+@pytest.mark.parametrize('prefix', ['198.18.0.0/15', '198.18.0.0/24', '198.17.255.255/32',
+                                    '198.20.0.0/32', '10.0.0.1/32'])
+def test_other_prefixes_are_not_markers(prefix):
+    assert not is_canary(key(prefix))
+
+
+def test_take_times_markers_and_returns_the_rest():
+    ledger = CanaryLedger()
+    ledger.mark_sent(canary_key(0), 1_000_000_000)
+    ledger.mark_sent(canary_key(1), 2_000_000_000)
+    ledger.mark_sent(canary_key(2), 3_000_000_000)
+    table = [key('10.0.0.0/24'), key('10.0.1.0/24')]
+    assert ledger.take(table, 1_500_000_000) is table
+    assert ledger.take([canary_key(0), key('10.0.2.0/24')], 1_250_000_000) == [key('10.0.2.0/24')]
+    # a marker sent again after a best-path change keeps its first arrival
+    ledger.take([canary_key(0), canary_key(1)], 2_500_000_000)
+    assert ledger.rows(500_000_000) == [(0.5, 0.25), (1.5, 0.5), (2.5, None)]
+
+
+def test_a_marker_never_sent_is_ignored():
+    ledger = CanaryLedger()
+    assert ledger.take([canary_key(5)], 1) == []
+    assert ledger.rows(0) == []
+
+
+def test_speaker_announces_markers_once_established():
+    '''Peer the canary with a scripted target and read what it announces.'''
+    received = []
+    done = threading.Event()
+    ports = []
+
+    async def target(reader, writer):
+        length, msg_type = parse_header(await reader.readexactly(HEADER_LEN))
+        assert msg_type == OPEN
+        await reader.readexactly(length - HEADER_LEN)
+        writer.write(encode_open(1000, '127.0.0.2', 90))
+        writer.write(encode_keepalive())
+        await writer.drain()
+        while len(received) < 3:
+            length, msg_type = parse_header(await reader.readexactly(HEADER_LEN))
+            data = await reader.readexactly(length - HEADER_LEN)
+            if msg_type == UPDATE:
+                received.extend(parse_update(data)[1])
+        await asyncio.to_thread(done.wait, 10)
+        writer.close()
+
+    async def serve(started):
+        server = await asyncio.start_server(target, '127.0.0.1', 0)
+        ports.append(server.sockets[0].getsockname()[1])
+        started.set()
+        await asyncio.to_thread(done.wait, 10)
+        server.close()
+
+    started = threading.Event()
+    t = threading.Thread(target=lambda: asyncio.run(serve(started)), daemon=True)
+    t.start()
+    assert started.wait(5)
+
+    speaker = CanarySpeaker('127.0.0.1', '127.0.0.1', rate=50, port=ports[0])
+    speaker.run()
+    try:
+        assert speaker.established.wait(5), speaker.error
+        deadline = time.time() + 5
+        while len(received) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        assert received[:3] == [canary_key(0), canary_key(1), canary_key(2)]
+        assert len(speaker.ledger.rows(speaker.origin)) >= 3
+    finally:
+        speaker.close()
+        done.set()
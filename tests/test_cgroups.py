@@ -0,0 +1,173 @@
+'''Reading container resource usage from cgroup v2.
+
+These numbers become 'max cpu %', 'max mem (GB)' and the tester and monitor
+columns. The files are laid out in a temporary directory the way the kernel
+and dockerd lay them out, since a test host cannot be relied on to have
+containers running, or cgroup v2 at all.
+'''
+import os
+
+import pytest
+
+from cgroups import (
+    container_cgroup,
+    cpu_percent,
+    discount_cpu,
+    memory_breakdown,
+    parse_flat_keyed,
+    parse_io_stat,
+    parse_proc_cgroup,
+    read_cgroup,
+    read_smaps_rollup,
+    summarize,
+)
+
+CPU_STAT = '''usage_usec 2500000
+user_usec 2000000
+system_usec 500000
+nr_periods 0
+nr_throttled 0
+throttled_usec 0
+'''
+
+IO_STAT = '''8:0 rbytes=4096 wbytes=8192 rios=1 wios=2 dbytes=0 dios=0
+259:0 rbytes=1000 wbytes=0 rios=3 wios=0 dbytes=0 dios=0
+'''
+
+
+@pytest.fixture
+def cgroup_root(tmp_path):
+    root = tmp_path / 'cgroup'
+    root.mkdir()
+    (root / 'cgroup.controllers').write_text('cpuset cpu io memory pids\n')
+    return root
+
+
+def make_cgroup(directory, usage_usec=2500000, memory=123456789):
+    directory.mkdir(parents=True)
+    (directory / 'cpu.stat').write_text(CPU_STAT.replace('2500000', str(usage_usec), 1))
+    (directory / 'memory.current').write_text('{0}\n'.format(memory))
+    (directory / 'memory.stat').write_text('anon 1000\nfile 2000\nsock 0\n')
+    (directory / 'io.stat').write_text(IO_STAT)
+    return directory
+
+
+class TestParsers:
+    def test_unified_line_is_found_on_a_hybrid_host(self):
+        text = '12:memory:/docker/abc\n0::/system.slice/docker-abc.scope\n'
+        assert parse_proc_cgroup(text) == '/system.slice/docker-abc.scope'
+
+    def test_v1_only_has_no_path(self):
+        assert parse_proc_cgroup('4:cpu,cpuacct:/docker/abc\n') is None
+
+    def test_flat_keyed(self):
+        stat = parse_flat_keyed(CPU_STAT)
+        assert stat['usage_usec'] == 2500000
+        assert stat['system_usec'] == 500000
+
+    def test_io_stat_is_summed_over_devices(self):
+        io = parse_io_stat(IO_STAT)
+        assert io['rbytes'] == 5096
+        assert io['wbytes'] == 8192
+        assert io['rios'] == 4
+
+
+class TestLocating:
+    def test_found_through_the_pid(self, tmp_path, cgroup_root):
+        make_cgroup(cgroup_root / 'system.slice' / 'docker-abc.scope')
+        proc = tmp_path / 'proc' / '42'
+        proc.mkdir(parents=True)
+        (proc / 'cgroup').write_text('0::/system.slice/docker-abc.scope\n')
+
+        path = container_cgroup(42, proc_root=str(tmp_path / 'proc'), cgroup_root=str(cgroup_root))
+        assert path == os.path.join(str(cgroup_root), 'system.slice/docker-abc.scope')
+
+    def test_falls_back_to_the_docker_layout_by_id(self, tmp_path, cgroup_root):
+        '''In a cgroup namespace the pid's path reads as '/', which says nothing.'''
+        make_cgroup(cgroup_root / 'docker' / 'abc')
+        proc = tmp_path / 'proc' / '42'
+        proc.mkdir(parents=True)
+        (proc / 'cgroup').write_text('0::/\n')
+
+        path = container_cgroup(42, 'abc', proc_root=str(tmp_path / 'proc'),
+                                cgroup_root=str(cgroup_root))
+        assert path == os.path.join(str(cgroup_root), 'docker/abc')
+
+    def test_none_on_a_v1_host(self, tmp_path):
+        assert container_cgroup(42, 'abc', proc_root=str(tmp_path),
+                                cgroup_root=str(tmp_path)) is None
+
+
+class TestSampling:
+    def test_cpu_is_a_percentage_of_one_core(self, tmp_path):
+        before = read_cgroup(str(make_cgroup(tmp_path / 'a', usage_usec=1_000_000)))
+        after = read_cgroup(str(make_cgroup(tmp_path / 'b', usage_usec=3_000_000)))
+        # two CPU-seconds in one second is two cores' worth
+        assert cpu_percent(before, after, 1.0) == pytest.approx(200.0)
+
+    def test_missing_files_read_as_zero(self, tmp_path):
+        '''io.stat is absent unless the io controller is delegated.'''
+        d = make_cgroup(tmp_path / 'a')
+        (d / 'io.stat').unlink()
+        sample = read_cgroup(str(d))
+        assert sample['io'] == {}
+        assert sample['memory_current'] == 123456789
+
+    def test_summarize(self, tmp_path):
+        before = read_cgroup(str(make_cgroup(tmp_path / 'a', usage_usec=0)))
+        after = read_cgroup(str(make_cgroup(tmp_path / 'b', usage_usec=500_000, memory=42)))
+        s = summarize(before, after, 0.5)
+        assert s['cpu'] == pytest.approx(100.0)
+        assert s['mem'] == 42
+        assert s['io_read'] == 0
+
+    def test_memory_is_broken_down_by_kind(self, tmp_path):
+        d = make_cgroup(tmp_path / 'a')
+        (d / 'memory.peak').write_text('987654321\n')
+        s = summarize(read_cgroup(str(d)), read_cgroup(str(d)), 1.0)
+        assert (s['mem_anon'], s['mem_file'], s['mem_sock']) == (1000, 2000, 0)
+        assert s['mem_peak'] == 987654321
+
+    def test_kernel_memory_is_summed_before_5_18(self):
+        assert memory_breakdown({'anon': 1, 'kernel_stack': 10, 'slab': 20,
+                                 'pagetables': 5})['kernel'] == 35
+        assert memory_breakdown({'kernel': 7, 'slab': 20})['kernel'] == 7
+
+    def test_unreadable_memory_stat_is_none_not_zero(self, tmp_path):
+        d = make_cgroup(tmp_path / 'a')
+        (d / 'memory.stat').unlink()
+        s = summarize(read_cgroup(str(d)), read_cgroup(str(d)), 1.0)
+        assert s['mem_anon'] is None
+        assert s['mem_peak'] is None
+
+    def test_smaps_rollup_is_summed_over_the_daemon(self, tmp_path):
+        for pid, rss, pss in ((17, 1304, 321), (18, 100, 50)):
+            (tmp_path / str(pid)).mkdir()
+            (tmp_path / str(pid) / 'smaps_rollup').write_text(
+                '55c86ad23000-7fff1413c000 ---p 00000000 00:00 0   [rollup]\n'
+                'Rss:   {0} kB\nPss:   {1} kB\nPss_Anon:  100 kB\n'.format(rss, pss))
+        assert read_smaps_rollup(['17', '18', '19'], str(tmp_path)) == \
+            {'rss': 1404 * 1024, 'pss': 371 * 1024}
+        assert read_smaps_rollup(['19'], str(tmp_path)) is None
+
+    def test_observer_cpu_is_taken_off_the_target(self, tmp_path):
+        '''Status commands exec'd into the target are not the daemon's CPU.'''
+        before = read_cgroup(str(make_cgroup(tmp_path / 'a', usage_usec=0)))
+        after = read_cgroup(str(make_cgroup(tmp_path / 'b', usage_usec=1_000_000)))
+        assert cpu_percent(before, discount_cpu(after, 250_000), 1.0) == pytest.approx(75.0)
+        assert discount_cpu(after, 0) is after
+
+    def test_cpu_totals_are_split_into_user_and_system(self, tmp_path):
+        d = make_cgroup(tmp_path / 'a')
+        reading = read_cgroup(str(d))
+        s = summarize(reading, reading, 1.0)
+        assert (s['cpu_user'], s['cpu_system']) == (2.0, 0.5)
+        # the status commands' CPU comes off both, in proportion
+        s = summarize(reading, discount_cpu(reading, 250_000), 1.0)
+        assert (s['cpu_user'], s['cpu_system']) == (pytest.approx(1.8), pytest.approx(0.45))
+
+    def test_unreadable_cpu_stat_has_no_totals(self, tmp_path):
+        d = make_cgroup(tmp_path / 'a')
+        (d / 'cpu.stat').unlink()
+        s = summarize(read_cgroup(str(d)), read_cgroup(str(d)), 1.0)
+        assert s['cpu_user'] is None
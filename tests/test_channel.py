@@ -0,0 +1,106 @@
+'''The long-lived command channel that stands in for one docker exec per command.
+
+A misframed answer here would hand the neighbor poller another command's
+output, so these drive a real `sh` through the same framing the container's
+shell sees, with Docker's attach stream multiplexing emulated around it.
+'''
+import socket
+import subprocess
+import threading
+
+import pytest
+
+from channel import (FRAME_HEADER, STDERR, STDOUT, CommandChannel, CommandStats, Demux,
+                     request, shell_command, split_response)
+
+
+def frame(stream, payload):
+    return FRAME_HEADER.pack(stream, len(payload)) + payload
+
+
+class FakeDocker:
+    '''exec_start(socket=True) wired to a local sh, framed the way dockerd frames it.'''
+    def __init__(self):
+        self.execs = 0
+
+    def exec_create(self, container, cmd, **kwargs):
+        self.execs += 1
+        return {'Id': container}
+
+    def exec_start(self, exec_id, socket=False):
+        ours, theirs = _socket_pair()
+        shell = subprocess.Popen(['sh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        def requests():
+            while True:
+                data = theirs.recv(4096)
+                if not data:
+                    shell.stdin.close()
+                    return
+                shell.stdin.write(data)
+                shell.stdin.flush()
+
+        def answers():
+            for chunk in iter(lambda: shell.stdout.read1(7), b''):
+                # noise on stderr, and frames cut mid-payload, as a socket may
+                theirs.sendall(frame(STDERR, b'warning\n') + frame(STDOUT, chunk))
+            theirs.close()
+
+        for target in (requests, answers):
+            threading.Thread(target=target, daemon=True).start()
+        return ours
+
+
+def _socket_pair():
+    return socket.socketpair()
+
+
+def test_demux_reassembles_split_frames():
+    data = frame(STDOUT, b'hello ') + frame(STDERR, b'oops') + frame(STDOUT, b'world')
+    d = Demux()
+    frames = []
+    for i in range(len(data)):
+        frames += d.feed(data[i:i + 1])
+    assert frames == [(STDOUT, b'hello '), (STDERR, b'oops'), (STDOUT, b'world')]
+
+
+def test_commands_keep_their_exec_meaning():
+    '''Split like Docker splits a string command, then quoted back for sh.'''
+    line = shell_command(r"cli show bgp neighbor \| no-more")
+    assert line.startswith("cli show bgp neighbor '|' no-more ")
+    assert "'show protocols all'" in shell_command("birdc 'show protocols all'")
+    assert shell_command(['sh', '-c', 'a; b'], stderr=True).endswith('2>&1')
+
+
+@pytest.mark.parametrize('output', [b'', b'one line\n', b'no newline', b'a\n\nb\n\n'])
+def test_answers_are_returned_byte_for_byte(output):
+    shell = subprocess.run(['sh'], input=request(['printf', '%s', output.decode()], 1),
+                           stdout=subprocess.PIPE).stdout
+    got, rest = split_response(bytearray(shell), 1)
+    assert got == output
+    assert rest == b''
+
+
+def test_an_unfinished_answer_is_not_taken():
+    assert split_response(bytearray(b'partial output'), 1) is None
+
+
+def test_channel_runs_many_commands_on_one_exec():
+    docker = FakeDocker()
+    channel = CommandChannel(docker, 'bgperf_bird_target', timeout=5)
+    try:
+        for i in range(20):
+            assert channel.run(['echo', str(i)]) == '{0}\n'.format(i).encode()
+        assert channel.run("sh -c 'echo visible; echo hidden >&2'") == b'visible\n'
+        assert channel.run("sh -c 'echo both >&2'", stderr=True) == b'both\n'
+        assert docker.execs == 1
+    finally:
+        channel.close()
+
+
+def test_command_stats_are_kept_per_program_and_path():
+    stats = CommandStats()
+    stats.record("birdc 'show protocols all'", 'channel', 2_000_000)
+    stats.record('/usr/sbin/birdc show status', 'channel', 4_000_000)
+    stats.record('ip addr', 'exec', 30_000_000)
+    assert stats.rows() == [('birdc', 'channel', 2, 3.0, 4.0), ('ip', 'exec', 1, 30.0, 30.0)]
@@ -7,8 +7,7 @@ very host contention it reports. finish_bench() used to assign a module-level
 bool without `global`, which made the assignment a no-op and left every thread
 running for the life of the process.
 
-Only the `ps`-based sampler is exercised here -- `free` and `mpstat` add an
-external dependency without testing anything different about the shutdown path.
+Both /proc samplers are exercised here: they read nothing a test host lacks.
 '''
 import queue
 import threading
@@ -62,3 +61,24 @@ def test_a_second_run_gets_a_working_sampler():
     deadline = time.time() + 5
     while threading.active_count() > before and time.time() < deadline:
         time.sleep(0.01)
+
+
+def test_host_thread_reports_idle_and_free_in_one_message():
+    '''bench() used to read these from separate messages with an elif chain.'''
+    q = queue.Queue()
+    before = threading.active_count()
+
+    bgperf2.controller_stop.clear()
+    bgperf2.controller_host_stats(q, interval=0.05)
+
+    sample = q.get(timeout=5)
+    assert sample['who'] == 'controller'
+    assert 0 <= sample['idle'] <= 100
+    assert sample['free'] > 0
+    assert 'psi_cpu' in sample
+
+    bgperf2.controller_stop.set()
+    deadline = time.time() + 5
+    while threading.active_count() > before and time.time() < deadline:
+        time.sleep(0.01)
+    assert threading.active_count() == before, 'sampler thread outlived the run'
@@ -9,9 +9,16 @@ from convergence import (
     ASSURANCE_SAMPLES,
     ASSURANCE_SAMPLES_AFTER_CHECKPOINT,
     DROP_SAMPLES,
+    IDLE_STUCK_SAMPLES,
     NO_PROGRESS_DEADLINE_SECONDS,
+    POLICIES,
     STUCK_SAMPLES,
     ConvergenceTracker,
+    EvidenceTracker,
+    ingest_rates,
+    make_trackers,
+    percentile_times,
+    rate_summary,
 )
 
 
@@ -264,3 +271,184 @@ def test_drop_streak_accumulates_when_neighbor_count_is_steady():
     statuses = [t.update(2 + i, 50000, 5, 5, False) for i in range(DROP_SAMPLES)]
     assert statuses[-1] == ConvergenceTracker.FAILED
     assert ConvergenceTracker.FAILED not in statuses[:-1]
+
+
+def test_a_faster_monitor_keeps_the_windows_in_seconds():
+    '''Polling every 100ms must not make a run converge after 2s instead of 20s.'''
+    t = ConvergenceTracker(sample_interval=0.1)
+    assert t.assurance_samples == ASSURANCE_SAMPLES * 10
+    assert t.stuck_samples == STUCK_SAMPLES * 10
+    assert t.drop_samples == DROP_SAMPLES * 10
+    t.note_neighbors_checkpoint()
+    t.update(0.1, 1000, 5, 5, False)
+    for i in range(ASSURANCE_SAMPLES * 10 - 1):
+        assert t.update(0.2 + i / 10, 1000, 5, 5, False) == ConvergenceTracker.CONTINUE
+    assert t.update(30, 1000, 5, 5, False) == ConvergenceTracker.CONVERGED
+
+
+def test_a_slower_monitor_never_needs_zero_samples():
+    assert ConvergenceTracker(sample_interval=30).samples(ASSURANCE_SAMPLES_AFTER_CHECKPOINT) == 1
+
+
+def test_percentile_times_interpolate_between_samples():
+    t = [0, 1, 2, 3, 4]
+    counts = [0, 0, 800, 990, 1000]
+    at = percentile_times(t, counts, 1000)
+    assert at[50] == pytest.approx(1.625)
+    assert at[90] == pytest.approx(2 + 100 / 190)
+    assert at[99] == pytest.approx(3.0)
+    assert at[100] == pytest.approx(4.0)
+
+
+def test_a_share_never_reached_is_none():
+    at = percentile_times([0, 1, 2], [0, 500, 900], 1000)
+    assert at[50] == pytest.approx(1.0)
+    assert at[99] is None and at[100] is None
+    assert set(percentile_times([0, 1], [0, 0], 0).values()) == {None}
+
+
+def test_ingest_rates_are_per_second_between_samples():
+    assert ingest_rates([0, 0.5, 1.5], [0, 100, 100]) == ([0.5, 1.5], [200.0, 0.0])
+
+
+def test_the_mean_rate_leaves_out_the_wait_and_the_assurance_samples():
+    t = [0, 1, 2, 3, 4, 5, 6, 7]
+    counts = [0, 0, 0, 600, 1000, 1000, 1000, 1000]
+    peak, mean = rate_summary(t, counts)
+    assert peak == 600
+    # from t=2, the last sample with nothing, to t=4, the first with everything
+    assert mean == 500
+    assert rate_summary(t, [0] * len(t)) == (None, None)
+
+
+def converge(tracker, samples, cpu):
+    '''Feed `samples` (received counts, one a second) and return the elapsed
+    second at which the run was declared converged, or None.'''
+    tracker.note_neighbors_checkpoint()
+    for elapsed, recved in enumerate(samples, start=1):
+        status = tracker.update(elapsed, recved, 5, 5, recved >= 1000, target_cpu=cpu(recved))
+        if status == ConvergenceTracker.CONVERGED:
+            return elapsed
+    return None
+
+
+def test_evidence_decides_sooner_on_the_same_samples():
+    counts = [0, 0, 500, 1000] + [1000] * 30
+    idle = lambda recved: 5.0 if recved in (0, 1000) else 400.0
+    assert converge(ConvergenceTracker(), counts, idle) == 9
+    # the count moved every second, so tau is 1s, halved at the check-point:
+    # three quiet samples by t=7, and 1 - exp(-3 / 0.5) is past 0.99
+    assert converge(EvidenceTracker(), counts, idle) == 7
+
+
+def test_tau_follows_the_runs_own_pauses():
+    counts = [0, 0, 300, 300, 300, 600, 1000] + [1000] * 30
+    idle = lambda recved: 5.0 if recved in (0, 1000) else 400.0
+    t = EvidenceTracker()
+    # a 3s pause mid-ingest: tau is 1.5s, and seven quiet samples are needed
+    assert converge(t, counts, idle) == 14
+    assert t.longest_gap == 3
+
+
+@pytest.mark.parametrize('busy', [
+    lambda recved: 5.0 if recved == 0 else 400.0,
+    # still working hard, and the check-point never reached
+    lambda recved: 2.0 if recved == 0 else 300.0,
+])
+def test_a_busy_target_is_never_converged(busy):
+    assert converge(EvidenceTracker(), [0, 0, 500, 1000] + [1000] * 30, busy) is None
+    assert converge(EvidenceTracker(), [0, 0, 500, 900] + [900] * 30, busy) is None
+
+
+def test_without_the_target_cpu_evidence_waits_out_the_window():
+    counts = [0, 0, 500, 1000] + [1000] * 30
+    unknown = lambda recved: None
+    assert converge(EvidenceTracker(), counts, unknown) == \
+        converge(ConvergenceTracker(), counts, unknown) == 9
+
+
+def test_one_tracker_per_policy():
+    trackers = make_trackers(0.5, confidence=0.9)
+    assert set(trackers) == set(POLICIES)
+    assert all(isinstance(trackers[name], cls) for name, cls in POLICIES.items())
+    assert trackers['evidence'].confidence == 0.9
+    assert trackers['tracker'].sample_interval == 0.5
+
+
+def test_evidence_still_waits_for_every_peer():
+    t = EvidenceTracker()
+    for elapsed in range(1, 30):
+        assert t.update(elapsed, 1000, 4, 4, True, target_cpu=0.0) == ConvergenceTracker.CONTINUE
+
+
+def test_evidence_keeps_the_failure_rules():
+    t = EvidenceTracker()
+    t.update(1, 100000, 5, 5, False)
+    statuses = [t.update(2 + i, 50000, 5, 5, False) for i in range(DROP_SAMPLES)]
+    assert statuses[-1] == ConvergenceTracker.FAILED
+
+
+@pytest.mark.parametrize('confidence', [0, 1, 1.5])
+def test_confidence_is_a_probability(confidence):
+    with pytest.raises(ValueError):
+        EvidenceTracker(confidence=confidence)
+
+
+def stall(tracker, samples, baseline=3.0, **activity):
+    '''A count that reaches 500 and stops there, with no checkpoint; the
+    elapsed second it was failed at, or None. The target runs at `baseline`
+    CPU until the first prefix arrives.'''
+    for elapsed in range(1, samples + 1):
+        recved = 0 if elapsed < 3 else 500
+        now = dict(activity, target_cpu=baseline) if recved == 0 and activity else activity
+        if tracker.update(elapsed, recved, 4, 4, False, **now) == ConvergenceTracker.FAILED:
+            return elapsed
+    return None
+
+
+def test_a_flat_count_with_nothing_left_working_fails_fast():
+    t = ConvergenceTracker()
+    failed = stall(t, 100, target_cpu=3.0, queued_bytes=0, tester_cpu=0.5)
+    # flat from t=4, idle-flat from then on
+    assert failed == 3 + IDLE_STUCK_SAMPLES
+    assert 'target idle' in t.fail_msg
+
+
+@pytest.mark.parametrize('activity', [
+    {'target_cpu': 250.0, 'queued_bytes': 0, 'tester_cpu': 0.5},
+    {'target_cpu': 3.0, 'queued_bytes': 65536, 'tester_cpu': 0.5},
+    {'target_cpu': 3.0, 'queued_bytes': 0, 'tester_cpu': 80.0},
+    {'target_cpu': 3.0, 'queued_bytes': None, 'tester_cpu': 0.5},
+    {},
+])
+def test_anything_still_working_keeps_the_long_grace(activity):
+    assert stall(ConvergenceTracker(), 100, **activity) is None
+
+
+def test_idle_is_judged_against_the_targets_own_baseline():
+    '''A daemon that idles at 40% -- polling, say -- is idle at 40%.'''
+    t = ConvergenceTracker()
+    failed = stall(t, 100, baseline=40.0, target_cpu=45.0, queued_bytes=0, tester_cpu=0.5)
+    assert t.baseline_cpu == 40.0
+    assert failed == 3 + IDLE_STUCK_SAMPLES
+
+
+def test_no_baseline_is_not_an_idle_target():
+    '''Prefixes already arriving at the first target sample leave nothing to
+    compare its CPU with, and a low reading proves nothing.'''
+    t = ConvergenceTracker()
+    for elapsed in range(1, 101):
+        status = t.update(elapsed, 500, 4, 4, False, target_cpu=1.0, queued_bytes=0,
+                          tester_cpu=0.5)
+    assert t.baseline_cpu is None and not t.target_idle(1.0)
+    assert status == ConvergenceTracker.CONTINUE
+
+
+def test_an_idle_run_that_finished_still_converges():
+    t = ConvergenceTracker()
+    t.note_neighbors_checkpoint()
+    t.update(1, 1000, 5, 5, True, target_cpu=1.0, queued_bytes=0, tester_cpu=0.0)
+    for elapsed in range(2, 2 + ASSURANCE_SAMPLES_AFTER_CHECKPOINT):
+        status = t.update(elapsed, 1000, 5, 5, True, target_cpu=1.0, queued_bytes=0,
+                          tester_cpu=0.0)
+    assert status == ConvergenceTracker.CONVERGED
@@ -0,0 +1,107 @@
+'''GoBGP and RustyBGP neighbor counts read over gRPC rather than the gobgp CLI.
+
+grpc and the generated stubs are optional and not installed for the tests, so
+these pin the part that decides the numbers: that the API's Peer messages give
+the same counts as `gobgp neighbor -j`, and that without the API the CLI path
+is still what runs.
+'''
+import json
+
+import pytest
+
+import gobgp_api
+from gobgp import GoBGPTarget
+
+
+class Message:
+    '''A protobuf message stand-in: absent scalar fields read as zero.'''
+    def __init__(self, fields):
+        for key, value in fields.items():
+            if isinstance(value, dict):
+                value = Message(value)
+            elif isinstance(value, list):
+                value = [Message(v) if isinstance(v, dict) else v for v in value]
+            setattr(self, key, value)
+
+    def __getattr__(self, name):
+        return 0
+
+
+def cli_target(output):
+    target = object.__new__(GoBGPTarget)
+    target.observe = lambda cmd: output
+    return target
+
+
+def test_api_and_cli_counts_agree(fixture_text):
+    text = fixture_text('gobgp_neighbor.json')
+    peers = [Message(p) for p in json.loads(text)]
+    assert gobgp_api.peer_counts(peers) == cli_target(text.encode()).get_neighbors_state()
+
+
+def test_a_peer_without_families_counts_zero():
+    peer = Message({'state': {'neighbor_address': '10.10.0.7'}, 'afi_safis': []})
+    assert gobgp_api.peer_counts([peer]) == ({'10.10.0.7': 0}, {'10.10.0.7': 0})
+
+
+@pytest.mark.skipif(gobgp_api.available(), reason='the GoBGP stubs are installed')
+def test_without_the_stubs_the_cli_is_used(fixture_text):
+    target = cli_target(fixture_text('gobgp_neighbor.json').encode())
+    received, accepted = target.get_neighbors_state()
+    assert target.api is None and target.api_attempts == 0
+    assert set(received) == set(accepted)
+
+
+class FakeApi:
+    '''GoBGPApi without a channel: counts what was opened and closed.'''
+    opened = []
+
+    def __init__(self, address, answers=True):
+        self.answers = answers
+        self.closed = False
+        FakeApi.opened.append(self)
+
+    def peers(self):
+        if not self.answers:
+            raise OSError('connection refused')
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def api_target(monkeypatch):
+    FakeApi.opened = []
+    monkeypatch.setattr(gobgp_api, 'available', lambda: True)
+    monkeypatch.setattr(gobgp_api, 'GoBGPApi', FakeApi)
+    target = object.__new__(GoBGPTarget)
+    target.conf = {'local-address': '10.10.0.1'}
+    target.stop_monitoring = False
+    return target
+
+
+def test_an_api_that_does_not_answer_is_closed(api_target, monkeypatch):
+    monkeypatch.setattr(gobgp_api, 'GoBGPApi', lambda address: FakeApi(address, answers=False))
+    assert api_target.connect_api() is None
+    assert api_target.connect_api() is None
+    assert len(FakeApi.opened) == 2 and all(api.closed for api in FakeApi.opened)
+
+
+def test_the_api_is_closed_when_the_run_ends(api_target):
+    api = api_target.connect_api()
+    api_target.stop_monitoring = True
+    api_target.close_api()
+    assert api.closed and api_target.api is None
+    # and nothing reconnects once monitoring has stopped
+    assert api_target.connect_api() is None and len(FakeApi.opened) == 1
+
+
+def test_the_poll_and_the_watch_connect_once(api_target):
+    import threading
+    threads = [threading.Thread(target=api_target.connect_api) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(FakeApi.opened) == 1 and api_target.api_attempts == 1
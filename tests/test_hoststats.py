@@ -0,0 +1,67 @@
+'''Host idle, memory and pressure from /proc, in place of mpstat and free.
+
+min idle% and min free mem (GB) are published columns, so the /proc readings
+have to mean what mpstat's %idle and free's "available" meant.
+'''
+import pytest
+
+from hoststats import (
+    idle_percent,
+    parse_cpu_times,
+    parse_meminfo,
+    parse_pressure,
+    sample_host,
+    stall_percent,
+    summarize,
+)
+
+STAT = '''cpu  1000 10 500 8000 400 0 90 0 200 0
+cpu0 500 5 250 4000 200 0 45 0 100 0
+intr 12345
+'''
+
+MEMINFO = '''MemTotal:       65536000 kB
+MemFree:         1000000 kB
+MemAvailable:   32000000 kB
+Cached:         30000000 kB
+'''
+
+PRESSURE = '''some avg10=1.50 avg60=0.80 avg300=0.20 total=2000000
+full avg10=0.00 avg60=0.00 avg300=0.00 total=500000
+'''
+
+
+def test_cpu_times_leave_guest_out_of_the_total():
+    '''guest time is already inside user; counting it again deflates idle.'''
+    idle, total = parse_cpu_times(STAT)
+    assert idle == 8000
+    assert total == 1000 + 10 + 500 + 8000 + 400 + 0 + 90 + 0
+
+
+def test_iowait_is_not_idle():
+    '''mpstat reports %iowait apart from %idle; min idle% always did.'''
+    assert idle_percent((0, 0), (50, 100)) == pytest.approx(50.0)
+    assert idle_percent((10, 100), (10, 100)) is None
+
+
+def test_free_is_mem_available():
+    assert parse_meminfo(MEMINFO) == 32000000 * 1024
+
+
+def test_pressure_totals():
+    assert parse_pressure(PRESSURE) == {'some': 2000000, 'full': 500000}
+
+
+def test_stall_is_a_share_of_the_interval():
+    # a quarter of a second stalled in one second
+    assert stall_percent({'some': 0}, {'some': 250000}, 1.0) == pytest.approx(25.0)
+
+
+def test_missing_pressure_reads_as_none(tmp_path):
+    '''Kernels before 4.20, or booted psi=0, have no /proc/pressure.'''
+    (tmp_path / 'stat').write_text(STAT)
+    (tmp_path / 'meminfo').write_text(MEMINFO)
+    first = sample_host(str(tmp_path))
+    out = summarize(first, sample_host(str(tmp_path)), 1.0)
+    assert out['psi_cpu'] is None
+    assert out['free'] == 32000000 * 1024
@@ -0,0 +1,77 @@
+'''Tests for metrics.py, the live OpenMetrics view of a running cell.
+
+A scrape that fails to parse is a dashboard that goes blank in the middle of
+a multi-hour batch, which is exactly when it is being looked at.
+'''
+import urllib.request
+
+import pytest
+
+from metrics import CONTENT_TYPE, LiveMetrics, MetricsServer
+
+
+def test_renders_gauges_with_run_labels():
+    m = LiveMetrics()
+    m.start_cell(run='bird 2.17', target='bird')
+    m.update(target_cpu_percent=87.5, host_idle_percent=None)
+    text = m.render()
+    assert '# TYPE bgperf2_target_cpu_percent gauge' in text
+    assert 'bgperf2_target_cpu_percent{run="bird 2.17",target="bird"} 87.5' in text
+    # a value never reported is left out rather than shown as zero
+    assert 'host_idle' not in text
+    assert text.endswith('# EOF\n')
+
+
+def test_ingest_rate_is_taken_between_samples():
+    m = LiveMetrics()
+    m.update(elapsed_seconds=10.0, monitor_received_prefixes=1000)
+    assert 'monitor_ingest_rate' not in m.values
+    m.update(elapsed_seconds=12.0, monitor_received_prefixes=5000)
+    assert m.values['monitor_ingest_rate'] == 2000.0
+
+
+def test_new_cell_forgets_the_last_one():
+    m = LiveMetrics()
+    m.update(elapsed_seconds=10.0, monitor_received_prefixes=1000, target_cpu_percent=50)
+    m.start_cell(run='frr', target='frr')
+    m.update(elapsed_seconds=1.0, monitor_received_prefixes=10)
+    assert 'target_cpu_percent' not in m.values
+    assert 'monitor_ingest_rate' not in m.values
+
+
+def test_label_values_are_escaped():
+    m = LiveMetrics()
+    m.start_cell(run='a "quoted" \\ run')
+    m.update(elapsed_seconds=1)
+    assert 'run="a \\"quoted\\" \\\\ run"' in m.render()
+
+
+def test_batch_progress_per_test():
+    m = LiveMetrics()
+    m.set_progress('scale', 3, 12)
+    text = m.render()
+    assert 'bgperf2_batch_cells_completed{test="scale"} 3.0' in text
+    assert 'bgperf2_batch_cells_total{test="scale"} 12.0' in text
+
+
+def test_textfile_is_replaced_whole(tmp_path):
+    m = LiveMetrics()
+    m.update(elapsed_seconds=3)
+    path = tmp_path / 'bgperf2.prom'
+    m.write_textfile(str(path))
+    assert 'bgperf2_elapsed_seconds 3.0' in path.read_text()
+    assert [p.name for p in tmp_path.iterdir()] == ['bgperf2.prom']
+
+
+def test_server_answers_scrapes():
+    m = LiveMetrics()
+    m.update(neighbors_accepted=4)
+    server = MetricsServer(m, 0, address='127.0.0.1')
+    try:
+        with urllib.request.urlopen('http://127.0.0.1:{0}/metrics'.format(server.port)) as r:
+            assert r.headers['Content-Type'] == CONTENT_TYPE
+            assert 'bgperf2_neighbors_accepted 4.0' in r.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen('http://127.0.0.1:{0}/'.format(server.port))
+    finally:
+        server.close()
@@ -0,0 +1,163 @@
+'''The in-process BGP monitor: wire format, prefix counting, and a live session.
+
+The native monitor is the instrument every timing is read from when
+`--monitor native` is given, so a miscount here is a wrong result, not a
+crash. The session test peers it with a scripted speaker on loopback -- the
+same OPEN / KEEPALIVE / UPDATE exchange a target has with it.
+'''
+import asyncio
+import queue
+import threading
+import time
+
+import netaddr
+import pytest
+
+from bgpwire import (
+    BGPError,
+    HEADER_LEN,
+    OPEN,
+    PrefixTable,
+    count_update,
+    encode_keepalive,
+    encode_open,
+    encode_update,
+    parse_header,
+    parse_open,
+    parse_update,
+    prefix_key,
+)
+from monitor import NativeMonitor
+
+
+def key(prefix):
+    p = netaddr.IPNetwork(prefix)
+    return prefix_key(int(p.network), p.prefixlen)
+
+
+def body(message):
+    length, _ = parse_header(message[:HEADER_LEN])
+    assert length == len(message)
+    return message[HEADER_LEN:]
+
+
+class TestWire:
+    def test_update_round_trip(self):
+        nlri = [key('10.1.0.0/16'), key('192.0.2.0/24'), key('203.0.113.7/32'), key('0.0.0.0/0')]
+        msg = encode_update(nlri=nlri, next_hop='10.10.0.3', as_path=[65001])
+        withdrawn, got, eor = parse_update(body(msg))
+        assert got == nlri
+        assert withdrawn == []
+        assert not eor
+
+    def test_withdrawals(self):
+        msg = encode_update(withdrawn=[key('10.1.0.0/16')])
+        withdrawn, nlri, eor = parse_update(body(msg))
+        assert withdrawn == [key('10.1.0.0/16')]
+        assert nlri == []
+        assert not eor
+
+    def test_empty_update_is_end_of_rib(self):
+        assert parse_update(body(encode_update())) == ([], [], True)
+
+    def test_count_update_agrees_with_parse_update(self):
+        nlri = [key('10.1.0.0/16'), key('0.0.0.0/0'), key('192.0.2.0/24')]
+        msg = encode_update(nlri=nlri, withdrawn=[key('10.2.0.0/16')], next_hop='10.10.0.3')
+        assert count_update(body(msg)) == (1, 3, False)
+        assert count_update(body(encode_update())) == (0, 0, True)
+        with pytest.raises(BGPError):
+            count_update(body(msg)[:-1])
+
+    def test_four_octet_as_comes_from_the_capability(self):
+        o = parse_open(body(encode_open(4200000001, '10.10.0.2', 90)))
+        assert o['asn'] == 4200000001
+        assert o['hold_time'] == 90
+        assert o['router_id'] == '10.10.0.2'
+
+    def test_bad_marker_is_rejected(self):
+        with pytest.raises(BGPError):
+            parse_header(b'\x00' * HEADER_LEN)
+
+    def test_prefix_length_over_32_is_rejected(self):
+        with pytest.raises(BGPError):
+            parse_update(b'\x00\x00\x00\x00' + bytes([33, 10, 0, 0, 0, 0]))
+
+
+class TestPrefixTable:
+    def test_readvertisement_is_not_counted_twice(self):
+        '''A best-path change re-announces the prefix; the table does not grow.'''
+        t = PrefixTable()
+        assert t.apply([], [key('10.0.0.0/24'), key('10.0.1.0/24')])
+        assert not t.apply([], [key('10.0.0.0/24')])
+        assert t.accepted == 2
+        assert t.nlri == 3
+
+    def test_withdraw_shrinks_the_table(self):
+        t = PrefixTable()
+        t.apply([], [key('10.0.0.0/24'), key('10.0.1.0/24')])
+        t.apply([key('10.0.0.0/24')], [])
+        assert t.accepted == 1
+        assert t.withdrawn == 1
+
+    def test_same_address_different_length_are_different_prefixes(self):
+        t = PrefixTable()
+        t.apply([], [key('10.0.0.0/8'), key('10.0.0.0/16')])
+        assert t.accepted == 2
+
+
+def test_session_counts_what_the_peer_sends():
+    '''Peer the monitor with a scripted speaker and read what it reports.'''
+    prefixes = [key('10.{0}.{1}.0/24'.format(i // 256, i % 256)) for i in range(1000)]
+    done = threading.Event()
+    ports = []
+
+    async def speaker(reader, writer):
+        header = await reader.readexactly(HEADER_LEN)
+        length, msg_type = parse_header(header)
+        assert msg_type == OPEN
+        await reader.readexactly(length - HEADER_LEN)
+        writer.write(encode_open(65000, '10.10.255.254', 90))
+        writer.write(encode_keepalive())
+        for i in range(0, len(prefixes), 100):
+            writer.write(encode_update(nlri=prefixes[i:i + 100], next_hop='127.0.0.1',
+                                       as_path=[65000]))
+        writer.write(encode_update())
+        await writer.drain()
+        await asyncio.to_thread(done.wait, 10)
+        writer.close()
+
+    async def serve(started):
+        server = await asyncio.start_server(speaker, '127.0.0.1', 0)
+        ports.append(server.sockets[0].getsockname()[1])
+        started.set()
+        await asyncio.to_thread(done.wait, 10)
+        server.close()
+
+    started = threading.Event()
+    t = threading.Thread(target=lambda: asyncio.run(serve(started)), daemon=True)
+    t.start()
+    assert started.wait(5)
+
+    conf = {'target': {'local-address': '127.0.0.1', 'as': 65000},
+            'monitor': {'as': 1001, 'router-id': '127.0.0.1', 'local-address': '127.0.0.1',
+                        'check-points': [1000]}}
+    m = NativeMonitor('/nonexistent', conf['monitor'])
+    m.port = ports[0]
+    m.run(conf)
+    try:
+        assert m.established.wait(5), m.error
+        deadline = time.time() + 5
+        while not m.table.end_of_rib and time.time() < deadline:
+            time.sleep(0.01)
+
+        q = queue.Queue()
+        m.stats(q)
+        sample = q.get(timeout=5)
+        assert sample['who'] == m.name
+        assert sample['accepted'] == 1000
+        assert sample['checked'] is True
+        assert sample['end_of_rib'] is True
+        assert sample['first_update'] <= sample['last_change'] <= sample['time']
+    finally:
+        m.close()
+        done.set()
@@ -0,0 +1,75 @@
+'''The target's TCP sessions and the bench network's counters, in netstats.py.
+
+A Recv-Q read from the wrong column, or a session keyed by the wrong end,
+would blame the network for the daemon's backlog or the other way round, so
+each format is parsed here from text as the kernel and ss print it.
+'''
+from netstats import (bridge_members, parse_net_dev, parse_proc_tcp, parse_softnet, parse_ss,
+                      read_network)
+
+SS = '''\
+State Recv-Q Send-Q Local Address:Port  Peer Address:Port Process
+LISTEN 0     4096         0.0.0.0:179        0.0.0.0:*
+ESTAB 212992 0          10.10.0.2:179      10.10.0.3:41234
+\t cubic wscale:7,7 rto:204 rtt:0.052/0.021 ato:40 mss:1448 rcv_space:14480 snd_wnd:64256 retrans:0/7
+ESTAB 0      4344       10.10.0.2:37766    10.10.0.1:179
+\t cubic wscale:7,7 rto:204 rtt:1.5/0.75 mss:1448 snd_wnd:0
+ESTAB 0      0          10.10.0.2:22       10.10.0.9:50000
+\t cubic rtt:0.1/0.05
+'''
+
+PROC_TCP = '''\
+  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 00000000:00B3 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 1 1
+   1: 02000A0A:00B3 03000A0A:A112 01 00000000:00034000 00:00000000 00000000     0        0 2 1
+'''
+
+NET_DEV = '''\
+Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo: 97106982   12665    0    0    0     0          0         0 97106982   12665    0    0    0     0       0          0
+br-0123456789ab: 5000 50 0 1 0 0 0 0 6000 60 0 2 0 0 0 0
+vethaaa: 100 1 0 0 0 0 0 0 200 2 0 3 0 0 0 0
+'''
+
+
+def test_ss_sessions_are_keyed_by_peer_on_port_179():
+    sessions = parse_ss(SS)
+    assert set(sessions) == {'10.10.0.3', '10.10.0.1'}
+    tester = sessions['10.10.0.3']
+    assert tester == {'recv_q': 212992, 'send_q': 0, 'rtt': 0.052e-3, 'retrans': 7,
+                      'rwnd': 64256}
+    # no retrans: field when nothing was retransmitted
+    assert sessions['10.10.0.1']['retrans'] == 0
+    assert sessions['10.10.0.1']['rwnd'] == 0
+
+
+def test_proc_tcp_gives_the_queues():
+    assert parse_proc_tcp(PROC_TCP) == {'10.10.0.3': {'recv_q': 0x34000, 'send_q': 0}}
+
+
+def test_net_dev_reads_bytes_packets_and_drops():
+    devices = parse_net_dev(NET_DEV, {'br-0123456789ab', 'vethaaa'})
+    assert devices['br-0123456789ab'] == {'rx_bytes': 5000, 'rx_packets': 50, 'rx_drop': 1,
+                                          'tx_bytes': 6000, 'tx_packets': 60, 'tx_drop': 2}
+    assert 'lo' not in devices
+
+
+def test_softnet_sums_every_cpu():
+    text = ('0000333c 00000002 00000010 00000000\n'
+            '00001000 00000001 00000001 00000000\n')
+    assert parse_softnet(text) == {'dropped': 3, 'squeezed': 17}
+
+
+def test_network_is_the_bridge_and_its_members(tmp_path):
+    sys_root = tmp_path / 'sys'
+    (sys_root / 'br-0123456789ab' / 'brif' / 'vethaaa').mkdir(parents=True)
+    proc = tmp_path / 'proc'
+    (proc / 'net').mkdir(parents=True)
+    (proc / 'net' / 'dev').write_text(NET_DEV)
+    (proc / 'net' / 'softnet_stat').write_text('1 2 3\n')
+    assert bridge_members('br-0123456789ab', str(sys_root)) == ['br-0123456789ab', 'vethaaa']
+    devices, softnet = read_network('br-0123456789ab', str(proc), str(sys_root))
+    assert set(devices) == {'br-0123456789ab', 'vethaaa'}
+    assert softnet == {'dropped': 2, 'squeezed': 3}
+    assert read_network('br-missing', str(proc), str(sys_root))[0] == {}
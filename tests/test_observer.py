@@ -0,0 +1,48 @@
+'''Running the target's status commands without charging them to the target.
+
+The neighbor pollers run birdc, vtysh and the rest every sample. These pin that
+the commands keep their meaning on either path, and that on the exec path the
+CPU they used is counted so it can be taken back off the target's cgroup.
+'''
+import subprocess
+
+import base
+from observer import SENTINEL, accounted_argv, nsenter_argv, split_accounted
+
+
+def test_nsenter_splits_like_docker_exec():
+    '''Junos escapes its pipes for the CLI, not for a shell.'''
+    argv = nsenter_argv(1234, r"cli show bgp neighbor \| no-more \| display json")
+    assert argv[:3] == ['nsenter', '-t', '1234']
+    assert argv[argv.index('--') + 1:] == ['cli', 'show', 'bgp', 'neighbor', '|', 'no-more',
+                                           '|', 'display', 'json']
+
+
+def test_accounted_run_returns_the_output_untouched():
+    for text in ("printf 'a\\nb\\n'", "printf 'no newline'"):
+        plain = subprocess.run(['sh', '-c', text], stdout=subprocess.PIPE).stdout
+        wrapped = subprocess.run(accounted_argv(text), stdout=subprocess.PIPE).stdout
+        output, ticks = split_accounted(wrapped)
+        assert output == plain
+        assert ticks is not None
+
+
+def test_accounted_run_counts_the_command_cpu():
+    busy = "i=0; while [ $i -lt 200000 ]; do i=$((i+1)); done"
+    # in a child shell, so the loop is a waited-for child of the wrapper
+    wrapped = subprocess.run(accounted_argv("sh -c '{0}'".format(busy)), stdout=subprocess.PIPE).stdout
+    _, ticks = split_accounted(wrapped)
+    assert ticks > 0
+
+
+def test_missing_accounting_leaves_the_output_alone():
+    assert split_accounted(b'{"peers": {}}') == (b'{"peers": {}}', None)
+
+
+def test_exec_observer_strips_and_counts():
+    target = base.Container.__new__(base.Container)
+    target.observer = 'exec'
+    stat = b'42 (sh) S 1 42 42 0 -1 4194560 1 2 0 0 0 0 7 3 20 0 1 0 1 1 1'
+    target.local = lambda argv: b'show output\n' + SENTINEL + b'\n' + stat
+    assert target.observe('birdc show protocols') == b'show output'
+    assert target.observer_cpu_usec == 10 * 1_000_000 // base.CLOCK_TICKS
@@ -6,24 +6,27 @@ stated historical pain of this project. Parsing against recorded output catches
 a format change in a second instead of after a benchmark silently reports zero.
 
 Targets are built with object.__new__ so no container is created; the only
-things these methods touch are self.local() and the TextFSM template.
+things these methods touch are self.observe() and the TextFSM template.
 '''
 import json
 
 import pytest
 
+from conftest import FIXTURES
 from bird import BIRDTarget
-from frr import FRRoutingTarget
+from frr import FRRoutingTarget, eor_states
 
 
 def build(target_class, output):
-    '''A target whose local() returns recorded CLI output.'''
+    '''A target whose observe() returns recorded CLI output.'''
     target = object.__new__(target_class)
-    target.local = lambda cmd, **kwargs: output
+    target.observe = lambda cmd: output
+    # no BIRD control socket in here, so BIRD takes the birdc path
+    target.host_dir = str(FIXTURES / 'no-such-dir')
     return target
 
 
-# --- BIRD: 'birdc show protocols all', parsed with bird.tfsm -----------------
+# --- BIRD: 'birdc show protocols all', parsed by birdctl.neighbor_counts() ---
 
 def test_bird_parses_recorded_output(fixture_text):
     target = build(BIRDTarget, fixture_text('bird_show_protocols_all.txt').encode('utf-8'))
@@ -93,3 +96,76 @@ def test_frr_handles_summary_without_ipv4_unicast():
     target = build(FRRoutingTarget, json.dumps({}).encode('utf-8'))
     received, accepted = target.get_neighbors_state()
     assert accepted == {}
+
+
+# --- FRR End-of-RIB: 'vtysh -c "show bgp neighbors <peer> json"', one per peer --
+
+def frr_neighbor(addr, state='Established', received=None):
+    info = {'bgpState': state}
+    if received is not None:
+        # where bgpd puts it: a map of families under gracefulRestartInfo and a
+        # flag under each family
+        info['gracefulRestartInfo'] = {
+            'endOfRibSend': {'ipv4Unicast': True},
+            'endOfRibRecv': {'ipv4Unicast': True} if received else {},
+            'ipv4Unicast': {'endOfRibStatus': {'endOfRibSend': True,
+                                               'endOfRibRecv': received}},
+        }
+    return json.dumps({addr: info}, indent=2)
+
+
+def test_frr_eor_states_from_concatenated_documents():
+    text = '\n'.join([frr_neighbor('10.10.0.3', received=True),
+                      frr_neighbor('10.10.0.4', received=False),
+                      frr_neighbor('10.10.0.5', state='Active')])
+    assert eor_states(text) == {'10.10.0.3': True, '10.10.0.4': False, '10.10.0.5': False}
+
+
+def test_frr_eor_unknown_when_established_peer_reports_none():
+    assert eor_states(frr_neighbor('10.10.0.3')) == {'10.10.0.3': None}
+
+
+def test_frr_eor_ignores_non_json_output():
+    assert eor_states('% BGP instance not found\n') == {}
+
+
+def test_frr_eor_asks_only_about_peers_still_loading():
+    target = object.__new__(FRRoutingTarget)
+    asked = []
+
+    def observe(cmd):
+        asked.append([c for c in cmd if c.startswith('show')])
+        return frr_neighbor('10.10.0.3', received=True).encode('utf-8')
+    target.observe = observe
+
+    neighbors = {'10.10.0.3': False, '10.10.0.4': False}
+    assert target._get_EOR_from_json(dict(neighbors), {}) == {'10.10.0.3': True, '10.10.0.4': False}
+    target._get_EOR_from_json(dict(neighbors), {})
+    assert asked[1] == ['show bgp neighbors 10.10.0.4 json']
+
+
+def test_frr_eor_peer_without_state_waits_for_its_check_point():
+    target = object.__new__(FRRoutingTarget)
+    asked = []
+    target.observe = lambda cmd: asked.append(cmd) or frr_neighbor('10.10.0.3').encode('utf-8')
+    neighbors = {'10.10.0.3': False}
+    # a count that holds still is a pause, not an End-of-RIB
+    for _ in range(10):
+        assert target._get_EOR_from_json(dict(neighbors), {'10.10.0.3': False}) == \
+            {'10.10.0.3': False}
+    assert target._get_EOR_from_json(dict(neighbors), {'10.10.0.3': True}) == {'10.10.0.3': True}
+    # bgpd had nothing to say about it, so it was asked once
+    assert len(asked) == 1
+
+
+def test_frr_eor_method_is_chosen_from_the_monitor_session():
+    def choose(output):
+        target = object.__new__(FRRoutingTarget)
+        target.observe = lambda cmd: output.encode('utf-8')
+        target.local = lambda cmd: target.__dict__.setdefault('enabled', cmd)
+        return target.choose_eor_method('10.10.0.2'), 'enabled' in target.__dict__
+
+    assert choose(frr_neighbor('10.10.0.2', received=False)) == ('json', False)
+    assert choose(frr_neighbor('10.10.0.2')) == ('log', True)
+    # bgpd not answering says nothing either way
+    assert choose('% BGP instance not found\n') == ('json', False)
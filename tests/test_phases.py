@@ -0,0 +1,67 @@
+'''Tests for phases.py, the Chrome trace of where a run's time goes.
+
+The trace is only useful if Perfetto opens it and the spans line up, so these
+pin the event format and the bookkeeping rather than any timings.
+'''
+import json
+import threading
+
+from phases import PhaseTrace
+
+
+def test_span_is_a_complete_event_in_microseconds():
+    trace = PhaseTrace()
+    with trace.span('monitor start', container='bgperf_monitor'):
+        pass
+    event = trace.to_json()['traceEvents'][-1]
+    assert event['ph'] == 'X'
+    assert event['name'] == 'monitor start'
+    assert event['cat'] == 'phase'
+    assert event['ts'] >= 0 and event['dur'] >= 0
+    assert event['args'] == {'container': 'bgperf_monitor'}
+
+
+def test_begin_and_end_pair_by_name():
+    trace = PhaseTrace()
+    trace.begin('convergence')
+    trace.end('convergence', failed=False)
+    # ending a phase that was never begun is not an error
+    trace.end('graphs')
+    assert [e['name'] for e in trace.events] == ['convergence']
+    assert trace.events[0]['args'] == {'failed': False}
+
+
+def test_threads_are_named():
+    trace = PhaseTrace()
+    t = threading.Thread(target=lambda: trace.record('ip', 'exec', 0, 1), name='sampler')
+    t.start()
+    t.join()
+    meta = [e for e in trace.to_json()['traceEvents'] if e['ph'] == 'M']
+    assert {'name': 'sampler'} in [e['args'] for e in meta if e['name'] == 'thread_name']
+
+
+def test_reset_starts_a_new_trace():
+    trace = PhaseTrace()
+    with trace.span('cleanup'):
+        pass
+    trace.reset()
+    assert trace.events == []
+    assert trace.durations() == {}
+
+
+def test_durations_sum_per_phase():
+    trace = PhaseTrace()
+    trace.record('launch', 'launch', trace.origin, trace.origin + 2_000_000_000)
+    trace.record('launch', 'launch', trace.origin, trace.origin + 500_000_000)
+    trace.record('network', 'phase', trace.origin, trace.origin + 1_000_000)
+    assert trace.durations('launch') == {'launch': 2.5}
+    assert trace.durations() == {'network': 0.001}
+
+
+def test_written_file_is_json(tmp_path):
+    trace = PhaseTrace()
+    with trace.span('outputs'):
+        pass
+    path = trace.write(str(tmp_path / 'run.trace.json'))
+    with open(path) as f:
+        assert json.load(f)['displayTimeUnit'] == 'ms'
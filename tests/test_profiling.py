@@ -0,0 +1,82 @@
+'''Tests for the stack folding and flamegraphs in profiling.py.
+
+`profile-diff` is meant to say why a version regressed, so a stack folded in
+the wrong order, or a diff that compares sample counts rather than shares,
+would point at the wrong function. The perf script text here is in the format
+`perf script` prints for `perf record -g`.
+'''
+from collections import Counter
+
+import pytest
+
+from profiling import (diff_table, flamegraph_svg, fold_perf_script, frame_shares,
+                       perf_record_cmd, perf_script_cmd, read_folded, write_folded)
+
+PERF_SCRIPT = '''\
+bgpd    17/17  1000.000001:   10101010 cpu-clock:pppH:
+\t    55d0c0a1b2c3 bgp_process_packet+0x1a3 (/usr/lib/frr/bgpd)
+\t    55d0c0a1b000 bgp_io_read+0x20 (/usr/lib/frr/bgpd)
+\t    7f0000001000 thread_call+0x80 (/usr/lib/frr/libfrr.so.0.0.0)
+
+bgpd    17/21  1000.010001:   10101010 cpu-clock:pppH:
+\t    7f0000002000 [unknown] (/usr/lib/x86_64-linux-gnu/libc.so.6)
+\t    55d0c0a1b000 bgp_io_read+0x44 (/usr/lib/frr/bgpd)
+\t    7f0000001000 thread_call+0x80 (/usr/lib/frr/libfrr.so.0.0.0)
+
+bgpd    17/17  1000.020001:   10101010 cpu-clock:pppH:
+\t    55d0c0a1b2c3 bgp_process_packet+0x1b0 (/usr/lib/frr/bgpd)
+\t    55d0c0a1b000 bgp_io_read+0x20 (/usr/lib/frr/bgpd)
+\t    7f0000001000 thread_call+0x80 (/usr/lib/frr/libfrr.so.0.0.0)
+'''
+
+
+def test_perf_record_attaches_to_every_pid():
+    assert perf_record_cmd(['17', '21'], 'x.data') == \
+        ['perf', 'record', '-F', '99', '-g', '-k', 'CLOCK_MONOTONIC', '-p', '17,21', '-o', 'x.data']
+
+
+def test_script_stops_where_the_count_stopped_moving():
+    '''The assurance samples come after convergence, not as part of it.'''
+    assert perf_script_cmd('x.data') == ['perf', 'script', '-i', 'x.data']
+    assert perf_script_cmd('x.data', until=1234_500_000_000) == \
+        ['perf', 'script', '-i', 'x.data', '--time', ',1234.500000']
+
+
+def test_stacks_fold_outermost_first_without_offsets():
+    assert fold_perf_script(PERF_SCRIPT) == Counter({
+        'bgpd;thread_call;bgp_io_read;bgp_process_packet': 2,
+        'bgpd;thread_call;bgp_io_read;[libc.so.6]': 1,
+    })
+
+
+def test_folded_round_trip(tmp_path):
+    folded = fold_perf_script(PERF_SCRIPT)
+    assert read_folded(write_folded(folded, str(tmp_path / 'x.folded'))) == folded
+
+
+def test_shares_are_inclusive_and_self():
+    inclusive, own = frame_shares(fold_perf_script(PERF_SCRIPT))
+    assert inclusive[('bgpd', 'thread_call')] == 1.0
+    assert own['bgp_process_packet'] == pytest.approx(2 / 3)
+
+
+def test_diff_compares_shares_not_samples():
+    before = Counter({'bgpd;a': 50, 'bgpd;b': 50})
+    # twice as long a run, same profile: nothing moved
+    assert all(a == b for _, a, b in diff_table(before, Counter({'bgpd;a': 100, 'bgpd;b': 100})))
+    rows = diff_table(before, Counter({'bgpd;a': 90, 'bgpd;b': 10}))
+    assert [(name, round(a), round(b)) for name, a, b in rows] == [('a', 50, 90), ('b', 50, 10)]
+
+
+def test_flamegraph_draws_every_frame_with_its_share():
+    svg = flamegraph_svg(fold_perf_script(PERF_SCRIPT), 'frr <9.1>')
+    assert svg.count('<rect') == 1 + 5
+    assert 'bgp_process_packet (2 samples, 66.67%)' in svg
+    assert 'frr &lt;9.1&gt;' in svg
+
+
+def test_differential_flamegraph_marks_growth_red():
+    svg = flamegraph_svg(Counter({'bgpd;a': 90, 'bgpd;b': 10}), 'diff',
+                         baseline=Counter({'bgpd;a': 50, 'bgpd;b': 50}))
+    assert 'a (90 samples, 90.00%), +40.00 points' in svg
+    assert 'fill="rgb(255,0,0)"' in svg and 'fill="rgb(0,0,255)"' in svg
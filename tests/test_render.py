@@ -0,0 +1,77 @@
+'''Tests for render.py, which draws bgperf2's graphs away from bench().
+
+The point of the module is what it does not do: block the measuring loop, or
+redraw a batch chart whose numbers have not changed. Both are cheap to break
+without noticing, since the graphs still appear either way.
+'''
+import os
+import time
+
+import numpy as np
+
+from render import GraphWorker, digest, render_jobs
+
+
+def series(path, y):
+    return ('series', {'path': str(path), 'x': np.arange(len(y), dtype='f8'),
+                       'y': np.asarray(y, dtype='f8'), 'ylabel': '%cpu'})
+
+
+def bars(path, value):
+    return ('bars', {'path': str(path), 'title': 'elapsed', 'labels': ['bird'],
+                     'data': {'10n_100p': [value]}, 'ylabel': 'seconds'})
+
+
+def test_digest_follows_array_contents():
+    assert digest(series('a.png', [1, 2])) == digest(series('a.png', [1, 2]))
+    assert digest(series('a.png', [1, 2])) != digest(series('a.png', [1, 3]))
+
+
+def test_render_jobs_draws_every_job(tmp_path):
+    jobs = [series(tmp_path / 'cpu.png', [1, 2, 3]), bars(tmp_path / 'elapsed.png', 4.2)]
+    assert render_jobs(jobs, processes=1) == [str(tmp_path / 'cpu.png'),
+                                              str(tmp_path / 'elapsed.png')]
+    assert (tmp_path / 'cpu.png').stat().st_size > 0
+    assert (tmp_path / 'elapsed.png').stat().st_size > 0
+
+
+def test_render_jobs_skips_graphs_whose_inputs_did_not_change(tmp_path):
+    first = [bars(tmp_path / 'a.png', 1.0), bars(tmp_path / 'b.png', 2.0)]
+    assert len(render_jobs(first, results_dir=str(tmp_path), processes=1)) == 2
+    second = [bars(tmp_path / 'a.png', 1.0), bars(tmp_path / 'b.png', 2.5)]
+    assert render_jobs(second, results_dir=str(tmp_path), processes=1) == [str(tmp_path / 'b.png')]
+
+
+def test_render_jobs_redraws_a_deleted_graph(tmp_path):
+    jobs = [bars(tmp_path / 'a.png', 1.0)]
+    render_jobs(jobs, results_dir=str(tmp_path), processes=1)
+    os.unlink(tmp_path / 'a.png')
+    assert render_jobs(jobs, results_dir=str(tmp_path), processes=1) == [str(tmp_path / 'a.png')]
+
+
+def test_graph_worker_does_not_wait_for_the_render(tmp_path):
+    worker = GraphWorker()
+    try:
+        started = time.monotonic()
+        assert worker.submit([series(tmp_path / 'cpu.png', np.arange(1000))])
+        # the worker process is still starting; the caller is long gone
+        assert time.monotonic() - started < 0.5
+        # and a second snapshot while the first draws is dropped, not queued
+        assert not worker.submit([series(tmp_path / 'cpu.png', np.arange(10))])
+    finally:
+        worker.close()
+    assert (tmp_path / 'cpu.png').stat().st_size > 0
+
+
+def test_a_started_worker_is_ready_before_the_first_redraw(tmp_path):
+    '''bench() pays for the worker's start-up before its clock starts.'''
+    worker = GraphWorker()
+    try:
+        worker.start()
+        started = time.monotonic()
+        assert worker.submit([series(tmp_path / 'cpu.png', [1, 2])])
+        worker._pending.result()
+        assert time.monotonic() - started < 5
+    finally:
+        worker.close()
+    assert (tmp_path / 'cpu.png').stat().st_size > 0
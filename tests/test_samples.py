@@ -0,0 +1,290 @@
+'''The sample archive, and the summary every stats row is derived from.
+
+summarize() is the only place max cpu %, min idle% and the rest are computed,
+live at the end of a run and offline by `recompute`, so these pin that both
+give the same answer and that the assurance window is left out of it.
+'''
+from argparse import Namespace
+
+import numpy as np
+import pytest
+
+import bgperf2
+from samples import (SAMPLE_INTERVALS, RunSamples, SampleSeries,
+                     parse_sample_intervals, summarize)
+
+
+def run(elapsed=10.0):
+    s = RunSamples({'required': 990, 'recved': 1000, 'monitor_wait_time': 3,
+                    'cores': 32, 'memory': 64 * 2**30, 'total_time': 30.0,
+                    'tester_errors': 0, 'tester_timeouts': 0, 'elapsed': elapsed})
+    roles = {'target': 'target', 'tester0': 'tester', 'tester1': 'tester', 'mon': 'monitor'}
+    for t in range(30):
+        # the target is busiest at t=5 and much busier again after convergence
+        cpu = 350.0 if t == 5 else (900.0 if t > 20 else 100.0)
+        s.record_target(t + 0.5, cpu, 2**30 * (t + 1))
+        s.record_host(t + 0.5, idle=90 - t, free=2**34 - t, psi_cpu=t / 10.0)
+        s.record_containers(t + 0.5, {
+            'tester0': {'cpu': 80.0, 'mem': 1, 'io_read': 0, 'io_write': 0},
+            'tester1': {'cpu': 70.0, 'mem': 1, 'io_read': 0, 'io_write': 0},
+            'mon': {'cpu': 2.0, 'mem': 1, 'io_read': 0, 'io_write': 0},
+        }, roles)
+        s.record_threads(t + 0.5, {'101': ('bird', 100.0), '102': ('worker', 100.0)})
+        s.record_tick(t + 0.6, cpu, 2**30, 0 if t < 3 else 1000, 10, 90 - t, 2**34)
+        s.record_harness(t + 0.7, 20.0 + t, 2**27 + t, 2**27, {
+            'MainThread': 10.0, 'neighbor-stats': 5.0 if t == 2 else 8.0, 'host-stats': 1.0})
+        s.record_latency(t + 0.6, 'monitor', 0.001 * (t + 1))
+    return s
+
+
+def test_series_grows_past_its_capacity():
+    s = SampleSeries((('t', 'f8'), ('v', 'i8')), capacity=2)
+    for i in range(100):
+        s.append(i, i * 2)
+    assert len(s) == 100
+    assert s['v'][-1] == 198
+
+
+def test_none_is_stored_as_nan():
+    s = SampleSeries((('t', 'f8'), ('v', 'f4')))
+    s.append(1.0, None)
+    assert np.isnan(s['v'][0])
+
+
+def test_assurance_window_is_left_out_of_the_extremes():
+    '''The TODO this replaces: max/min used to include the trimmed samples.'''
+    stats = summarize(run(elapsed=10.0))
+    assert stats['max_cpu'] == pytest.approx(350.0)
+    assert stats['min_idle'] == pytest.approx(81.0)
+    assert stats['max_psi_cpu'] == pytest.approx(0.9)
+    assert stats['elapsed'] == 10.0
+
+
+def test_everything_counts_without_an_end():
+    stats = summarize(run(elapsed=None))
+    assert stats['max_cpu'] == pytest.approx(900.0)
+
+
+def test_testers_are_summed_per_tick():
+    stats = summarize(run())
+    assert stats['max_tester_cpu'] == pytest.approx(150.0)
+    assert stats['max_monitor_cpu'] == pytest.approx(2.0)
+
+
+def test_parallelism_comes_from_the_thread_samples():
+    assert summarize(run())['parallelism'].effective_threads == pytest.approx(2.0)
+
+
+def test_first_received_is_the_first_tick_with_routes():
+    assert summarize(run())['first_received_time'] == pytest.approx(3.6)
+
+
+def test_missing_sources_keep_their_old_defaults():
+    stats = summarize(RunSamples({'elapsed': 5.0}))
+    assert stats['max_cpu'] == 0
+    assert stats['min_idle'] == 100
+    assert stats['max_psi_cpu'] is None
+    assert stats['max_tester_cpu'] == 0
+
+
+def test_harness_cost_comes_from_its_own_samples():
+    stats = summarize(run(elapsed=10.0))
+    assert stats['max_harness_cpu'] == pytest.approx(29.0)
+    assert stats['max_harness_rss'] == 2**27 + 9
+    assert stats['busiest_harness_thread'] == 'MainThread'
+    assert stats['max_harness_thread_cpu'] == pytest.approx(10.0)
+    assert stats['max_queue_latency'] == pytest.approx(0.010)
+    assert stats['p99_queue_latency'] <= stats['max_queue_latency']
+
+
+def test_missing_harness_samples_are_none():
+    stats = summarize(RunSamples({'elapsed': 5.0}))
+    assert stats['max_harness_cpu'] is None
+    assert stats['busiest_harness_thread'] is None
+    assert stats['max_queue_latency'] is None
+
+
+def test_an_archive_from_before_a_source_existed_still_loads(tmp_path):
+    path = str(tmp_path / 'old.samples.npz')
+    run().save(path)
+    with np.load(path) as archive:
+        old = {k: archive[k] for k in archive.files
+               if not k.startswith(('harness', 'latency', 'sampler_names'))}
+    np.savez_compressed(path, **old)
+    loaded = RunSamples.load(path)
+    assert len(loaded['harness']) == 0
+    assert summarize(loaded)['max_cpu'] == pytest.approx(350.0)
+
+
+def test_memory_breakdown_maxima():
+    s = RunSamples({'elapsed': 2.0})
+    s.record_target_memory(1.0, anon=100, file=900, kernel=10, sock=1, peak=1500)
+    s.record_target_memory(2.0, anon=300, file=100, kernel=20, sock=0, peak=1600)
+    s.record_target_memory(3.0, anon=999, file=999, kernel=99, sock=9, peak=9999)
+    stats = summarize(s)
+    assert (stats['max_mem_anon'], stats['max_mem_file'], stats['peak_mem']) == (300, 900, 1600)
+    assert summarize(RunSamples({'elapsed': 2.0}))['max_mem_anon'] is None
+
+
+def test_network_counters_count_growth_over_the_run():
+    s = RunSamples({'elapsed': 10.0})
+    for t, (recv_q, retrans, drop) in enumerate([(0, 1, 5), (100, 1, 5), (200, 3, 6),
+                                                 (0, 3, 6), (0, 1, 8)]):
+        s.record_network(float(t), {'10.10.0.3': {'recv_q': recv_q, 'send_q': 0, 'rtt': 1e-4,
+                                                  'retrans': retrans, 'rwnd': 65535}},
+                         {'vethaaa': {'rx_bytes': 0, 'rx_packets': 0, 'rx_drop': drop,
+                                      'tx_bytes': 0, 'tx_packets': 0, 'tx_drop': 0}},
+                         {'dropped': 10 + t, 'squeezed': 0})
+    stats = summarize(s)
+    assert stats['max_recv_q'] == 200
+    # Recv-Q held data from t=1 to t=2
+    assert stats['recv_q_backlog'] == pytest.approx(1.0)
+    # 1 -> 3, then a reconnect counted from zero: 2 + 1
+    assert stats['tcp_retransmits'] == 3
+    assert stats['bridge_drops'] == 3
+    assert stats['softnet_drops'] == 4
+
+
+def test_queues_without_ss_leave_retransmits_blank():
+    s = RunSamples({'elapsed': 10.0})
+    s.record_network(1.0, {'10.10.0.3': {'recv_q': 5, 'send_q': 0}}, {}, {})
+    stats = summarize(s)
+    assert stats['max_recv_q'] == 5
+    assert stats['tcp_retransmits'] is None
+    assert stats['bridge_drops'] is None
+
+
+def test_convergence_shape_from_the_monitor_and_the_target():
+    s = RunSamples({'required': 990, 'expected': 1000, 'elapsed': 4.0})
+    for t, (recved, accepted) in enumerate([(0, 0), (0, 400), (500, 1000), (1000, 1000),
+                                            (1000, 1000)]):
+        s.record_tick(float(t), 0.0, 0, recved, 1, 90, 2**34)
+        s.record_target_accepted(float(t), accepted)
+    stats = summarize(s)
+    assert stats['t50'] == pytest.approx(2.0)
+    assert stats['t100'] == pytest.approx(3.0)
+    assert (stats['peak_monitor_rate'], stats['mean_monitor_rate']) == (500, 500)
+    assert (stats['peak_target_rate'], stats['mean_target_rate']) == (600, 500)
+    assert summarize(run())['peak_target_rate'] is None
+
+
+def test_convergence_shape_is_against_every_prefix_sent():
+    '''t100 is all of them, not the check-point scaled down to 99%.'''
+    def shape(meta):
+        s = RunSamples(dict(meta, elapsed=3.0))
+        for t, recved in enumerate([0, 990, 995, 1000]):
+            s.record_tick(float(t), 0.0, 0, recved, 1, 90, 2**34)
+        return summarize(s)
+    assert shape({'required': 990, 'expected': 1000})['t100'] == pytest.approx(3.0)
+    # MRT: no expected total, so the converged count is the whole table
+    assert shape({'required': 930, 'recved': 995})['t100'] == pytest.approx(2.0)
+    assert shape({'required': 930, 'recved': 995, 'fail': True})['t100'] is None
+
+
+def test_expected_prefixes_is_unscaled():
+    conf = {'testers': [{'type': 'bird', 'neighbors': {'a': {'count': 100}, 'b': {'count': 100}}},
+                        {'type': 'canary', 'neighbors': {'c': {'count': 0}}}]}
+    assert bgperf2.expected_prefixes(conf) == 200
+    assert bgperf2.expected_prefixes({'testers': [{'type': 'mrt', 'neighbors': {}}]}) is None
+
+
+def test_canary_latency_covers_markers_sent_while_converging():
+    s = RunSamples({'elapsed': 10.0})
+    for t, latency in enumerate([0.002, 0.004, None, 0.5, 0.003]):
+        s.record_canary(2.0 * t + 1, latency)
+    s.record_canary(11.0, 9.0)
+    stats = summarize(s)
+    assert stats['canary_p50'] == pytest.approx(0.0035)
+    assert stats['canary_max'] == pytest.approx(0.5)
+    assert stats['canaries_lost'] == 1
+    assert summarize(run())['canaries_lost'] is None
+
+
+def test_cpu_seconds_run_from_the_first_prefix_to_the_end():
+    s = RunSamples({'elapsed': 6.0, 'first_received': 2.5, 'updates': 400, 'recved': 900})
+    for t in range(10):
+        # one core of user time and a quarter of system, every second
+        s.record_target_cpu(float(t), 100.0 + t, 10.0 + t / 4)
+        s.record_target_accepted(float(t), min(t * 300, 1000))
+    stats = summarize(s)
+    assert stats['cpu_user'] == pytest.approx(3.5)
+    assert stats['cpu_system'] == pytest.approx(0.875)
+    # per prefix the target accepted, not the monitor's count
+    assert stats['cpu_per_prefix'] == pytest.approx(4.375 / 1000)
+    assert stats['cpu_per_update'] == pytest.approx(4.375 / 400)
+
+
+def test_no_cgroup_means_no_cpu_seconds():
+    stats = summarize(run())
+    assert stats['cpu_user'] is None
+    assert stats['cpu_per_prefix'] is None
+
+
+def test_names_are_indexed_once_each(tmp_path):
+    stat = {'cpu': 1.0, 'mem': 1, 'io_read': 0, 'io_write': 0}
+    s = RunSamples()
+    for _ in range(3):
+        s.record_containers(0.0, {'target': stat, 'tester1': stat},
+                            {'target': 'target', 'tester1': 'tester'})
+    assert s.container_names == ['target', 'tester1']
+    assert s.container_roles == ['target', 'tester']
+    assert list(s['containers']['container']) == [0, 1] * 3
+    # a loaded archive keeps its indexes, and new names go after them
+    loaded = RunSamples.load(s.save(str(tmp_path / 'x.samples.npz')))
+    loaded.record_containers(1.0, {'tester2': stat, 'target': stat},
+                             {'tester2': 'tester', 'target': 'target'})
+    assert loaded.container_names == ['target', 'tester1', 'tester2']
+    assert loaded.container_roles == ['target', 'tester', 'tester']
+    assert list(loaded['containers']['container'][-2:]) == [2, 0]
+
+
+def test_archive_round_trip(tmp_path):
+    samples = run()
+    path = samples.save(str(tmp_path / 'x.samples.npz'))
+    loaded = RunSamples.load(path)
+    assert loaded.meta == samples.meta
+    assert loaded.container_roles == samples.container_roles
+    assert loaded.sampler_names == samples.sampler_names
+    a, b = summarize(samples), summarize(loaded)
+    for key in ('max_cpu', 'max_mem', 'min_idle', 'min_free', 'max_tester_cpu', 'elapsed',
+                'max_harness_cpu', 'busiest_harness_thread', 'max_queue_latency'):
+        assert a[key] == b[key]
+
+
+def test_recompute_matches_the_live_row(tmp_path, capsys):
+    samples = run()
+    args = Namespace(target='bird', label=None, version=None, neighbor_num=10, prefix_num=100,
+                     single_table=False, filter_test=None, tester_type='bird')
+    samples.meta.update({'date': '2026-01-02', 'fail': False, 'target_version': '2.19.2',
+                         'provenance': {}, 'args': vars(args)})
+    live = bgperf2.create_output_stats(args, '2.19.2', summarize(samples), False, {})
+    path = samples.save(str(tmp_path / 'x.samples.npz'))
+
+    out = str(tmp_path / 'out.csv')
+    bgperf2.recompute(Namespace(archives=[path], output=out))
+    with open(out) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == bgperf2.stats_header()
+    assert lines[1] == ','.join(map(str, live))
+    assert '2026-01-02' in lines[1]
+
+
+def test_sample_intervals_default_per_source():
+    assert parse_sample_intervals(None) == SAMPLE_INTERVALS
+
+
+def test_a_bare_interval_sets_every_source_and_pairs_override_it():
+    intervals = parse_sample_intervals('monitor=0.1,0.5')
+    assert intervals['monitor'] == 0.1
+    assert all(v == 0.5 for k, v in intervals.items() if k != 'monitor')
+
+
+def test_batch_yaml_intervals_are_numbers_or_mappings():
+    assert parse_sample_intervals(0.2)['host'] == 0.2
+    assert parse_sample_intervals({'threads': 0.25})['threads'] == 0.25
+
+
+@pytest.mark.parametrize('text', ['0.05', 'monitor=0', 'disk=1', 'fast'])
+def test_bad_sample_intervals_are_refused(text):
+    with pytest.raises(ValueError):
+        parse_sample_intervals(text)
@@ -0,0 +1,69 @@
+'''Tests for bgperf2's accounting of its own cost, in selfstats.py.
+
+The harness columns exist to tell "the target was slow" from "bgperf2 was
+slow", so they have to name the right thread and count the right process
+tree. The sampler is run against this test process itself.
+'''
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+import pytest
+
+from selfstats import HarnessSampler, by_thread_name, queue_source, tree_usage
+
+
+def test_threads_are_named_as_python_names_them():
+    percents = {'10': ('python3', 40.0), '11': ('python3', 5.0), '12': ('python3', 5.0),
+                '13': ('OpenBLAS', 1.0)}
+    names = {'10': 'MainThread', '11': 'monitor-stats', '12': 'monitor-stats'}
+    assert by_thread_name(percents, names) == {'MainThread': 40.0, 'monitor-stats': 10.0,
+                                               'OpenBLAS': 1.0}
+
+
+@pytest.mark.parametrize('info, source', [
+    ({'who': 'r1', 'cpu': 1}, 'target'),
+    ({'who': 'r1', 'neighbors_checked': {}}, 'neighbors'),
+    ({'who': 'mon', 'accepted': 0}, 'monitor'),
+    ({'who': 'controller', 'idle': 90}, 'host'),
+    ({'who': 'controller', 'foreign_cpu': 0}, 'foreign'),
+    ({'who': 'cgroups'}, 'cgroups'),
+])
+def test_queue_sources(info, source):
+    assert queue_source(info, {'r1': 'target', 'mon': 'monitor'}) == source
+
+
+def test_tree_includes_live_children():
+    own = tree_usage(psutil.Process())[1]
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(5)'])
+    try:
+        deadline = time.monotonic() + 5
+        while not psutil.Process().children() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert tree_usage(psutil.Process())[1] > own
+    finally:
+        child.kill()
+        child.wait()
+
+
+def test_sampler_charges_a_busy_thread_by_name():
+    sampler = HarnessSampler()
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            sum(range(1000))
+
+    t = threading.Thread(target=spin, name='busy-sampler')
+    t.start()
+    try:
+        time.sleep(0.3)
+        sample = sampler.sample()
+    finally:
+        stop.set()
+        t.join()
+    assert sample['threads']['busy-sampler'] > 10
+    assert sample['cpu'] >= sample['threads']['busy-sampler'] * 0.5
+    assert sample['rss'] > 0 and sample['peak'] > 0
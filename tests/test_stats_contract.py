@@ -3,6 +3,10 @@ position only. Nothing in the code enforces that they agree, and when they drift
 the failure is silent: the CSV mislabels its columns and the graphs plot the
 wrong series. These tests are the enforcement.
 '''
+import json
+
+import pytest
+
 import bgperf2
 
 
@@ -72,3 +76,111 @@ def test_label_overrides_name_but_not_target(bench_args, bench_stats):
     named = dict(zip(header_fields(), row))
     assert named['name'] == 'frr 8'
     assert named['target'] == 'bird'
+
+
+COUNTERS = {'voluntary_switches': 4100, 'involuntary_switches': 12, 'minor_faults': 250000,
+            'major_faults': 0, 'migrations': 31}
+
+# (stats key, value, column, expected). Every column here is blank while its
+# key is missing, so a row from a host that could not sample it does not read
+# as 0, and then shows the value rounded the way the row rounds it. A new
+# column adds a line here.
+COLUMNS = [
+    ('max_tester_cpu', 812.4, 'max tester cpu %', 812),
+    ('max_monitor_cpu', 3.6, 'max monitor cpu %', 4),
+    ('max_psi_cpu', 12.345, 'max cpu pressure %', 12.3),
+    ('max_psi_io', 0.0, 'max io pressure %', 0.0),
+    ('max_harness_cpu', 37.6, 'harness cpu %', 38),
+    ('max_harness_rss', 3 * 2**29, 'harness peak rss (GB)', 1.5),
+    ('busiest_harness_thread', 'neighbor-stats', 'busiest harness thread', 'neighbor-stats'),
+    ('max_harness_thread_cpu', 21.2, 'harness thread cpu %', 21),
+    ('p99_queue_latency', 0.0042, 'p99 queue latency (ms)', 4.2),
+    ('max_queue_latency', 0.25, 'max queue latency (ms)', 250.0),
+    ('counters', COUNTERS, 'voluntary switches', 4100),
+    ('counters', COUNTERS, 'major faults', 0),
+    ('counters', COUNTERS, 'cpu migrations', 31),
+    # only perf counts syscalls; /proc alone leaves it blank rather than 0
+    ('counters', COUNTERS, 'syscalls', ''),
+    ('max_recv_q', 212992.0, 'max recv-q (bytes)', 212992),
+    ('recv_q_backlog', 12.34, 'recv-q backlog (s)', 12.3),
+    ('tcp_retransmits', 7.0, 'tcp retransmits', 7),
+    ('bridge_drops', 0.0, 'bridge drops', 0),
+    ('softnet_drops', None, 'softnet drops', ''),
+    ('max_mem_anon', 2 * 2**30, 'max anon mem (GB)', 2.0),
+    ('max_mem_file', 2**29, 'max file mem (GB)', 0.5),
+    ('max_mem_kernel', None, 'max kernel mem (GB)', ''),
+    ('peak_mem', 3 * 2**30, 'peak mem (GB)', 3.0),
+    ('daemon_rss', 2**31, 'daemon rss (GB)', 2.0),
+    ('daemon_pss', 2**30, 'daemon pss (GB)', 1.0),
+    ('t50', 1.2345, 't50 (s)', 1.234),
+    ('t100', None, 't100 (s)', ''),
+    ('peak_monitor_rate', 1234.6, 'peak monitor rate (prefixes/s)', 1235),
+    ('mean_target_rate', None, 'mean target rate (prefixes/s)', ''),
+    ('canary_p50', 0.00123, 'canary p50 (ms)', 1.2),
+    ('canary_p99', 0.25, 'canary p99 (ms)', 250.0),
+    ('canary_max', 1.5, 'canary max (ms)', 1500.0),
+    ('canaries_lost', 0, 'canaries lost', 0),
+    ('cpu_user', 12.34567, 'cpu user (s)', 12.346),
+    ('cpu_system', 1.5, 'cpu system (s)', 1.5),
+    ('cpu_per_prefix', 1.2346e-5, 'cpu per prefix (us)', 12.35),
+    ('cpu_per_update', None, 'cpu per update (us)', ''),
+    ('convergence', 'evidence', 'convergence policy', 'evidence'),
+    ('decided', {'evidence': 12.3456}, 'evidence decided (s)', 12.346),
+    ('decided', {'evidence': 12.3456}, 'tracker decided (s)', ''),
+]
+
+
+@pytest.mark.parametrize('key,value,column,expected', COLUMNS,
+                         ids=['{0}-{1}'.format(c[0], c[2]) for c in COLUMNS])
+def test_column_is_blank_until_sampled(bench_args, bench_stats, key, value, column, expected):
+    def named():
+        return dict(zip(header_fields(), bgperf2.create_output_stats(bench_args, 'v1', bench_stats)))
+    assert named()[column] == ''
+    bench_stats[key] = value
+    assert named()[column] == expected
+
+
+def test_thread_columns(bench_args, bench_stats):
+    from threadstats import ParallelismTracker
+    named = dict(zip(header_fields(), bgperf2.create_output_stats(bench_args, 'v1', bench_stats)))
+    assert named['effective threads'] == ''
+
+    p = bench_stats['parallelism'] = ParallelismTracker()
+    p.update({'1': ('bird', 100.0), '2': ('bird', 50.0)})
+    named = dict(zip(header_fields(), bgperf2.create_output_stats(bench_args, 'v1', bench_stats)))
+    assert named['target threads'] == 2
+    assert named['effective threads'] == 1.5
+    assert named['parallel efficiency %'] == 75
+
+
+def test_named_batch_graphs_find_their_columns():
+    fields = header_fields()
+    assert fields[bgperf2.column_index('t99 (s)')] == 't99 (s)'
+    assert bgperf2.column_index('mean target rate (prefixes/s)') < fields.index('target image')
+
+
+def old_row():
+    '''A 29-field row, as written before the columns after 'max foreign cpu %'.'''
+    return (['frr', 'frr', '8.4', 10, 1000, 1000, 1000, 3, 42, 5, 40, 50, 250.0, 1.2, 10.0,
+              30.0, '', '2024-01-01', '32', '64', 0, 0, '', '', 'None', 7.5]
+            + ['img', 'tester 1', 'monitor 1'])
+
+
+def test_graphs_read_an_older_row_as_not_measured(monkeypatch, tmp_path):
+    jobs = []
+    monkeypatch.setattr(bgperf2, 'render_jobs', lambda batch, **kwargs: jobs.extend(batch))
+    bgperf2.create_batch_graphs([old_row()], 'old', results_dir=str(tmp_path))
+    graphs = {job[1]['title']: job[1]['data'] for job in jobs}
+    assert graphs['elapsed'] == {'10n_1000p_None': [42.0]}
+    assert graphs['t99'] == graphs['mean target rate'] == {'10n_1000p_None': [0]}
+    assert graphs['cpu per prefix'] == graphs['cpu per update'] == {'10n_1000p_None': [0]}
+
+
+def test_older_progress_cells_are_padded_to_the_row(tmp_path):
+    path = tmp_path / 'scale.progress.json'
+    path.write_text('{"schema_version": 1, "cells": {"a": %s}}' % json.dumps(old_row()))
+    stat = bgperf2.load_batch_progress(str(path))['a']
+    named = dict(zip(header_fields(), stat))
+    assert len(stat) == len(header_fields())
+    assert named['max foreign cpu %'] == 7.5 and named['t99 (s)'] == ''
+    assert (named['target image'], named['monitor version']) == ('img', 'monitor 1')
@@ -0,0 +1,98 @@
+'''The target's software counters, from /proc and from perf stat.
+
+These are what tell a daemon thrashing the scheduler or the allocator from one
+doing more work, so each has to be read from the right field and counted over
+the window only. /proc is laid out in tmp_path the way the kernel lays it out.
+'''
+from swcounters import (COUNTERS, SoftwareCounters, counter_delta, parse_perf_stat,
+                        perf_stat_cmd, read_proc_counters, running_processes)
+
+
+def stat_line(pid, minflt, majflt, starttime=5000):
+    # pid (comm) state ppid pgrp session tty tpgid flags minflt cminflt majflt
+    # ... num_threads itrealvalue starttime
+    fields = ['S', '1', '1', '1', '0', '-1', '4194560', str(minflt), '0', str(majflt), '0',
+              '10', '5', '0', '0', '20', '0', '1', '0', str(starttime)]
+    return '{0} (bgpd) {1}\n'.format(pid, ' '.join(fields))
+
+
+def make_proc(root, pid, minflt, majflt, threads):
+    d = root / str(pid)
+    (d / 'task').mkdir(parents=True)
+    (d / 'stat').write_text(stat_line(pid, minflt, majflt))
+    for tid, (voluntary, involuntary, migrations) in threads.items():
+        t = d / 'task' / str(tid)
+        t.mkdir()
+        (t / 'status').write_text('Name:\tbgpd\nvoluntary_ctxt_switches:\t{0}\n'
+                                  'nonvoluntary_ctxt_switches:\t{1}\n'.format(voluntary, involuntary))
+        if migrations is not None:
+            (t / 'sched').write_text('bgpd (17, #threads: 2)\n---\n'
+                                     'se.nr_migrations                             :'
+                                     '                    {0}\n'.format(migrations))
+
+
+def test_proc_counters_sum_every_thread(tmp_path):
+    make_proc(tmp_path, 17, 1000, 3, {17: (10, 2, 4), 21: (30, 1, 6)})
+    assert read_proc_counters(['17'], str(tmp_path)) == {
+        'voluntary_switches': 40, 'involuntary_switches': 3,
+        'minor_faults': 1000, 'major_faults': 3, 'migrations': 10}
+
+
+def test_migrations_are_missing_without_sched_debug(tmp_path):
+    make_proc(tmp_path, 17, 1, 0, {17: (1, 1, None)})
+    assert 'migrations' not in read_proc_counters(['17'], str(tmp_path))
+
+
+def test_a_gone_pid_is_skipped(tmp_path):
+    assert read_proc_counters(['99'], str(tmp_path))['minor_faults'] == 0
+
+
+def test_delta_counts_a_restart_from_zero():
+    assert counter_delta({'minor_faults': 100, 'major_faults': 5},
+                         {'minor_faults': 150, 'major_faults': 2, 'migrations': 1},
+                         restarted=True) == \
+        {'minor_faults': 50, 'major_faults': 2}
+
+
+def test_a_thread_exiting_is_not_a_restart():
+    '''Switches summed over live threads drop when one exits; reading that as
+    a restart would report the whole lifetime total as the window's.'''
+    assert counter_delta({'voluntary_switches': 9000, 'minor_faults': 100},
+                         {'voluntary_switches': 8500, 'minor_faults': 150}) == \
+        {'minor_faults': 50}
+
+
+def test_a_restart_on_the_same_pid_is_seen(tmp_path):
+    make_proc(tmp_path, 17, 1, 0, {17: (1, 1, None)})
+    before = running_processes(['17'], str(tmp_path))
+    assert running_processes(['17'], str(tmp_path)) == before
+    (tmp_path / '17' / 'stat').write_text(stat_line(17, 1, 0, starttime=9000))
+    assert running_processes(['17'], str(tmp_path)) != before
+
+
+def test_perf_stat_output_is_parsed():
+    text = ('# started on Sat Oct 17 10:00:00 2026\n\n'
+            '120034,,minor-faults,95012345,100.00,,\n'
+            '2,,major-faults,95012345,100.00,,\n'
+            '<not supported>,,cpu-migrations,0,100.00,,\n'
+            '8812345,,raw_syscalls:sys_enter,95012345,100.00,,\n')
+    assert parse_perf_stat(text) == {'minor_faults': 120034, 'major_faults': 2,
+                                     'syscalls': 8812345}
+
+
+def test_perf_stat_attaches_to_every_pid():
+    cmd = perf_stat_cmd(['17', '21'], 'out')
+    assert cmd[cmd.index('-p') + 1] == '17,21'
+
+
+def test_window_falls_back_to_proc(tmp_path):
+    make_proc(tmp_path, 17, 1000, 3, {17: (10, 2, 4)})
+    counters = SoftwareCounters(['17'], str(tmp_path / 'out'), proc_root=str(tmp_path),
+                                use_perf=False)
+    counters.start()
+    (tmp_path / '17' / 'stat').write_text(stat_line(17, 1500, 3))
+    counts, source = counters.stop()
+    assert source == 'proc'
+    assert counts['minor_faults'] == 500
+    assert 'syscalls' not in counts
+    assert set(counts) <= set(COUNTERS)
@@ -0,0 +1,110 @@
+'''Per-thread CPU of the target, and the parallelism figures drawn from it.
+
+These decide whether a `threads 4` row is reported as having used four cores
+or one, so the cases that matter are the ones that tell those apart: threads
+busy at the same time versus threads taking turns.
+'''
+import pytest
+
+from threadstats import (
+    ParallelismTracker,
+    daemon_pids,
+    sample_threads,
+    thread_percents,
+)
+
+
+def stat_line(tid, comm, utime, stime=0):
+    # pid (comm) state ppid ... flags(9) ... utime(14) stime(15)
+    fields = ['S', '1', '1', '1', '0', '-1', '4194560', '0', '0', '0', '0',
+              str(utime), str(stime), '0', '0', '20', '0', '1', '0']
+    return '{0} ({1}) {2}\n'.format(tid, comm, ' '.join(fields))
+
+
+def make_proc(tmp_path, pid, comm, threads):
+    d = tmp_path / str(pid)
+    (d / 'task').mkdir(parents=True)
+    (d / 'comm').write_text(comm + '\n')
+    for tid, (name, ticks) in threads.items():
+        (d / 'task' / str(tid)).mkdir()
+        (d / 'task' / str(tid) / 'stat').write_text(stat_line(tid, name, ticks))
+
+
+def test_only_the_daemon_is_picked_out(tmp_path):
+    make_proc(tmp_path, 10, 'bash', {10: ('bash', 0)})
+    make_proc(tmp_path, 11, 'bird', {11: ('bird', 0)})
+    assert daemon_pids(['10', '11', '12'], ('bird',), str(tmp_path)) == ['11']
+
+
+def test_threads_are_sampled_with_their_names(tmp_path):
+    make_proc(tmp_path, 11, 'bird', {11: ('bird', 100), 12: ('bird-worker', 250)})
+    sample = sample_threads(['11'], str(tmp_path))
+    assert sample == {'11': ('bird', 100), '12': ('bird-worker', 250)}
+
+
+def test_percent_of_one_core():
+    before = {'11': ('bird', 100), '12': ('worker', 0)}
+    after = {'11': ('bird', 150), '12': ('worker', 100)}
+    p = thread_percents(before, after, 1.0, clock_ticks=100)
+    assert p['11'] == ('bird', pytest.approx(50.0))
+    assert p['12'] == ('worker', pytest.approx(100.0))
+
+
+def test_reused_tid_is_charged_from_zero():
+    p = thread_percents({'12': ('old', 900)}, {'12': ('new', 30)}, 1.0, clock_ticks=100)
+    assert p['12'] == ('new', pytest.approx(30.0))
+
+
+def test_a_first_sample_is_only_a_baseline():
+    '''The daemon found late, or again after a restart: its threads' whole
+    lifetime must not land in one interval.'''
+    assert thread_percents({}, {'11': ('bird', 4000), '12': ('worker', 9000)}, 1.0,
+                           clock_ticks=100) == {}
+    p = thread_percents({'11': ('bird', 4000)}, {'11': ('bird', 4050), '12': ('worker', 30)},
+                        1.0, clock_ticks=100)
+    assert p == {'11': ('bird', pytest.approx(50.0)), '12': ('worker', pytest.approx(30.0))}
+
+
+def sample(*percents):
+    return {str(i): ('t', pct) for i, pct in enumerate(percents)}
+
+
+def test_four_threads_together_are_four_effective():
+    t = ParallelismTracker()
+    for _ in range(10):
+        t.update(sample(100, 100, 100, 100))
+    assert t.busy_threads == 4
+    assert t.effective_threads == pytest.approx(4.0)
+    assert t.efficiency == pytest.approx(100.0)
+
+
+def test_four_threads_taking_turns_are_one_effective():
+    '''All four show CPU over the run; only one ever ran at a time.'''
+    t = ParallelismTracker()
+    for turn in range(8):
+        percents = [0, 0, 0, 0]
+        percents[turn % 4] = 100
+        t.update(sample(*percents))
+    assert t.busy_threads == 4
+    assert t.effective_threads == pytest.approx(1.0)
+    assert t.efficiency == pytest.approx(25.0)
+
+
+def test_housekeeping_threads_do_not_count_as_workers():
+    t = ParallelismTracker()
+    for _ in range(10):
+        t.update(sample(100, 100, 0.1))
+    assert t.busy_threads == 2
+
+
+def test_idle_samples_do_not_move_the_ratio():
+    t = ParallelismTracker()
+    t.update(sample(100, 100))
+    for _ in range(50):
+        t.update(sample(1, 0))
+    assert t.effective_threads == pytest.approx(2.0)
+
+
+def test_nothing_sampled_is_none():
+    assert ParallelismTracker().effective_threads is None
+    assert ParallelismTracker().efficiency is None
@@ -0,0 +1,126 @@
+# Per-thread CPU of the target daemon, and how parallel its work really was.
+#
+# max cpu % is one number for the whole container. It cannot say whether BIRD 3
+# with `threads 4` kept four cores busy or ran four threads that took turns on
+# one, and that is the entire question the BIRD 2-vs-3 rows are asking. The
+# kernel accounts CPU per thread in /proc/<pid>/task/<tid>/stat, so sampling
+# those for the daemon's own PIDs answers it directly.
+#
+# "Effective threads" is total CPU over the busiest thread's CPU, per sample,
+# weighted by how much work the sample held. Four threads equally busy at the
+# same time read 4.0; the same four passing the work between them read 1.0,
+# even though all four show CPU over the run as a whole. Parallel efficiency
+# is that figure over the number of threads that did any real work.
+#
+# Kept free of Docker and privileges so the test suite can cover it.
+
+import os
+
+from contention import CLOCK_TICKS, parse_proc_stat
+
+# A thread has to account for at least this share of the daemon's CPU over the
+# run to count as a worker. Every daemon has housekeeping threads -- timers,
+# logging, the control socket -- that wake for microseconds, and counting them
+# would make a perfectly parallel run look inefficient.
+BUSY_SHARE = 0.01
+
+# Samples in which the daemon used less than this (% of one core) say nothing
+# about parallelism -- the ratio of two near-zero numbers is noise -- and are
+# left out of the effective-threads figure.
+IDLE_PERCENT = 5.0
+
+
+def daemon_pids(pids, names, proc_root='/proc'):
+    '''The PIDs among `pids` whose command is one of `names`.'''
+    found = []
+    for pid in pids:
+        try:
+            with open(os.path.join(proc_root, str(pid), 'comm')) as f:
+                comm = f.read().strip()
+        except OSError:
+            continue
+        if comm in names:
+            found.append(str(pid))
+    return found
+
+
+def sample_threads(pids, proc_root='/proc'):
+    '''{tid: (thread name, cpu_ticks)} for every thread of every PID given.'''
+    sample = {}
+    for pid in pids:
+        task_dir = os.path.join(proc_root, str(pid), 'task')
+        try:
+            tids = os.listdir(task_dir)
+        except OSError:
+            continue          # the daemon exited or restarted
+        for tid in tids:
+            try:
+                with open(os.path.join(task_dir, tid, 'stat')) as f:
+                    parsed = parse_proc_stat(f.read(), skip_kernel_threads=False)
+            except (OSError, UnicodeDecodeError):
+                continue
+            if parsed:
+                sample[tid] = (parsed[0], parsed[2])
+    return sample
+
+
+def thread_percents(previous, current, elapsed_seconds, clock_ticks=None):
+    '''{tid: (thread name, % of one core)} between two sample_threads().
+
+    A thread first seen in `current` is charged from zero: the daemon spawns
+    its workers at startup, and a worker created mid-run did all of its work
+    inside the interval. With no `previous` at all -- the daemon not found
+    yet, or found again after a restart -- there is nothing to measure from,
+    only a baseline, and nothing is returned: every thread's lifetime, startup
+    and all, would otherwise land in the one interval.
+    '''
+    if elapsed_seconds <= 0 or not previous:
+        return {}
+    ticks = clock_ticks or CLOCK_TICKS
+    out = {}
+    for tid, (comm, now_ticks) in current.items():
+        was = previous.get(tid)
+        delta = now_ticks - was[1] if was and was[0] == comm else now_ticks
+        out[tid] = (comm, max(delta, 0) / ticks / elapsed_seconds * 100.0)
+    return out
+
+
+class ParallelismTracker(object):
+    '''Accumulates thread_percents() samples into the run's parallelism figures.'''
+
+    def __init__(self, busy_share=BUSY_SHARE, idle_percent=IDLE_PERCENT):
+        self.busy_share = busy_share
+        self.idle_percent = idle_percent
+        self.per_thread = {}        # tid -> cumulative % x samples
+        self.total = 0.0            # sum over busy samples of total %
+        self.busiest = 0.0          # sum over busy samples of busiest thread %
+
+    def update(self, percents):
+        for tid, (_, pct) in percents.items():
+            self.per_thread[tid] = self.per_thread.get(tid, 0.0) + pct
+        values = [pct for _, pct in percents.values()]
+        total = sum(values)
+        if total >= self.idle_percent:
+            self.total += total
+            self.busiest += max(values)
+
+    @property
+    def busy_threads(self):
+        overall = sum(self.per_thread.values())
+        if overall <= 0:
+            return 0
+        return sum(1 for v in self.per_thread.values() if v >= overall * self.busy_share)
+
+    @property
+    def effective_threads(self):
+        if self.busiest <= 0:
+            return None
+        return self.total / self.busiest
+
+    @property
+    def efficiency(self):
+        '''Effective threads over busy threads, as a percentage.'''
+        effective = self.effective_threads
+        if effective is None or not self.busy_threads:
+            return None
+        return effective / self.busy_threads * 100.0